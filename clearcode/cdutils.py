@@ -326,19 +326,28 @@ def get_coordinates(data_dir):
             yield pth, Coordinate.from_path(cdpth)
 
 
-def _get_response_content(url, retries=2, wait=2, session=requests, verbose=False, _retries=set()):
+def _get_response_content(
+    url, retries=2, wait=2, session=requests, verbose=False, etag=None, _retries=set()
+):
     """
     Return a tuple of (etag, md5, content bytes) with the content as bytes or as decoded
     text if `as_text` is True) of the response of a GET HTTP request at `url`.
     On HTTP errors (500 or higher), retry up to `retries` time after waiting
     `wait` seconds.
+
+    If `etag` is provided, make a conditional request and return a tuple of
+    (etag, None, None) if the content is unchanged.
     """
     if verbose:
         click.echo("  --> Fetching: {url}".format(**locals()))
 
-    response = session.get(url, timeout=600)
+    headers = {"If-None-Match": etag} if etag else None
+    response = session.get(url, timeout=600, headers=headers)
     status_code = response.status_code
 
+    if status_code == requests.codes.not_modified:  # NOQA
+        return response.headers.get("etag") or etag, None, None
+
     if status_code == requests.codes.ok:  # NOQA
         # handle the case where the API returns an empty file and we need
         # to restart from an earlier continuation
@@ -368,7 +377,7 @@ def _get_response_content(url, retries=2, wait=2, session=requests, verbose=Fals
         _retries.add(url)
         time.sleep(wait)
         return _get_response_content(
-            url=url, retries=retries, wait=wait, session=session, verbose=verbose
+            url=url, retries=retries, wait=wait, session=session, verbose=verbose, etag=etag
         )
 
     # all other errors
@@ -377,14 +386,15 @@ def _get_response_content(url, retries=2, wait=2, session=requests, verbose=Fals
     )
 
 
-def get_response_content(url, retries=2, wait=4, session=requests, verbose=False):
+def get_response_content(url, retries=2, wait=4, session=requests, verbose=False, etag=None):
     """
     Return the bytes of the response of a GET HTTP request at `url`, an md5 checksum and the URL etag.
     On failures, retry up to `retries` time after waiting `wait` seconds.
+    If `etag` is provided, return None as content and checksum if the content is unchanged.
     """
     try:
         return _get_response_content(
-            url=url, retries=retries, wait=wait, session=session, verbose=verbose
+            url=url, retries=retries, wait=wait, session=session, verbose=verbose, etag=etag
         )
     except Exception as e:
         if retries:
@@ -401,7 +411,7 @@ def get_response_content(url, retries=2, wait=4, session=requests, verbose=False
             time.sleep(int(wait / (retries or 1)))
             retries -= 1
             return get_response_content(
-                url=url, retries=retries, wait=wait, session=session, verbose=verbose
+                url=url, retries=retries, wait=wait, session=session, verbose=verbose, etag=etag
             )
         else:
             raise
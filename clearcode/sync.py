@@ -19,15 +19,18 @@
 import gzip
 import json
 import os
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from multiprocessing import pool
 from os import path
 
 from django.utils import timezone
 
 import click
 import requests
+from requests.adapters import HTTPAdapter
 
 from clearcode import cdutils
 
@@ -54,8 +57,11 @@ From there we can fetch:
 
 Since the definition batches are roughly stopping after 2000 when sorted by
 latest date, we can repeat this every few minutes or so forever to catch any
-update. We use etags and a cache to avoid refetching things that have not
-changed.
+update. We use etags with conditional requests and a cache to avoid refetching
+things that have not changed.
+
+The harvests are fetched concurrently by threads sharing the same cache and
+the same pool of HTTP connections.
 """
 
 TRACE = False
@@ -81,8 +87,24 @@ known_types = (
 )
 
 
-# each process gets its own session
-session = requests.Session()
+# Maximum number of pooled HTTP connections to the ClearlyDefined API
+SESSION_POOL_SIZE = 32
+
+
+def get_session(pool_size=SESSION_POOL_SIZE):
+    """
+    Return a requests Session keeping up to `pool_size` HTTP connections open
+    for reuse across threads.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# this session is shared by all the threads
+session = get_session()
 
 
 def fetch_and_save_latest_definitions(
@@ -92,6 +114,7 @@ def fetch_and_save_latest_definitions(
     save_to_db=False,
     by_latest=True,
     retries=2,
+    session=session,
     verbose=True,
 ):
     """
@@ -113,7 +136,7 @@ def fetch_and_save_latest_definitions(
         )
 
     for content in fetch_definitions(
-        api_url=definitions_url, cache=cache, retries=retries, verbose=TRACE
+        api_url=definitions_url, cache=cache, retries=retries, session=session, verbose=TRACE
     ):
         # content is a batch of 100 definitions
         definitions = content and content.get("data")
@@ -148,7 +171,7 @@ def fetch_and_save_latest_definitions(
             yield coordinate, blob_path
 
 
-def fetch_definitions(api_url, cache, retries=1, verbose=True):
+def fetch_definitions(api_url, cache, retries=1, session=session, verbose=True):
     """
     Yield batches of definitions each as a list of mappings from calling the
     ClearlyDefined API at `api_url`. Retry on failure up to `retries` times.
@@ -331,70 +354,75 @@ def fetch_and_save_harvests(
 
 
 class Cache:
-    """A caching object for etags and checksums to avoid refetching things."""
+    """
+    A thread-safe caching object for etags and checksums to avoid refetching
+    things. The least recently used entries are evicted first when the cache
+    grows beyond `max_size` entries.
+    """
 
     def __init__(self, max_size=100 * 1000):
-        self.etags_cache = {}
-        self.checksums_cache = {}
+        self.etags_cache = OrderedDict()
+        self.checksums_cache = OrderedDict()
         self.max_size = max_size
+        self.lock = threading.Lock()
 
-    def is_unchanged_remotely(self, url, session=session):
-        """
-        Return True if a `url` content is unchanged from cache based on HTTP
-        HEADER Etag.
-        """
-        try:
-            response = session.head(url)
-            remote_etag = response.headers.get("etag")
-            if remote_etag and self.etags_cache.get(url) == remote_etag:
-                return True
-        except Exception:
-            return False
+    def get_etag(self, url):
+        """Return the cached etag of a `url` or None."""
+        with self.lock:
+            etag = self.etags_cache.get(url)
+            if etag:
+                self.etags_cache.move_to_end(url)
+            return etag
 
     def is_fetched(self, checksum, url):
         """Return True if the content checksum exists for url, using MD5 checksum."""
-        return url and checksum and self.checksums_cache.get(checksum) == url
+        if not (url and checksum):
+            return False
+        with self.lock:
+            if self.checksums_cache.get(checksum) != url:
+                return False
+            self.checksums_cache.move_to_end(checksum)
+            return True
 
     def add(self, etag, checksum, url):
-        if etag:
-            self.etags_cache[url] = etag
-        if checksum:
-            self.checksums_cache[checksum] = url
+        with self.lock:
+            if etag:
+                self.etags_cache[url] = etag
+                self.etags_cache.move_to_end(url)
+            if checksum:
+                self.checksums_cache[checksum] = url
+                self.checksums_cache.move_to_end(checksum)
+            self._trim()
 
     def add_args(self, args):
         self.add(*args)
 
     def trim(self):
         """Trim the cache to its max size."""
+        with self.lock:
+            self._trim()
 
-        def _resize(cache):
-            extra_items = len(cache) - self.max_size
-            if extra_items > 0:
-                for ei in list(cache)[:extra_items]:
-                    del cache[ei]
-
-        _resize(self.etags_cache)
-        _resize(self.checksums_cache)
+    def _trim(self):
+        for cache in (self.etags_cache, self.checksums_cache):
+            while len(cache) > self.max_size:
+                cache.popitem(last=False)
 
     def get_content(self, url, retries=1, session=session, with_cache_keys=False):
         """
         Return fetched content as bytes or None if already fetched or unchanged.
         Updates the cache as needed.
-        """
-        if self.is_unchanged_remotely(url=url, session=session):
-            return
 
+        Use a conditional request with the cached etag of `url` to avoid
+        refetching unchanged content.
+        """
         etag, checksum, content = cdutils.get_response_content(
-            url, retries=retries, session=session
+            url, retries=retries, session=session, etag=self.get_etag(url)
         )
 
-        if not content:
-            return
-
-        if self.is_fetched(checksum, url):
-            return
-
-        self.add(etag, checksum, url)
+        if not content or self.is_fetched(checksum, url):
+            content = None
+        else:
+            self.add(etag, checksum, url)
 
         if with_cache_keys:
             return etag, checksum, content
@@ -404,8 +432,9 @@ class Cache:
     def copy(self):
         """Return a deep copy of self"""
         cache = Cache(self.max_size)
-        cache.checksums_cache = dict(self.checksums_cache)
-        cache.etags_cache = dict(self.etags_cache)
+        with self.lock:
+            cache.checksums_cache = OrderedDict(self.checksums_cache)
+            cache.etags_cache = OrderedDict(self.etags_cache)
         return cache
 
 
@@ -446,14 +475,22 @@ def sync(
 
     sleeping = False
     harvest_fetchers = None
+    # Limit the number of harvests waiting to be fetched
+    pending_harvests = threading.BoundedSemaphore(max(processes, 1) * 2)
+
+    def on_harvest_fetched(future):
+        pending_harvests.release()
+        error = not future.cancelled() and future.exception()
+        if error:
+            print("  Failed to fetch harvest:", error, flush=True)
 
     log_file_fn = None
     if log_file:
         log_file_fn = open(log_file, "a")
 
     try:
-        if fetch_harvests:
-            harvest_fetchers = pool.Pool(processes=processes, maxtasksperchild=10000)
+        if fetch_harvests and processes:
+            harvest_fetchers = ThreadPoolExecutor(max_workers=processes)
 
         # loop forever. Complete one loop once we have fetched all the latest
         # items and we are not getting new pages (based on etag)
@@ -480,6 +517,7 @@ def sync(
                     save_to_db=save_to_db,
                     cache=cache,
                     by_latest=not unsorted,
+                    session=session,
                     verbose=verbose,
                 )
 
@@ -497,16 +535,19 @@ def sync(
                             coordinate=coordinate,
                             output_dir=output_dir,
                             save_to_db=save_to_db,
-                            # that's a copy of the cache, since we are in some
-                            # subprocess, the data is best not shared to avoid
-                            # any sync issue
-                            cache=cache.copy(),
+                            # the cache is thread-safe and shared by all the
+                            # threads
+                            cache=cache,
+                            session=session,
                             verbose=verbose,
                         )
 
-                        harvest_fetchers.apply_async(
-                            fetch_and_save_harvests, kwds=kwds, callback=cache.add_args
-                        )
+                        if harvest_fetchers:
+                            pending_harvests.acquire()
+                            future = harvest_fetchers.submit(fetch_and_save_harvests, **kwds)
+                            future.add_done_callback(on_harvest_fetched)
+                        else:
+                            fetch_and_save_harvests(**kwds)
 
                     if max_def and max_def <= cycle_defs_count:
                         break
@@ -551,7 +592,6 @@ def sync(
 
             sleeping = True
             time.sleep(wait)
-            cache.trim()
 
     except KeyboardInterrupt:
         click.secho("\nAborted with Ctrl+C!", fg="red", err=True)
@@ -562,8 +602,7 @@ def sync(
             log_file_fn.close()
 
         if harvest_fetchers:
-            harvest_fetchers.close()
-            harvest_fetchers.terminate()
+            harvest_fetchers.shutdown(cancel_futures=True)
 
         print(
             "TOTAL cycles:",
@@ -616,7 +655,7 @@ def sync(
     metavar="INT",
     default=1,
     show_default=True,
-    help="Set the number of parallel processes to use. Disable parallel processing if 0.",
+    help="Set the number of harvests fetched concurrently. Disable concurrent fetching if 0.",
 )
 @click.option(
     "--max-def",
@@ -18,10 +18,12 @@
 
 import gzip
 import json
+from unittest import mock
 
 from django.test import TestCase
 
 from clearcode.models import CDitem
+from clearcode.sync import Cache
 from clearcode.sync import db_saver
 
 
@@ -42,3 +44,46 @@ class SyncDbsaverTestCase(TestCase):
     def test_db_saver_different_path(self):
         db_saver(content=self.test_content, blob_path="new/blob/path.json")
         self.assertEqual(2, len(CDitem.objects.all()))
+
+
+class SyncCacheTestCase(TestCase):
+    def get_session(self, *responses):
+        session = mock.Mock()
+        session.get.side_effect = [
+            mock.Mock(status_code=status_code, headers={"etag": etag}, content=content)
+            for status_code, etag, content in responses
+        ]
+        return session
+
+    def test_cache_get_content_uses_conditional_requests(self):
+        cache = Cache()
+        url = "https://api.clearlydefined.io/harvest/npm/npmjs/-/foo/1.0"
+        session = self.get_session((200, "etag1", b"content"), (304, "etag1", b""))
+
+        self.assertEqual(b"content", cache.get_content(url, session=session))
+        self.assertIsNone(cache.get_content(url, session=session))
+
+        first_call, second_call = session.get.call_args_list
+        self.assertIsNone(first_call.kwargs["headers"])
+        self.assertEqual({"If-None-Match": "etag1"}, second_call.kwargs["headers"])
+        session.head.assert_not_called()
+
+    def test_cache_get_content_with_cache_keys_when_unchanged(self):
+        cache = Cache()
+        cache.add("etag1", None, "https://example.com/foo")
+        session = self.get_session((304, "etag1", b""))
+
+        result = cache.get_content("https://example.com/foo", session=session, with_cache_keys=True)
+        self.assertEqual(("etag1", None, None), result)
+
+    def test_cache_evicts_least_recently_used_entries(self):
+        cache = Cache(max_size=2)
+        cache.add("etag1", "md5-1", "url1")
+        cache.add("etag2", "md5-2", "url2")
+        self.assertEqual("etag1", cache.get_etag("url1"))
+        self.assertTrue(cache.is_fetched("md5-1", "url1"))
+        cache.add("etag3", "md5-3", "url3")
+
+        self.assertEqual(["url1", "url3"], list(cache.etags_cache))
+        self.assertEqual(["md5-1", "md5-3"], list(cache.checksums_cache))
+        self.assertIsNone(cache.get_etag("url2"))
@@ -0,0 +1,353 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+import logging
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+Optional in-memory index of the BAH128 fingerprints stored in the approximate
+matching index tables.
+
+The 128-bit hash of each index row is kept in a pair of packed uint64 NumPy
+arrays, alongside the row id and the number of indexed elements, so that a
+lookup computes the Hamming distance against every indexed fingerprint with a
+few vectorised operations instead of scanning the table with a multi-OR query
+and comparing each candidate row in Python.
+
+This is enabled with the MATCHCODE_RESIDENT_INDEX setting and requires NumPy,
+installed with the "resident_index" extra. Each process has its own resident
+indexes, loaded at startup or on first use, refreshed with the rows created
+in the database since their last refresh and periodically reloaded entirely to
+drop the deleted rows.
+"""
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(stream=sys.stdout)
+logger.setLevel(logging.INFO)
+
+# Fingerprints that are at or above this Hamming distance are not a match
+HAMMING_DISTANCE_THRESHOLD = 10
+
+# Names of the index models that can be loaded in a resident index
+RESIDENT_INDEX_MODEL_NAMES = (
+    "ApproximateDirectoryContentIndex",
+    "ApproximateDirectoryStructureIndex",
+    "ApproximateResourceContentIndex",
+)
+
+# Number of row ids below the highest loaded row id that are read again on each
+# refresh, to load the rows of transactions that committed after rows with
+# higher ids. The rows committed later than that are loaded by the next reload.
+REFRESH_ID_WINDOW = 10000
+
+CHUNK_MASK = 0xFFFFFFFF
+UINT64_MASK = 0xFFFFFFFFFFFFFFFF
+
+# Loaded resident indexes of this process, keyed by index model
+RESIDENT_INDEX_BY_MODEL = {}
+RESIDENT_INDEX_BY_MODEL_LOCK = threading.Lock()
+
+
+def popcount(values):
+    """Return an array of the number of set bits of each uint64 in `values`."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    # NumPy < 2.0 has no popcount: count the set bits of each byte instead
+    bits_by_byte = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+    values_bytes = values.view(np.uint8).reshape(values.shape + (8,))
+    return bits_by_byte[values_bytes].sum(axis=-1)
+
+
+def bah128_to_uint64s(bah128):
+    """
+    Return a tuple of the high and low uint64 Python integers of the 32
+    characters hex string `bah128`.
+    """
+    value = int(bah128, 16)
+    return value >> 64, value & UINT64_MASK
+
+
+def pack_rows(ids, indexed_elements_counts, hashes):
+    """
+    Return a tuple of (ids, indexed elements counts, high, low) arrays for the
+    index rows with `ids`, `indexed_elements_counts` and binary 16 bytes
+    `hashes`.
+    """
+    packed = np.frombuffer(b"".join(hashes), dtype=">u8").astype(np.uint64).reshape(-1, 2)
+    return (
+        np.array(ids, dtype=np.int64),
+        np.array(indexed_elements_counts, dtype=np.int64),
+        packed[:, 0],
+        packed[:, 1],
+    )
+
+
+class BAH128Index:
+    """
+    An in-memory index of the fingerprints of an approximate matching index
+    `model`.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = np.empty(0, dtype=np.int64)
+        self.indexed_elements_counts = np.empty(0, dtype=np.int64)
+        self.high = np.empty(0, dtype=np.uint64)
+        self.low = np.empty(0, dtype=np.uint64)
+        # The highest index row id loaded so far
+        self.max_id = 0
+        self.last_refresh = None
+        self.last_reload = None
+        # Guards the index arrays
+        self.lock = threading.Lock()
+        # Serializes the refreshes and reloads
+        self.refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def read_rows(self, min_id=0, chunk_size=100000):
+        """
+        Return a list of (ids, indexed elements counts, high, low) array tuples
+        as returned by `pack_rows` for the index rows with an id greater than
+        `min_id`, read and packed `chunk_size` rows at a time.
+        """
+        rows = (
+            self.model.objects.filter(id__gt=min_id)
+            .order_by("id")
+            .values_list("id", "indexed_elements_count", "chunk1", "chunk2", "chunk3", "chunk4")
+        )
+
+        packed_chunks = []
+        ids = []
+        indexed_elements_counts = []
+        hashes = []
+        for row_id, indexed_elements_count, *chunks in rows.iterator(chunk_size=chunk_size):
+            ids.append(row_id)
+            indexed_elements_counts.append(indexed_elements_count)
+            hashes.append(b"".join(bytes(chunk) for chunk in chunks))
+            if len(ids) >= chunk_size:
+                packed_chunks.append(pack_rows(ids, indexed_elements_counts, hashes))
+                ids, indexed_elements_counts, hashes = [], [], []
+        if ids:
+            packed_chunks.append(pack_rows(ids, indexed_elements_counts, hashes))
+        return packed_chunks
+
+    def refresh(self, chunk_size=100000, id_window=REFRESH_ID_WINDOW):
+        """
+        Load the index rows created since the last refresh and return the
+        number of rows loaded.
+
+        The rows with an id within `id_window` of the highest loaded id are read
+        again and the ones not yet loaded are added, such that rows committed
+        after rows with a higher id are not missed.
+        """
+        with self.refresh_lock:
+            min_id = max(self.max_id - id_window, 0)
+            packed_chunks = self.read_rows(min_id=min_id, chunk_size=chunk_size)
+
+            with self.lock:
+                loaded_ids = self.ids[self.ids > min_id]
+            new_chunks = []
+            for packed_chunk in packed_chunks:
+                is_new = ~np.isin(packed_chunk[0], loaded_ids)
+                if is_new.any():
+                    new_chunks.append(tuple(array[is_new] for array in packed_chunk))
+            loaded = self.extend(new_chunks)
+
+            self.last_refresh = time.monotonic()
+            if self.last_reload is None:
+                self.last_reload = self.last_refresh
+
+        if loaded:
+            logger.info(f"Loaded {loaded} {self.model.__name__} rows in resident index")
+        return loaded
+
+    def reload(self, chunk_size=100000):
+        """
+        Load all the index rows again, replacing the loaded rows such that the
+        deleted rows are dropped. Return the number of rows loaded.
+        """
+        with self.refresh_lock:
+            packed_chunks = self.read_rows(chunk_size=chunk_size)
+            with self.lock:
+                self.ids = np.empty(0, dtype=np.int64)
+                self.indexed_elements_counts = np.empty(0, dtype=np.int64)
+                self.high = np.empty(0, dtype=np.uint64)
+                self.low = np.empty(0, dtype=np.uint64)
+                self.max_id = 0
+            loaded = self.extend(packed_chunks)
+            self.last_refresh = self.last_reload = time.monotonic()
+
+        logger.info(f"Reloaded {loaded} {self.model.__name__} rows in resident index")
+        return loaded
+
+    def extend(self, packed_chunks):
+        """
+        Add the rows of a list of `packed_chunks` (ids, indexed elements counts,
+        high, low) array tuples as returned by `pack_rows` to this index with
+        a single copy of the index arrays. Return the number of rows added.
+        """
+        if not packed_chunks:
+            return 0
+
+        ids, indexed_elements_counts, high, low = zip(*packed_chunks)
+        with self.lock:
+            self.ids = np.concatenate([self.ids, *ids])
+            self.indexed_elements_counts = np.concatenate(
+                [self.indexed_elements_counts, *indexed_elements_counts]
+            )
+            self.high = np.concatenate([self.high, *high])
+            self.low = np.concatenate([self.low, *low])
+            self.max_id = max(self.max_id, max(int(chunk_ids.max()) for chunk_ids in ids))
+        return sum(len(chunk_ids) for chunk_ids in ids)
+
+    def get_distances(self, bah128, indexed_elements_count_range=None):
+        """
+        Return a tuple of (ids, distances) arrays of the index rows that are
+        candidates for the 32 characters hex string `bah128` with their Hamming
+        distance to `bah128`.
+
+        If `indexed_elements_count_range` is provided, candidates must have an
+        indexed elements count in that inclusive (min, max) range and share at
+        least one 32-bit chunk with `bah128`, like the chunk lookup done in the
+        database by `ApproximateMatchingHashMixin.match`.
+        """
+        query_high, query_low = bah128_to_uint64s(bah128)
+        with self.lock:
+            ids = self.ids
+            indexed_elements_counts = self.indexed_elements_counts
+            high = self.high
+            low = self.low
+
+        if indexed_elements_count_range:
+            min_count, max_count = indexed_elements_count_range
+            chunk_shift = np.uint64(32)
+            chunk_mask = np.uint64(CHUNK_MASK)
+            candidates = (
+                ((high >> chunk_shift) == np.uint64(query_high >> 32))
+                | ((high & chunk_mask) == np.uint64(query_high & CHUNK_MASK))
+                | ((low >> chunk_shift) == np.uint64(query_low >> 32))
+                | ((low & chunk_mask) == np.uint64(query_low & CHUNK_MASK))
+            )
+            candidates &= indexed_elements_counts >= min_count
+            candidates &= indexed_elements_counts <= max_count
+            ids = ids[candidates]
+            high = high[candidates]
+            low = low[candidates]
+
+        distances = popcount(high ^ np.uint64(query_high)).astype(np.int64)
+        distances += popcount(low ^ np.uint64(query_low))
+        return ids, distances
+
+    def match(
+        self,
+        bah128,
+        indexed_elements_count_range=None,
+        max_distance=HAMMING_DISTANCE_THRESHOLD,
+    ):
+        """
+        Return a list of (Hamming distance, index row id) tuples for the rows
+        closer than `max_distance` from `bah128`, sorted by distance.
+        """
+        ids, distances = self.get_distances(bah128, indexed_elements_count_range)
+        close = distances < max_distance
+        ids = ids[close]
+        distances = distances[close]
+        order = np.lexsort((ids, distances))
+        return list(zip(distances[order].tolist(), ids[order].tolist()))
+
+    def top_k(self, bah128, k=10, indexed_elements_count_range=None):
+        """
+        Return a list of at most `k` (Hamming distance, index row id) tuples for
+        the rows closest to `bah128`, sorted by distance.
+        """
+        ids, distances = self.get_distances(bah128, indexed_elements_count_range)
+        if k < len(distances):
+            nearest = np.argpartition(distances, k)[:k]
+            ids = ids[nearest]
+            distances = distances[nearest]
+        order = np.lexsort((ids, distances))
+        return list(zip(distances[order].tolist(), ids[order].tolist()))
+
+
+def is_resident_index_enabled():
+    return np is not None and getattr(settings, "MATCHCODE_RESIDENT_INDEX", False)
+
+
+def get_resident_index(model):
+    """
+    Return the resident BAH128Index of the approximate matching index `model`,
+    loading it on first use, refreshing it with new rows when the
+    MATCHCODE_RESIDENT_INDEX_REFRESH_INTERVAL seconds have elapsed and
+    reloading it entirely when the MATCHCODE_RESIDENT_INDEX_RELOAD_INTERVAL
+    seconds have elapsed.
+
+    Return None if resident indexes are not enabled or `model` is not supported.
+    """
+    if not is_resident_index_enabled() or model.__name__ not in RESIDENT_INDEX_MODEL_NAMES:
+        return
+
+    with RESIDENT_INDEX_BY_MODEL_LOCK:
+        resident_index = RESIDENT_INDEX_BY_MODEL.get(model)
+        if resident_index is None:
+            resident_index = BAH128Index(model)
+            resident_index.refresh()
+            RESIDENT_INDEX_BY_MODEL[model] = resident_index
+            return resident_index
+
+    now = time.monotonic()
+    reload_interval = getattr(settings, "MATCHCODE_RESIDENT_INDEX_RELOAD_INTERVAL", 3600)
+    refresh_interval = getattr(settings, "MATCHCODE_RESIDENT_INDEX_REFRESH_INTERVAL", 60)
+    if now - resident_index.last_reload >= reload_interval:
+        resident_index.reload()
+    elif now - resident_index.last_refresh >= refresh_interval:
+        resident_index.refresh()
+    return resident_index
+
+
+def update_resident_index(model):
+    """
+    Load the new rows of `model` in its resident index if it is loaded in this
+    process, once the current transaction commits. This is called after rows
+    are written to the `model` table.
+
+    Note: this refresh is local to the current process. The resident indexes
+    of the other processes, such as the web and matching workers, load these
+    rows on their next lookup after MATCHCODE_RESIDENT_INDEX_REFRESH_INTERVAL
+    seconds have elapsed since their last refresh.
+    """
+    resident_index = RESIDENT_INDEX_BY_MODEL.get(model)
+    if resident_index is not None:
+        transaction.on_commit(resident_index.refresh)
+
+
+def load_resident_indexes():
+    """
+    Load the resident indexes of all the supported approximate matching index
+    models, if enabled. This is called when a worker process starts such that
+    the first match request does not pay for loading the index tables.
+    """
+    if not is_resident_index_enabled():
+        return
+
+    from matchcode import models
+
+    for model_name in RESIDENT_INDEX_MODEL_NAMES:
+        get_resident_index(getattr(models, model_name))
@@ -16,6 +16,7 @@ from django.db.models import Q
 
 import attr
 from commoncode.resource import VirtualCodebase
+from licensedcode.spans import Span
 from matchcode_toolkit.fingerprinting import compute_codebase_directory_fingerprints
 
 from matchcode.models import ApproximateDirectoryContentIndex
@@ -346,3 +347,28 @@ def merge_matches(matches, max_dist=None, trace=TRACE):
             j += 1
         i += 1
     return matches
+
+
+def merge_spans(spans, max_dist=None):
+    """
+    Return a list of merged Span given a `spans` list of query Span. This is
+    the same as `merge_matches` for the query side Spans of matches that are
+    all to the same index-side Resource.
+    """
+    if len(spans) < 2:
+        return spans
+
+    if max_dist is None:
+        # Using window length
+        max_dist = 16
+
+    spans = sorted(spans, key=lambda span: (span.start, -len(span)))
+
+    merged = [spans[0]]
+    for span in spans[1:]:
+        current = merged[-1]
+        if current.overlap(span) or span in current or current.distance_to(span) < max_dist:
+            merged[-1] = Span(current | span)
+        else:
+            merged.append(span)
+    return merged
@@ -11,13 +11,14 @@ import binascii
 import logging
 import sys
 from collections import defaultdict
-from copy import deepcopy
 from datetime import datetime
 from difflib import SequenceMatcher
-from itertools import groupby
 from typing import NamedTuple
 
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connection
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.forms.models import model_to_dict
 from django.utils.translation import gettext_lazy as _
 
@@ -29,6 +30,9 @@ from matchcode_toolkit.fingerprinting import hexstring_to_binarray
 from matchcode_toolkit.fingerprinting import split_fingerprint
 from samecode.halohash import byte_hamming_distance
 
+from matchcode.bah128_index import HAMMING_DISTANCE_THRESHOLD
+from matchcode.bah128_index import get_resident_index
+from matchcode.bah128_index import update_resident_index
 from minecode.management.commands import get_error_message
 from packagedb.models import Package
 from packagedb.models import Resource
@@ -73,9 +77,22 @@ class BaseFileIndex(PackageRelatedMixin, models.Model):
         blank=False,
     )
 
+    # Fields that identify a unique index entry for a Package
+    index_key_fields = ("sha1",)
+    # Key field used to look up the existing index entries of a batch
+    index_lookup_field = "sha1"
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def build(cls, sha1, package):
+        """
+        Return a new unsaved index entry for the hex string `sha1` of a file
+        from `package`.
+        """
+        return cls(package=package, sha1=hexstring_to_binarray(sha1))
+
     @classmethod
     def index(cls, sha1, package):
         try:
@@ -141,6 +158,15 @@ def bah128_ranges(indexed_elements_count, range_ratio=0.05):
     )
 
 
+def bit_hamming_distance(hash1, hash2):
+    """
+    Return the number of different bits between the `hash1` and `hash2` bytes
+    of the same length.
+    """
+    difference = int.from_bytes(hash1, "big") ^ int.from_bytes(hash2, "big")
+    return bin(difference).count("1")
+
+
 class ApproximateMatchingHashMixin(PackageRelatedMixin, models.Model):
     indexed_elements_count = models.IntegerField(
         help_text="Number of elements that went into the fingerprint",
@@ -183,6 +209,18 @@ class ApproximateMatchingHashMixin(PackageRelatedMixin, models.Model):
         help_text=_("The full path value of this resource"),
     )
 
+    # Fields that identify a unique index entry for a Package
+    index_key_fields = (
+        "indexed_elements_count",
+        "chunk1",
+        "chunk2",
+        "chunk3",
+        "chunk4",
+        "path",
+    )
+    # Key field used to look up the existing index entries of a batch
+    index_lookup_field = "path"
+
     class Meta:
         abstract = True
         unique_together = ["chunk1", "chunk2", "chunk3", "chunk4", "package", "path"]
@@ -190,6 +228,24 @@ class ApproximateMatchingHashMixin(PackageRelatedMixin, models.Model):
     def __str__(self):
         return self.fingerprint()
 
+    @classmethod
+    def build(cls, fingerprint, resource_path, package):
+        """
+        Return a new unsaved index entry for the string `fingerprint` of the
+        Resource at `resource_path` from `package`.
+        """
+        indexed_elements_count, fp = split_fingerprint(fingerprint)
+        fp_chunk1, fp_chunk2, fp_chunk3, fp_chunk4 = create_halohash_chunks(fp)
+        return cls(
+            indexed_elements_count=indexed_elements_count,
+            chunk1=fp_chunk1,
+            chunk2=fp_chunk2,
+            chunk3=fp_chunk3,
+            chunk4=fp_chunk4,
+            path=resource_path,
+            package=package,
+        )
+
     @classmethod
     def index(cls, fingerprint, resource_path, package):
         """
@@ -217,6 +273,7 @@ class ApproximateMatchingHashMixin(PackageRelatedMixin, models.Model):
                     f"{datetime.utcnow().isoformat()} - Inserted {bdi.__class__.__name__} "
                     f"for Package {package.download_url}:\t{fingerprint}"
                 )
+                update_resident_index(cls)
             return bdi, created
         except Exception as e:
             msg = "Error creating ApproximateMatchingHashMixin:\n"
@@ -255,40 +312,24 @@ class ApproximateMatchingHashMixin(PackageRelatedMixin, models.Model):
             )
             return matches
 
-        # Step 1: find fingerprints with matching chunks
+        # Step 1 and 2: find fingerprints with matching chunks and keep the ones
+        # with a close Hamming distance, using the in-memory index of this
+        # table when it is loaded
         frange = bah128_ranges(indexed_elements_count)
-        matches = cls.objects.filter(
-            models.Q(indexed_elements_count__range=frange, chunk1=chunk1)
-            | models.Q(indexed_elements_count__range=frange, chunk2=chunk2)
-            | models.Q(indexed_elements_count__range=frange, chunk3=chunk3)
-            | models.Q(indexed_elements_count__range=frange, chunk4=chunk4)
-        )
-
-        if TRACE:
-            for match in matches:
-                dct = model_to_dict(match)
-                logger_debug(cls.__name__, "match:", "matched_package:", dct)
-
-        # Step 2: calculate Hamming distance of all matches
-
-        hamming_distance_threshold = 10
-        # Store all close matches in a dictionary of querysets
-        matches_by_hamming_distance = defaultdict(cls.objects.none)
-        for match in matches:
-            # Get fingerprint from the match
-            fp = match.fingerprint()
-            _, match_bah128 = split_fingerprint(fp)
-
-            # Perform Hamming distance calculation between the fingerprint we
-            # are looking up and a potential match fingerprint
-            hd = byte_hamming_distance(bah128, match_bah128)
-
-            # TODO: try other thresholds if this is too restrictive
-            # TODO: rank matches instead of having threshold
-            if hd < hamming_distance_threshold:
-                # Save match to `matches_by_hamming_distance` by adding the matched object
-                # to the queryset
-                matches_by_hamming_distance[hd] |= cls.objects.filter(pk=match.pk)
+        resident_index = get_resident_index(cls)
+        if resident_index is not None:
+            pks_by_hamming_distance = defaultdict(list)
+            for hd, pk in resident_index.match(bah128, indexed_elements_count_range=frange):
+                pks_by_hamming_distance[hd].append(pk)
+            matches_by_hamming_distance = {
+                hd: cls.objects.filter(pk__in=pks) for hd, pks in pks_by_hamming_distance.items()
+            }
+        else:
+            matches_by_hamming_distance = cls.get_matches_by_hamming_distance(
+                bah128=bah128,
+                chunks=(chunk1, chunk2, chunk3, chunk4),
+                frange=frange,
+            )
 
         if TRACE:
             logger_debug(list(matches_by_hamming_distance.items()))
@@ -322,55 +363,266 @@ class ApproximateMatchingHashMixin(PackageRelatedMixin, models.Model):
                     remaining_matches |= matches
             return remaining_matches
 
+        ranked_matches = cls.rank_matches(hamming_distances_and_matches, resource)
+        matches = cls.objects.filter(pk__in=[match.pk for match in ranked_matches])
+        return matches
+
+    @classmethod
+    def match_many(cls, fingerprints, resources=None, exact_match=False):
+        """
+        Return a list of the ranked matches for each fingerprint of the list of
+        `fingerprints`, in the same order. This is the batch version of `match`
+        that looks up all the fingerprints with a single query.
+
+        `resources` is an optional list of the Resource of each fingerprint
+        used to rank matches.
+        """
+        resources = resources or [None] * len(fingerprints)
+        queries = []
+        for fingerprint in fingerprints:
+            if not fingerprint:
+                queries.append(None)
+                continue
+            indexed_elements_count, bah128 = split_fingerprint(fingerprint)
+            chunks = tuple(bytes(chunk) for chunk in create_halohash_chunks(bah128))
+            if exact_match:
+                frange = (indexed_elements_count, indexed_elements_count)
+            else:
+                frange = bah128_ranges(indexed_elements_count)
+            queries.append((bah128, chunks, frange))
+
+        matches_by_hamming_distance_by_query = cls.get_matches_by_hamming_distance_many(queries)
+
+        ranked_matches_by_query = []
+        for matches_by_hamming_distance, resource in zip(
+            matches_by_hamming_distance_by_query, resources
+        ):
+            if exact_match:
+                matches_by_hamming_distance = {
+                    hd: matches for hd, matches in matches_by_hamming_distance.items() if hd == 0
+                }
+            hamming_distances_and_matches = sorted(matches_by_hamming_distance.items())
+            if not hamming_distances_and_matches:
+                ranked_matches_by_query.append([])
+            elif resource and not exact_match:
+                ranked_matches = cls.rank_matches(hamming_distances_and_matches, resource)
+                ranked_matches_by_query.append(ranked_matches)
+            else:
+                ranked_matches_by_query.append(
+                    [match for _, matches in hamming_distances_and_matches for match in matches]
+                )
+        return ranked_matches_by_query
+
+    @classmethod
+    def get_matches_by_hamming_distance_many(cls, queries):
+        """
+        Return a list of mappings of {Hamming distance: [matches]} for each
+        (bah128, chunks, frange) tuple or None of the list of `queries`.
+
+        This is the batch version of `get_matches_by_hamming_distance`: the
+        candidates of all the queries are fetched with a single query that
+        joins the index with the list of queries, each with its own chunks and
+        indexed elements count range.
+        """
+        matches_by_hamming_distance_by_query = [defaultdict(list) for _ in queries]
+        queries_by_index = {index: query for index, query in enumerate(queries) if query}
+        if not queries_by_index:
+            return matches_by_hamming_distance_by_query
+
+        resident_index = get_resident_index(cls)
+        if resident_index is not None:
+            hamming_distances_by_pk_by_index = {}
+            for index, (bah128, _, frange) in queries_by_index.items():
+                hamming_distances_by_pk_by_index[index] = {
+                    pk: hd
+                    for hd, pk in resident_index.match(bah128, indexed_elements_count_range=frange)
+                }
+            pks = set()
+            for hamming_distances_by_pk in hamming_distances_by_pk_by_index.values():
+                pks.update(hamming_distances_by_pk)
+            matches_by_pk = cls.objects.in_bulk(pks)
+            for index, hamming_distances_by_pk in hamming_distances_by_pk_by_index.items():
+                for pk, hd in hamming_distances_by_pk.items():
+                    if match := matches_by_pk.get(pk):
+                        matches_by_hamming_distance_by_query[index][hd].append(match)
+            return matches_by_hamming_distance_by_query
+
+        # Step 1: find the fingerprints with a matching chunk and indexed
+        # elements count for each query, joining the index table with the list
+        # of queries such that each query is looked up with its own range
+        chunk_fields = ("chunk1", "chunk2", "chunk3", "chunk4")
+        query_columns = ("query_index", *chunk_fields, "range_min", "range_max")
+        query_values = [[] for _ in query_columns]
+        for index, (_, chunks, (range_min, range_max)) in queries_by_index.items():
+            values = (index, *(bytes(chunk) for chunk in chunks), range_min, range_max)
+            for column_values, value in zip(query_values, values):
+                column_values.append(value)
+
+        quote_name = connection.ops.quote_name
+        table = quote_name(cls._meta.db_table)
+        pk_column = quote_name(cls._meta.pk.column)
+        count_column = quote_name(cls._meta.get_field("indexed_elements_count").column)
+        candidates_by_chunk = [
+            f"SELECT fingerprint.{pk_column}, query.query_index "  # noqa: S608
+            f"FROM {table} fingerprint JOIN query "
+            f"ON fingerprint.{quote_name(cls._meta.get_field(field).column)} = query.{field} "
+            f"AND fingerprint.{count_column} BETWEEN query.range_min AND query.range_max"
+            for field in chunk_fields
+        ]
+        # Only quoted names are interpolated, the queries are parameters
+        sql = (
+            "WITH query AS (SELECT * FROM unnest("  # noqa: S608
+            "%s::integer[], %s::bytea[], %s::bytea[], %s::bytea[], %s::bytea[], "
+            f"%s::integer[], %s::integer[]) AS query({', '.join(query_columns)})) "
+            f"SELECT {table}.*, candidate.query_index FROM {table} "
+            f"JOIN ({' UNION '.join(candidates_by_chunk)}) candidate "
+            f"ON {table}.{pk_column} = candidate.{pk_column}"
+        )
+        candidates = cls.objects.raw(sql, query_values)
+
+        # Step 2: calculate Hamming distance of the matches of each query
+        for match in candidates.iterator():
+            _, chunks, _ = queries_by_index[match.query_index]
+            match_hash = b"".join(bytes(getattr(match, field)) for field in chunk_fields)
+            hd = bit_hamming_distance(b"".join(chunks), match_hash)
+            if hd < HAMMING_DISTANCE_THRESHOLD:
+                matches_by_hamming_distance_by_query[match.query_index][hd].append(match)
+
+        return matches_by_hamming_distance_by_query
+
+    @classmethod
+    def rank_matches(cls, hamming_distances_and_matches, resource):
+        """
+        Return a list of the best ranked matches from a list of
+        (Hamming distance, matches) tuples `hamming_distances_and_matches`
+        sorted by Hamming distance, using file heuristics against the matched
+        `resource`.
+
+        Matches are ranked first by Hamming distance, then by size difference
+        and finally by name difference. Only the matches with the lowest
+        Hamming distance can be ranked first, so only their Resources are
+        fetched, with a single query, and the name difference is only computed
+        for the matches with the lowest size difference.
+        """
+        closest_matches = []
+        for _hamming_distance, matches in hamming_distances_and_matches:
+            closest_matches = list(matches)
+            if closest_matches:
+                break
+
+        package_ids = {match.package_id for match in closest_matches}
+        paths = {match.path for match in closest_matches}
+        matched_resources = Resource.objects.filter(
+            package_id__in=package_ids, path__in=paths
+        ).only("package_id", "path", "name", "size", "is_file")
+        matched_resources_by_key = {
+            (matched_resource.package_id, matched_resource.path): matched_resource
+            for matched_resource in matched_resources
+        }
+
         resource_size = resource.size
-        matches_by_rank_attributes = defaultdict(list)
-        for hamming_distance, matches in hamming_distances_and_matches:
-            for match in matches:
-                matched_resource = match.package.resources.get(path=match.path)
+        matches_and_resources_by_size_difference = defaultdict(list)
+        for match in closest_matches:
+            matched_resource = matched_resources_by_key.get((match.package_id, match.path))
+            if not matched_resource:
+                continue
+
+            if TRACE:
+                logger_debug(
+                    cls.__name__,
+                    "match:",
+                    "step_4_matched_resource:",
+                    matched_resource,
+                )
 
-                if TRACE:
-                    logger_debug(
-                        cls.__name__,
-                        "match:",
-                        "step_4_matched_resource:",
-                        matched_resource,
-                    )
+            # Compute size difference
+            if matched_resource.is_file:
+                size_difference = abs(resource_size - matched_resource.size)
+            else:
+                # TODO: index number of files in a directory so we can use
+                # that for size comparison. For now, we are going to
+                # disregard size as a factor.
+                size_difference = 0
+            matches_and_resources_by_size_difference[size_difference].append(
+                (match, matched_resource)
+            )
 
-                # Compute size and name difference
-                if matched_resource.is_file:
-                    size_difference = abs(resource_size - matched_resource.size)
-                else:
-                    # TODO: index number of files in a directory so we can use
-                    # that for size comparison. For now, we are going to
-                    # disregard size as a factor.
-                    size_difference = 0
-                name_sequence_matcher = SequenceMatcher(a=resource.name, b=matched_resource.name)
-                name_difference = 1 - name_sequence_matcher.ratio()
-                rank_attributes = (hamming_distance, size_difference, name_difference)
-                matches_by_rank_attributes[rank_attributes].append(match)
-
-                if TRACE:
-                    logger_debug(
-                        cls.__name__,
-                        "match:",
-                        "step_4_size_difference:",
-                        size_difference,
-                        "step_4_name_difference:",
-                        name_difference,
-                    )
+        if not matches_and_resources_by_size_difference:
+            return closest_matches
+
+        # Compute the name difference of the matches with the lowest size difference
+        matches_by_name_difference = defaultdict(list)
+        closest_size_difference = min(matches_and_resources_by_size_difference)
+        for match, matched_resource in matches_and_resources_by_size_difference[
+            closest_size_difference
+        ]:
+            name_sequence_matcher = SequenceMatcher(a=resource.name, b=matched_resource.name)
+            name_difference = 1 - name_sequence_matcher.ratio()
+            matches_by_name_difference[name_difference].append(match)
+
+            if TRACE:
+                logger_debug(
+                    cls.__name__,
+                    "match:",
+                    "step_4_size_difference:",
+                    closest_size_difference,
+                    "step_4_name_difference:",
+                    name_difference,
+                )
 
-        # Order these from low to high (low being low difference/very similar)),
-        # first by hamming distance, then by size difference, and finally by name difference.
-        ranked_attributes = sorted(matches_by_rank_attributes)
-        best_ranked_attributes = ranked_attributes[0]
-        ranked_matches = matches_by_rank_attributes[best_ranked_attributes]
+        ranked_matches = matches_by_name_difference[min(matches_by_name_difference)]
 
         if TRACE:
-            dct = model_to_dict(match)
-            logger_debug(cls.__name__, "match:", "step_4_best_match:", dct)
+            for match in ranked_matches:
+                dct = model_to_dict(match)
+                logger_debug(cls.__name__, "match:", "step_4_best_match:", dct)
 
-        matches = cls.objects.filter(pk__in=[match.pk for match in ranked_matches])
-        return matches
+        return ranked_matches
+
+    @classmethod
+    def get_matches_by_hamming_distance(cls, bah128, chunks, frange):
+        """
+        Return a mapping of {Hamming distance: queryset} of the index entries
+        that share one of the 4 `chunks` of the `bah128` fingerprint, have an
+        indexed elements count in the `frange` range, and have a Hamming
+        distance lower than HAMMING_DISTANCE_THRESHOLD with `bah128`.
+        """
+        chunk1, chunk2, chunk3, chunk4 = chunks
+
+        # Step 1: find fingerprints with matching chunks
+        matches = cls.objects.filter(
+            models.Q(indexed_elements_count__range=frange, chunk1=chunk1)
+            | models.Q(indexed_elements_count__range=frange, chunk2=chunk2)
+            | models.Q(indexed_elements_count__range=frange, chunk3=chunk3)
+            | models.Q(indexed_elements_count__range=frange, chunk4=chunk4)
+        )
+
+        if TRACE:
+            for match in matches:
+                dct = model_to_dict(match)
+                logger_debug(cls.__name__, "match:", "matched_package:", dct)
+
+        # Step 2: calculate Hamming distance of all matches
+
+        # Store all close matches in a dictionary of querysets
+        matches_by_hamming_distance = defaultdict(cls.objects.none)
+        for match in matches:
+            # Get fingerprint from the match
+            fp = match.fingerprint()
+            _, match_bah128 = split_fingerprint(fp)
+
+            # Perform Hamming distance calculation between the fingerprint we
+            # are looking up and a potential match fingerprint
+            hd = byte_hamming_distance(bah128, match_bah128)
+
+            # TODO: try other thresholds if this is too restrictive
+            # TODO: rank matches instead of having threshold
+            if hd < HAMMING_DISTANCE_THRESHOLD:
+                # Save match to `matches_by_hamming_distance` by adding the matched object
+                # to the queryset
+                matches_by_hamming_distance[hd] |= cls.objects.filter(pk=match.pk)
+
+        return matches_by_hamming_distance
 
     def get_chunks(self):
         chunk1 = binascii.hexlify(self.chunk1)
@@ -444,9 +696,31 @@ class BaseSnippetIndexMixin(PackageRelatedMixin, models.Model):
         default=0,
     )
 
+    # Fields that identify a unique index entry for a Package
+    index_key_fields = ("resource_id", "position", "fingerprint")
+    # Key field used to look up the existing index entries of a batch
+    index_lookup_field = "resource_id"
+
+    # Resource field that stores the number of distinct fingerprints of a
+    # Resource in this index
+    resource_count_field = None
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def build(cls, fingerprint, position, resource, package):
+        """
+        Return a new unsaved index entry for the snippet string `fingerprint`
+        found at `position` in `resource` from `package`.
+        """
+        return cls(
+            package=package,
+            position=position,
+            resource=resource,
+            fingerprint=hexstring_to_binarray(fingerprint),
+        )
+
     @classmethod
     def index(cls, fingerprint, position, resource, package):
         """
@@ -469,6 +743,8 @@ class BaseSnippetIndexMixin(PackageRelatedMixin, models.Model):
                     f"{datetime.utcnow().isoformat()} - Inserted {hi.__class__.__name__} "
                     f"for Resource {resource.path} from Package {package.download_url}:\t{fingerprint}"
                 )
+                # The stored number of distinct fingerprints is now stale
+                Resource.objects.filter(pk=resource.pk).update(**{cls.resource_count_field: None})
                 return hi, created
         except Exception as e:
             msg = "Error creating SnippetIndex:\n"
@@ -477,6 +753,52 @@ class BaseSnippetIndexMixin(PackageRelatedMixin, models.Model):
             package.save()
             logger.error(msg)
 
+    @classmethod
+    def update_resource_counts(cls, resources):
+        """
+        Compute and store the number of distinct fingerprints of each Resource
+        of the `resources` queryset in this index. Return the number of
+        Resources updated.
+        """
+        snippets_count = (
+            cls.objects.filter(resource=models.OuterRef("pk"))
+            .order_by()
+            .values("resource")
+            .annotate(count=models.Count("fingerprint", distinct=True))
+            .values("count")
+        )
+        return resources.update(
+            **{cls.resource_count_field: Coalesce(models.Subquery(snippets_count), models.Value(0))}
+        )
+
+    @classmethod
+    def get_snippets_count_by_resource_id(cls, resources):
+        """
+        Return a mapping of {resource id: number of distinct fingerprints} for
+        a list of `resources`, using the stored count of each Resource and
+        computing the missing ones in a single query.
+        """
+        snippets_count_by_resource_id = {}
+        missing_resource_ids = []
+        for resource in resources:
+            snippets_count = getattr(resource, cls.resource_count_field)
+            if snippets_count is None:
+                missing_resource_ids.append(resource.pk)
+            else:
+                snippets_count_by_resource_id[resource.pk] = snippets_count
+
+        if missing_resource_ids:
+            missing_counts = (
+                cls.objects.filter(resource_id__in=missing_resource_ids)
+                .order_by()
+                .values("resource_id")
+                .annotate(count=models.Count("fingerprint", distinct=True))
+                .values_list("resource_id", "count")
+            )
+            snippets_count_by_resource_id.update(missing_counts)
+
+        return snippets_count_by_resource_id
+
     @classmethod
     def match(cls, fingerprints):
         """
@@ -523,7 +845,7 @@ class BaseSnippetIndexMixin(PackageRelatedMixin, models.Model):
         Return a list of ResourceSnippetMatch for matched Resources.
         Only return the ``top`` matches, or all matches if ``top`` is zero.
         """
-        from matchcode.match import merge_matches
+        from matchcode.match import merge_spans
 
         if TRACE:
             logger_debug(
@@ -536,126 +858,78 @@ class BaseSnippetIndexMixin(PackageRelatedMixin, models.Model):
         if not fingerprints:
             return cls.objects.none()
 
-        # map fingerprints to spans
-        # after we have our matched fingerprints, we can go  back and get the
-        # spans that they were for When we hhave the spans that we matched to,
-        # we need to consolidate these spans, a lot of spans will be contained
-        # in the other
-        extended_file_fragment_matches_by_fingerprints = defaultdict(list)
+        # map fingerprints to the query spans they were computed for
+        qspans_by_fingerprint = defaultdict(list)
         for fp in fingerprints:
-            snippet = fp["snippet"]
             start_pos = fp["position"]
             end_pos = start_pos + SNIPPET_WINDOW_LENGTH - 1
-            resource = kwargs.get("resource")
-            qspan = Span(start_pos, end_pos)
-            extended_file_fragment_matches_by_fingerprints[snippet].append(
-                ExtendedFileFragmentMatch(qspan=qspan, qresource=resource)
-            )
-
-        only_fings = [
-            hexstring_to_binarray(fing)
-            for fing in extended_file_fragment_matches_by_fingerprints.keys()
-        ]
-
-        # TODO: track matched package and package resource in ExtendedFileFragmentMatch
-
-        # Step 0: get all fingerprint records that match with the input
-        matched_fps = cls.objects.filter(fingerprint__in=only_fings)
-
-        # Step 1: get Resources that show up in the query
-        resources = set(f.resource for f in matched_fps.iterator())
+            fingerprint = bytes(hexstring_to_binarray(fp["snippet"]))
+            qspans_by_fingerprint[fingerprint].append(Span(start_pos, end_pos))
+
+        only_fings = list(qspans_by_fingerprint)
+
+        # Step 0 and 1: get the Resources where our fingerprints appear, with
+        # their matched fingerprints and their number of unique fingerprints
+        matched_fingerprints_by_resource = list(
+            cls.objects.filter(fingerprint__in=only_fings)
+            .values("resource_id")
+            .annotate(matched_fingerprints=ArrayAgg("fingerprint", distinct=True))
+            .order_by("resource_id")
+        )
+        resources_by_id = Resource.objects.select_related("package").in_bulk(
+            [matched["resource_id"] for matched in matched_fingerprints_by_resource]
+        )
+        snippets_count_by_resource_id = cls.get_snippets_count_by_resource_id(
+            resources_by_id.values()
+        )
 
-        # Step 2: see which Resource we most match to by calculating jaccard coefficient of our fingerprints against the others
+        # Step 2: see which Resource we most match to by calculating jaccard
+        # coefficient of our fingerprints against the others.
+        # Step 3: merge the query spans of the matched fingerprints of each
+        # Resource in a single match with this Resource own similarity.
         fingerprints_length = len(only_fings)
-        matches = []
-        for r in resources:
-            # Get unique snippet fingerprints for this Resource
-            r_snippets = cls.objects.filter(resource=r).distinct("fingerprint")
-            matching_snippets = r_snippets.filter(fingerprint__in=only_fings)
-            r_snippets_count = r_snippets.count()
-            matching_snippets_count = matching_snippets.count()
+        final_matches = []
+        for matched in matched_fingerprints_by_resource:
+            resource_id = matched["resource_id"]
+            matched_fingerprints = matched["matched_fingerprints"]
+            matching_snippets_count = len(matched_fingerprints)
             jc = matching_snippets_count / (
-                (r_snippets_count + fingerprints_length) - matching_snippets_count
+                (snippets_count_by_resource_id[resource_id] + fingerprints_length)
+                - matching_snippets_count
             )
-            for matching_snippet in matching_snippets:
-                fp = matching_snippet.fingerprint.hex()
-                match_templates = extended_file_fragment_matches_by_fingerprints.get(fp)
-                for match_template in match_templates:
-                    match_copy = deepcopy(match_template)
-                    match_copy.iresource = r
-                    match_copy.ipackage = r.package
-                    match_copy.similarity = jc
-                    matches.append(match_copy)
-
-        # TODO: we do not track position so we do not know if we have a long or short match, or if the matches overlap
-        # We need have start position and end position, we need to have a function that combines overlapping matches into a span of matches
-        # This should be aligned between the query and index side
-        # we need to have a list of matched position in ascending order
-
-        # Step 3: group matches by ipackage and iresource, then spans
-        def sorter(m):
-            return -m.similarity, m.qspan.start, -m.len()
-
-        matches.sort(key=sorter)
-        matches_by_ipackage_iresource = groupby(matches, key=sorter)
-        final_matches = []
-        similarity = 0.0
-        prev_ipackage = None
-        prev_iresource = None
-        match_detections = []
-        for (
-            similarity,
-            qspan_start,
-            match_length,
-        ), grouped_matches in matches_by_ipackage_iresource:
-            for match in grouped_matches:
-                package_changed = match.ipackage != prev_ipackage if prev_ipackage else False
-                resource_changed = match.iresource != prev_iresource if prev_iresource else False
-
-                if package_changed or resource_changed:
-                    # finish up match_detections for this ipackage or iresource and create ResourceSnippetMatch
-                    match_detections = merge_matches(match_detections)
-                    mds = []
-                    for match_detection in match_detections:
-                        m = match_detection.qspan.subspans()
-                        mds.extend(m)
-                    m = ResourceSnippetMatch(
-                        package=prev_ipackage,
-                        resource=prev_iresource,
-                        similarity=abs(similarity),
-                        match_detections=mds,
-                    )
-                    final_matches.append(m)
-                    match_detections = []
+            qspans = []
+            for fingerprint in matched_fingerprints:
+                qspans.extend(qspans_by_fingerprint[bytes(fingerprint)])
 
-                match_detections.append(match)
-                prev_ipackage = match.ipackage
-                prev_iresource = match.iresource
-
-        if match_detections:
-            # we are out of the loop but not reported what was left over
-            match_detections = merge_matches(match_detections)
             mds = []
-            for match_detection in match_detections:
-                m = match_detection.qspan.subspans()
-                mds.extend(m)
-            m = ResourceSnippetMatch(
-                package=prev_ipackage,
-                resource=prev_iresource,
-                similarity=abs(similarity),
-                match_detections=mds,
+            for qspan in merge_spans(qspans):
+                mds.extend(qspan.subspans())
+
+            resource = resources_by_id[resource_id]
+            final_matches.append(
+                ResourceSnippetMatch(
+                    package=resource.package,
+                    resource=resource,
+                    similarity=jc,
+                    match_detections=mds,
+                )
             )
-            final_matches.append(m)
 
+        # Report the most similar Resources first, then the Resources matched
+        # earliest in the query
+        def sorter(match):
+            return -match.similarity, match.match_detections[0].start, match.resource.id
+
+        final_matches.sort(key=sorter)
         return final_matches[:top]
 
 
 class SnippetIndex(BaseSnippetIndexMixin, models.Model):
-    pass
+    resource_count_field = "snippets_count"
 
 
 class StemmedSnippetIndex(BaseSnippetIndexMixin, models.Model):
-    pass
+    resource_count_field = "stemmed_snippets_count"
 
 
 class ApproximateFileIndex(ApproximateMatchingHashMixin, models.Model):
@@ -20,8 +20,10 @@
 # ScanCode.io is a free software code scanning tool from nexB Inc. and others.
 # Visit https://github.com/aboutcode-org/scancode.io for support and download.
 
+from collections import OrderedDict
 from collections import defaultdict
 
+from django.db import transaction
 from django.db.models import Q
 from django.template.defaultfilters import pluralize
 
@@ -103,69 +105,152 @@ def create_package_from_purldb_data(project, resources, package_data, status):
     return package, matched_resources_count
 
 
-def match_purldb_package(project, resources_by_sha1, enhance_package_data=True, **kwargs):
+# Maximum number of serialized Packages kept in a PackageDataCache
+PACKAGE_DATA_CACHE_MAX_SIZE = 10000
+
+
+class PackageDataCache:
     """
-    Given a mapping of lists of CodebaseResources by their sha1 values,
-    `resources_by_sha1`, send those sha1 values to purldb packages API endpoint,
-    process the matched Package data, then return the number of
-    CodebaseResources that were matched to a Package.
+    A size-bounded cache of the serialized data of PurlDB Packages, keyed by
+    Package id, used for the duration of a matching run.
+
+    Many CodebaseResources of a project are usually matched to the same few
+    Packages, so this avoids serializing the same Package for every match.
+    The least recently used Packages are evicted once `max_size` is reached.
+    """
+
+    def __init__(self, max_size=PACKAGE_DATA_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self.package_data_by_package_id = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.package_data_by_package_id)
+
+    def get_many(self, package_ids):
+        """
+        Return a mapping of {package id: package data} for the Packages with
+        `package_ids`. The Packages that are not cached yet are fetched and
+        serialized in bulk.
+        """
+        package_data_by_package_id = {}
+        missing_package_ids = []
+        for package_id in set(package_ids):
+            package_data = self.package_data_by_package_id.get(package_id)
+            if package_data is None:
+                missing_package_ids.append(package_id)
+                continue
+            self.package_data_by_package_id.move_to_end(package_id)
+            package_data_by_package_id[package_id] = package_data
+
+        self.hits += len(package_data_by_package_id)
+        self.misses += len(missing_package_ids)
+
+        if missing_package_ids:
+            packages = Package.objects.filter(pk__in=missing_package_ids).prefetch_related(
+                "dependencies", "parties", "package_sets__packages"
+            )
+            for package in packages:
+                package_data = package.to_dict()
+                package_data_by_package_id[package.pk] = package_data
+                self.add(package.pk, package_data)
+
+        return package_data_by_package_id
+
+    def add(self, package_id, package_data):
+        """Cache the `package_data` of the Package with `package_id`."""
+        self.package_data_by_package_id[package_id] = package_data
+        self.package_data_by_package_id.move_to_end(package_id)
+        while len(self.package_data_by_package_id) > self.max_size:
+            self.package_data_by_package_id.popitem(last=False)
+
+    def get_stats_message(self):
+        return (
+            f"Package data cache: {self.hits:,d} hits, {self.misses:,d} misses, "
+            f"{len(self):,d} cached Packages"
+        )
+
+
+def match_sha1s_to_packages(
+    project, sha1s_and_package_ids, resources_by_sha1, package_data_cache, status
+):
     """
+    Create DiscoveredPackages for the CodebaseResources of `resources_by_sha1`
+    from the list of (sha1, PurlDB Package id) tuples `sha1s_and_package_ids`
+    and return the number of CodebaseResources that were matched to a Package.
+    """
+    if package_data_cache is None:
+        package_data_cache = PackageDataCache()
+    package_data_by_package_id = package_data_cache.get_many(
+        package_id for _, package_id in sha1s_and_package_ids
+    )
+
     match_count = 0
-    sha1_list = list(resources_by_sha1.keys())
-    results = Package.objects.filter(sha1__in=sha1_list).order_by()
-    # Process matched Package data
-    for package in results:
-        package_data = package.to_dict()
-        sha1 = package_data["sha1"]
+    for sha1, package_id in sha1s_and_package_ids:
         resources = resources_by_sha1.get(sha1) or []
-        if not resources:
+        package_data = package_data_by_package_id.get(package_id)
+        if not (resources and package_data):
             continue
         _, matched_resources_count = create_package_from_purldb_data(
             project=project,
             resources=resources,
             package_data=package_data,
-            status=flag.MATCHED_TO_PURLDB_PACKAGE,
+            status=status,
         )
         match_count += matched_resources_count
     return match_count
 
 
-def match_purldb_resource(project, resources_by_sha1, package_data_by_purldb_urls=None, **kwargs):
+def match_purldb_package(
+    project, resources_by_sha1, package_data_cache=None, enhance_package_data=True, **kwargs
+):
     """
     Given a mapping of lists of CodebaseResources by their sha1 values,
-    `resources_by_sha1`, send those sha1 values to purldb resources API
-    endpoint, process the matched Package data, then return the number of
+    `resources_by_sha1`, look up those sha1 values in the PurlDB Packages,
+    process the matched Package data, then return the number of
     CodebaseResources that were matched to a Package.
 
-    `package_data_by_purldb_urls` is a mapping of package data by their purldb
-    package instance URLs. This is intended to be used as a cache, to avoid
-    retrieving package data we retrieved before.
+    `package_data_cache` is an optional PackageDataCache used to avoid
+    serializing Packages we serialized before.
     """
-    package_data_by_purldb_urls = package_data_by_purldb_urls or {}
-    match_count = 0
     sha1_list = list(resources_by_sha1.keys())
-    results = (
+    sha1s_and_package_ids = list(
+        Package.objects.filter(sha1__in=sha1_list).order_by().values_list("sha1", "id")
+    )
+    return match_sha1s_to_packages(
+        project=project,
+        sha1s_and_package_ids=sha1s_and_package_ids,
+        resources_by_sha1=resources_by_sha1,
+        package_data_cache=package_data_cache,
+        status=flag.MATCHED_TO_PURLDB_PACKAGE,
+    )
+
+
+def match_purldb_resource(project, resources_by_sha1, package_data_cache=None, **kwargs):
+    """
+    Given a mapping of lists of CodebaseResources by their sha1 values,
+    `resources_by_sha1`, look up those sha1 values in the PurlDB Resources,
+    process the matched Package data, then return the number of
+    CodebaseResources that were matched to a Package.
+
+    `package_data_cache` is an optional PackageDataCache used to avoid
+    serializing Packages we serialized before.
+    """
+    sha1_list = list(resources_by_sha1.keys())
+    sha1s_and_package_ids = list(
         Resource.objects.filter(sha1__in=sha1_list)
-        .select_related("package")
-        .only("package__uuid")
         .order_by()
+        .values_list("sha1", "package_id")
+        .distinct()
+    )
+    return match_sha1s_to_packages(
+        project=project,
+        sha1s_and_package_ids=sha1s_and_package_ids,
+        resources_by_sha1=resources_by_sha1,
+        package_data_cache=package_data_cache,
+        status=flag.MATCHED_TO_PURLDB_RESOURCE,
     )
-    # Process match results
-    for resource in results:
-        # Get package data
-        package_data = resource.package.to_dict()
-        sha1 = resource.sha1
-        resources = resources_by_sha1.get(sha1) or []
-        if not resources:
-            continue
-        _, matched_resources_count = create_package_from_purldb_data(
-            project=project,
-            resources=resources,
-            package_data=package_data,
-            status=flag.MATCHED_TO_PURLDB_RESOURCE,
-        )
-        match_count += matched_resources_count
-    return match_count
 
 
 def match_purldb_resource_approximately(project, resource):
@@ -182,6 +267,24 @@ def match_purldb_resource_approximately(project, resource):
         )
 
 
+def match_purldb_resources_approximately_many(project, resources):
+    """Match by approximation a list of resources in the PurlDB."""
+    fingerprints = [resource.extra_data.get("halo1", "") for resource in resources]
+    results_by_resource = ApproximateResourceContentIndex.match_many(
+        fingerprints=fingerprints, resources=resources
+    )
+    for resource, results in zip(resources, results_by_resource):
+        if not results:
+            continue
+        package_data = results[0].package.to_dict()
+        create_package_from_purldb_data(
+            project,
+            [resource],
+            package_data,
+            flag.APPROXIMATE_MATCHED_TO_PURLDB_RESOURCE,
+        )
+
+
 def match_purldb_resource_snippets(project, resource):
     """Match by approximation a single resource in the PurlDB."""
     fingerprints = resource.extra_data.get("snippets", "")
@@ -239,7 +342,49 @@ def match_purldb_directory(project, resource, exact_match=False):
         )
 
 
-def match_sha1s_to_purldb(project, resources_by_sha1, matcher_func, package_data_by_purldb_urls):
+def is_under_directories(path, directory_paths):
+    """Return True if `path` is one of or is under one of the `directory_paths` set."""
+    segments = path.split("/")
+    return any(
+        "/".join(segments[:depth]) in directory_paths for depth in range(1, len(segments) + 1)
+    )
+
+
+def match_purldb_directories_many(
+    project, directories, exact_match=False, matched_directory_paths=None
+):
+    """
+    Match a list of directory resources sorted by path in the PurlDB.
+
+    `matched_directory_paths` is a set of the paths of the directories matched
+    so far and it is updated with new matches. The directories under these are
+    already part of a matched Package and are not matched again.
+    """
+    if matched_directory_paths is None:
+        matched_directory_paths = set()
+
+    directories = [
+        directory
+        for directory in directories
+        if directory.status != flag.MATCHED_TO_PURLDB_DIRECTORY
+        and not is_under_directories(directory.path, matched_directory_paths)
+    ]
+    fingerprints = [directory.extra_data.get("directory_content", "") for directory in directories]
+    results_by_directory = ApproximateDirectoryContentIndex.match_many(
+        fingerprints=fingerprints, resources=directories, exact_match=exact_match
+    )
+    for directory, results in zip(directories, results_by_directory):
+        # A parent directory may have been matched earlier in this batch
+        if not results or is_under_directories(directory.path, matched_directory_paths):
+            continue
+        package_data = results[0].package.to_dict()
+        create_package_from_purldb_data(
+            project, [directory], package_data, flag.MATCHED_TO_PURLDB_DIRECTORY
+        )
+        matched_directory_paths.add(directory.path)
+
+
+def match_sha1s_to_purldb(project, resources_by_sha1, matcher_func, package_data_cache):
     """
     Process `resources_by_sha1` with `matcher_func` and return a 3-tuple
     containing an empty defaultdict(list), the number of matches and the number
@@ -248,7 +393,7 @@ def match_sha1s_to_purldb(project, resources_by_sha1, matcher_func, package_data
     matched_count = matcher_func(
         project=project,
         resources_by_sha1=resources_by_sha1,
-        package_data_by_purldb_urls=package_data_by_purldb_urls,
+        package_data_cache=package_data_cache,
     )
     sha1_count = len(resources_by_sha1)
     # Clear out resources_by_sha1 when we are done with the current batch of
@@ -299,7 +444,7 @@ def _match_purldb_resources(project, resources, matcher_func, chunk_size=1000, l
     total_sha1_count = 0
     processed_resources_count = 0
     resources_by_sha1 = defaultdict(list)
-    package_data_by_purldb_urls = {}
+    package_data_cache = PackageDataCache()
 
     for to_resource in progress.iter(resource_iterator):
         resources_by_sha1[to_resource.sha1].append(to_resource)
@@ -313,7 +458,7 @@ def _match_purldb_resources(project, resources, matcher_func, chunk_size=1000, l
                 project=project,
                 resources_by_sha1=resources_by_sha1,
                 matcher_func=matcher_func,
-                package_data_by_purldb_urls=package_data_by_purldb_urls,
+                package_data_cache=package_data_cache,
             )
             total_matched_count += matched_count
             total_sha1_count += sha1_count
@@ -323,17 +468,20 @@ def _match_purldb_resources(project, resources, matcher_func, chunk_size=1000, l
             project=project,
             resources_by_sha1=resources_by_sha1,
             matcher_func=matcher_func,
-            package_data_by_purldb_urls=package_data_by_purldb_urls,
+            package_data_cache=package_data_cache,
         )
         total_matched_count += matched_count
         total_sha1_count += sha1_count
 
-    logger(
-        f"{total_matched_count:,d} resources matched in PurlDB using {total_sha1_count:,d} SHA1s"
-    )
+    if logger:
+        logger(
+            f"{total_matched_count:,d} resources matched in PurlDB "
+            f"using {total_sha1_count:,d} SHA1s"
+        )
+        logger(package_data_cache.get_stats_message())
 
 
-def match_purldb_resources_approximately(project, logger=None):
+def match_purldb_resources_approximately(project, chunk_size=1000, logger=None):
     # Get table of resources to match on
     resources = (
         project.codebaseresources.filter(is_text=True)
@@ -351,12 +499,16 @@ def match_purldb_resources_approximately(project, logger=None):
 
     resource_iterator = resources.iterator(chunk_size=2000)
     progress = LoopProgress(resource_count, logger)
+    resources_to_match = []
 
     for resource in progress.iter(resource_iterator):
-        match_purldb_resource_approximately(
-            project,
-            resource,
-        )
+        resources_to_match.append(resource)
+        if len(resources_to_match) >= chunk_size:
+            match_purldb_resources_approximately_many(project, resources_to_match)
+            resources_to_match = []
+
+    if resources_to_match:
+        match_purldb_resources_approximately_many(project, resources_to_match)
 
     matched_count = project.codebaseresources.filter(
         status=flag.APPROXIMATE_MATCHED_TO_PURLDB_RESOURCE
@@ -429,7 +581,7 @@ def match_purldb_resources_stemmed_snippets(project, logger=None):
     )
 
 
-def match_purldb_directories(project, exact_directory_match=False, logger=None):
+def match_purldb_directories(project, exact_directory_match=False, chunk_size=1000, logger=None):
     """Match directory CodebaseResources from `project` against the PurlDB."""
     # If we are able to get match results for a directory fingerprint, then that
     # means every resource and directory under that directory is part of a
@@ -452,11 +604,27 @@ def match_purldb_directories(project, exact_directory_match=False, logger=None):
 
     directory_iterator = directories.iterator(chunk_size=2000)
     progress = LoopProgress(directory_count, logger)
+    matched_directory_paths = set()
+    directories_to_match = []
 
     for directory in progress.iter(directory_iterator):
-        directory.refresh_from_db()
-        if directory.status != flag.MATCHED_TO_PURLDB_DIRECTORY:
-            match_purldb_directory(project, directory, exact_directory_match)
+        directories_to_match.append(directory)
+        if len(directories_to_match) >= chunk_size:
+            match_purldb_directories_many(
+                project=project,
+                directories=directories_to_match,
+                exact_match=exact_directory_match,
+                matched_directory_paths=matched_directory_paths,
+            )
+            directories_to_match = []
+
+    if directories_to_match:
+        match_purldb_directories_many(
+            project=project,
+            directories=directories_to_match,
+            exact_match=exact_directory_match,
+            matched_directory_paths=matched_directory_paths,
+        )
 
     matched_count = (
         project.codebaseresources.directories()
@@ -466,64 +634,143 @@ def match_purldb_directories(project, exact_directory_match=False, logger=None):
     logger(f"{matched_count:,d} director{pluralize(matched_count, 'y,ies')} matched in PurlDB")
 
 
-def match_purldb_resources_post_process(project, logger=None):
-    """Choose the best package for PurlDB matched resources."""
+def match_purldb_resources_post_process(project, logger=None, batch_size=10000):
+    """
+    Choose the best package for PurlDB matched resources.
+
+    The resources and their packages are loaded once and the best package of
+    the resources of each extract directory is computed in memory. The
+    resulting package assignments are then written in bulk.
+    """
     extract_directories = project.codebaseresources.directories().filter(
         path__regex=r"^.*-extract$"
     )
+    extract_directory_paths = list(extract_directories.values_list("path", flat=True))
 
     resources = project.codebaseresources.files().filter(status=flag.MATCHED_TO_PURLDB_RESOURCE)
 
-    resource_count = extract_directories.count()
+    resource_count = len(extract_directory_paths)
 
     if logger:
         logger(
             f"Refining matching for {resource_count:,d} {flag.MATCHED_TO_PURLDB_RESOURCE} archives."
         )
 
-    resource_iterator = extract_directories.iterator(chunk_size=2000)
+    # Collect the resources of each extract directory, excluding the content
+    # of nested archives.
+    resource_ids_by_directory_path = defaultdict(list)
+    extract_directory_paths_set = set(extract_directory_paths)
+    for resource_id, path in resources.values_list("id", "path"):
+        for directory_path in get_extract_directory_paths(path, extract_directory_paths_set):
+            resource_ids_by_directory_path[directory_path].append(resource_id)
+
+    through_model = resources.model.discovered_packages.through
+    package_ids_by_resource_id = defaultdict(list)
+    resource_ids_and_package_ids = (
+        through_model.objects.filter(codebaseresource__in=resources)
+        .order_by("codebaseresource__path", "discoveredpackage__uuid")
+        .values_list("codebaseresource_id", "discoveredpackage_id")
+    )
+    for resource_id, package_id in resource_ids_and_package_ids.iterator(chunk_size=batch_size):
+        package_ids_by_resource_id[resource_id].append(package_id)
+
     progress = LoopProgress(resource_count, logger)
     map_count = 0
+    best_package_id_by_resource_id = {}
 
-    for directory in progress.iter(resource_iterator):
-        map_count += _match_purldb_resources_post_process(directory.path, resources)
+    for directory_path in progress.iter(extract_directory_paths):
+        resource_ids = resource_ids_by_directory_path.get(directory_path)
+        if not resource_ids:
+            continue
+        best_package_id_by_resource_id.update(
+            _match_purldb_resources_post_process(resource_ids, package_ids_by_resource_id)
+        )
+        map_count += len(resource_ids)
 
-    logger(f"{map_count:,d} resource processed")
+    update_resources_discovered_package(
+        through_model=through_model,
+        best_package_id_by_resource_id=best_package_id_by_resource_id,
+        batch_size=batch_size,
+    )
 
+    if logger:
+        logger(f"{map_count:,d} resource processed")
 
-def _match_purldb_resources_post_process(directory_path, codebase_resources):
-    # Exclude the content of nested archive.
-    interesting_codebase_resources = (
-        codebase_resources.filter(path__startswith=directory_path)
-        .filter(status=flag.MATCHED_TO_PURLDB_RESOURCE)
-        .exclude(path__regex=rf"^{directory_path}.*-extract\/.*$")
-    )
 
-    if not interesting_codebase_resources:
-        return 0
+def get_extract_directory_paths(path, extract_directory_paths):
+    """
+    Return a list of the paths of the `extract_directory_paths` set that
+    contain the resource `path`, without it being part of a nested archive
+    extracted in one of their subdirectories.
+    """
+    directory_paths = []
+    start = 0
+    while (index := path.find("-extract", start)) != -1:
+        start = index + len("-extract")
+        directory_path = path[:start]
+        if directory_path in extract_directory_paths and "-extract/" not in path[start:]:
+            directory_paths.append(directory_path)
+    return directory_paths
+
 
-    packages_map = {}
+def _match_purldb_resources_post_process(resource_ids, package_ids_by_resource_id):
+    """
+    Return a mapping of {resource id: package id} of the best package for the
+    resources with `resource_ids` that are not assigned to that package alone
+    yet, using the lists of package ids of `package_ids_by_resource_id`, which
+    is updated with this choice.
 
-    for resource in interesting_codebase_resources:
-        for package in resource.discovered_packages.all():
-            if package in packages_map:
-                packages_map[package].append(resource)
-            else:
-                packages_map[package] = [resource]
+    The best package of a resource is its package with the most number of
+    matched resources amongst `resource_ids`.
+    """
+    resource_ids_by_package_id = {}
+    for resource_id in resource_ids:
+        for package_id in package_ids_by_resource_id.get(resource_id, []):
+            resource_ids_by_package_id.setdefault(package_id, []).append(resource_id)
 
     # Rank the packages by most number of matched resources.
-    ranked_packages = dict(
-        sorted(packages_map.items(), key=lambda item: len(item[1]), reverse=True)
+    ranked_package_ids = sorted(
+        resource_ids_by_package_id,
+        key=lambda package_id: len(resource_ids_by_package_id[package_id]),
+        reverse=True,
     )
 
-    for resource in interesting_codebase_resources:
-        resource.discovered_packages.clear()
+    best_package_id_by_resource_id = {}
+    for package_id in ranked_package_ids:
+        for resource_id in resource_ids_by_package_id[package_id]:
+            if resource_id not in best_package_id_by_resource_id:
+                best_package_id_by_resource_id[resource_id] = package_id
 
-    for package, resources in ranked_packages.items():
-        unmapped_resources = [
-            resource for resource in resources if not resource.discovered_packages.exists()
-        ]
-        if unmapped_resources:
-            package.add_resources(unmapped_resources)
+    # Only keep the resources that are not already assigned to their best
+    # package alone.
+    changed_package_id_by_resource_id = {}
+    for resource_id, package_id in best_package_id_by_resource_id.items():
+        if package_ids_by_resource_id[resource_id] != [package_id]:
+            package_ids_by_resource_id[resource_id] = [package_id]
+            changed_package_id_by_resource_id[resource_id] = package_id
 
-    return interesting_codebase_resources.count()
+    return changed_package_id_by_resource_id
+
+
+def update_resources_discovered_package(
+    through_model, best_package_id_by_resource_id, batch_size=10000
+):
+    """
+    Make the package of each resource id of `best_package_id_by_resource_id`
+    the only DiscoveredPackage of that CodebaseResource, using bulk deletes and
+    inserts on the `through_model` of the CodebaseResource-DiscoveredPackage
+    relationship.
+    """
+    items = list(best_package_id_by_resource_id.items())
+    with transaction.atomic():
+        for start in range(0, len(items), batch_size):
+            batch = items[start : start + batch_size]
+            through_model.objects.filter(
+                codebaseresource_id__in=[resource_id for resource_id, _ in batch]
+            ).delete()
+            through_model.objects.bulk_create(
+                [
+                    through_model(codebaseresource_id=resource_id, discoveredpackage_id=package_id)
+                    for resource_id, package_id in batch
+                ]
+            )
@@ -8,6 +8,9 @@
 #
 
 import os
+from unittest import skipUnless
+
+from django.test import override_settings
 
 import attr
 from commoncode.resource import VirtualCodebase
@@ -15,7 +18,9 @@ from licensedcode.spans import Span
 from matchcode_toolkit.fingerprinting import compute_codebase_directory_fingerprints
 from matchcode_toolkit.fingerprinting import get_file_fingerprint_hashes
 from matchcode_toolkit.fingerprinting import hexstring_to_binarray
+from matchcode_toolkit.fingerprinting import split_fingerprint
 
+from matchcode import bah128_index
 from matchcode.models import ApproximateDirectoryContentIndex
 from matchcode.models import ApproximateDirectoryStructureIndex
 from matchcode.models import ApproximateResourceContentIndex
@@ -307,6 +312,25 @@ class ApproximateDirectoryMatchingIndexModelTestCase(MatchcodeTestCase):
         )
         self.check_codebase(codebase, expected, regen=FIXTURES_REGEN)
 
+    def test_ApproximateDirectoryContentIndex_match_many(self):
+        scan_location = self.get_test_loc("models/directory-matching/async-0.2.9-i.json")
+        vc = VirtualCodebase(location=scan_location)
+        codebase = compute_codebase_directory_fingerprints(vc)
+        directories = [resource for resource in codebase.walk(topdown=True) if not resource.is_file]
+        fingerprints = [d.extra_data.get("directory_content", "") for d in directories]
+
+        results = ApproximateDirectoryContentIndex.match_many(
+            fingerprints=fingerprints, resources=directories
+        )
+        self.assertEqual(len(directories), len(results))
+        for fingerprint, directory, matches in zip(fingerprints, directories, results):
+            expected = ApproximateDirectoryContentIndex.match(
+                fingerprint=fingerprint, resource=directory
+            )
+            self.assertEqual(
+                sorted(match.pk for match in expected), sorted(match.pk for match in matches)
+            )
+
 
 class ApproximateResourceMatchingIndexModelTestCase(MatchcodeTestCase):
     BASE_DIR = os.path.join(os.path.dirname(__file__), "testfiles")
@@ -415,6 +439,234 @@ class ApproximateResourceMatchingIndexModelTestCase(MatchcodeTestCase):
         )
         self.check_expected_results(results, expected_results_loc, regen=FIXTURES_REGEN)
 
+    def test_ApproximateResourceContentIndex_match_many(self):
+        test_file_loc = self.get_test_loc("match/approximate-file-matching/index-modified.js")
+        fingerprints = get_file_fingerprint_hashes(test_file_loc)
+        fp = fingerprints["halo1"]
+        results = ApproximateResourceContentIndex.match_many(["", fp])
+        self.assertEqual([], results[0])
+        expected = ApproximateResourceContentIndex.match(fp)
+        self.assertEqual(
+            sorted(match.pk for match in expected), sorted(match.pk for match in results[1])
+        )
+
+    def test_ApproximateResourceContentIndex_match_many_exact_match(self):
+        results = ApproximateResourceContentIndex.match_many(
+            [self.test_resource_fingerprint, "000018fba23a49e4cd40718d1297be719e6564a5"],
+            exact_match=True,
+        )
+        expected = ApproximateResourceContentIndex.objects.get(
+            package=self.test_package, path=self.test_resource.path
+        )
+        self.assertEqual([[expected], []], results)
+
+    def test_ApproximateResourceContentIndex_match_many_uses_range_of_each_query(self):
+        # The same fingerprint with a very different indexed elements count
+        _, bah128 = split_fingerprint(self.test_resource_fingerprint)
+        small_fingerprint = f"00000001{bah128}"
+        results = ApproximateResourceContentIndex.match_many(
+            [small_fingerprint, self.test_resource_fingerprint]
+        )
+        expected = ApproximateResourceContentIndex.objects.get(
+            package=self.test_package, path=self.test_resource.path
+        )
+        self.assertEqual([], results[0])
+        self.assertIn(expected, results[1])
+
+    def test_ApproximateResourceContentIndex_rank_matches(self):
+        other_package, _ = Package.objects.get_or_create(
+            filename="inflate-other.tar.gz",
+            sha1="feeddead",
+            type="generic",
+            name="inflate-other",
+            version="1.0.0",
+            download_url="inflate.com/inflate-other.tar.gz",
+        )
+        for path, size in [("inflate.c", 50000), ("inflate2.c", 55466)]:
+            Resource.objects.create(
+                path=path, name=path, size=size, is_file=True, package=other_package
+            )
+            ApproximateResourceContentIndex.index(
+                self.test_resource_fingerprint, path, other_package
+            )
+
+        matches = list(
+            ApproximateResourceContentIndex.objects.filter(
+                package__in=[self.test_package, other_package]
+            )
+        )
+        resource = Resource(path="src/inflate.c", name="inflate.c", size=55466)
+        with self.assertNumQueries(1):
+            ranked_matches = ApproximateResourceContentIndex.rank_matches([(0, matches)], resource)
+        expected = ApproximateResourceContentIndex.objects.get(
+            package=self.test_package, path=self.test_resource.path
+        )
+        self.assertEqual([expected], ranked_matches)
+
+        # Only the matches with the lowest Hamming distance are ranked
+        ranked_matches = ApproximateResourceContentIndex.rank_matches(
+            [(0, [matches[-1]]), (1, matches[:-1])], resource
+        )
+        self.assertEqual([matches[-1]], ranked_matches)
+
+
+@skipUnless(bah128_index.np, "NumPy is required for the resident index")
+class BAH128IndexTestCase(MatchcodeTestCase):
+    BASE_DIR = os.path.join(os.path.dirname(__file__), "testfiles")
+
+    def setUp(self):
+        super(MatchcodeTestCase, self).setUp()
+
+        self.test_package, _ = Package.objects.get_or_create(
+            filename="inflate.tar.gz",
+            sha1="deadfeed",
+            type="generic",
+            name="inflate",
+            version="1.0.0",
+            download_url="inflate.com/inflate.tar.gz",
+        )
+        self.test_resource, _ = Resource.objects.get_or_create(
+            path="inflate.c", name="inflate.c", size=55466, package=self.test_package
+        )
+        self.test_resource_fingerprint = "000018fba23a49e4cd40718d1297be719e6564a4"
+        ApproximateResourceContentIndex.index(
+            self.test_resource_fingerprint, self.test_resource.path, self.test_package
+        )
+
+        self.test_package1, _ = Package.objects.get_or_create(
+            filename="deep-equal-1.0.1.tgz",
+            sha1="f5d260292b660e084eff4cdbc9f08ad3247448b5",
+            type="npm",
+            name="deep-equal",
+            version="1.0.1",
+            download_url="https://registry.npmjs.org/deep-equal/-/deep-equal-1.0.1.tgz",
+        )
+        self.test_resource1, _ = Resource.objects.get_or_create(
+            path="package/index.js",
+            name="index",
+            extension="js",
+            package=self.test_package1,
+        )
+        test_resource1_loc = self.get_test_loc("match/approximate-file-matching/index.js")
+        fingerprints = get_file_fingerprint_hashes(test_resource1_loc)
+        ApproximateResourceContentIndex.index(
+            fingerprints["halo1"],
+            self.test_resource1.path,
+            self.test_package1,
+        )
+
+    def tearDown(self):
+        bah128_index.RESIDENT_INDEX_BY_MODEL.clear()
+        super().tearDown()
+
+    def test_BAH128Index_match(self):
+        resident_index = bah128_index.BAH128Index(ApproximateResourceContentIndex)
+        self.assertEqual(2, resident_index.refresh())
+        self.assertEqual(0, resident_index.refresh())
+
+        _, bah128 = split_fingerprint(self.test_resource_fingerprint)
+        expected = ApproximateResourceContentIndex.objects.get(
+            package=self.test_package, path=self.test_resource.path
+        )
+        self.assertEqual([(0, expected.pk)], resident_index.match(bah128))
+        self.assertEqual((0, expected.pk), resident_index.top_k(bah128, k=1)[0])
+
+        ApproximateResourceContentIndex.index(
+            "000018fba23a49e4cd40718d1297be719e6564a5", "foo/bar", self.test_package
+        )
+        self.assertEqual(1, resident_index.refresh())
+        self.assertEqual(2, len(resident_index.match(bah128)))
+
+    def test_BAH128Index_refresh_by_chunks(self):
+        resident_index = bah128_index.BAH128Index(ApproximateResourceContentIndex)
+        self.assertEqual(2, resident_index.refresh(chunk_size=1))
+        expected_ids = list(
+            ApproximateResourceContentIndex.objects.order_by("id").values_list("id", flat=True)
+        )
+        self.assertEqual(expected_ids, resident_index.ids.tolist())
+        self.assertEqual(expected_ids[-1], resident_index.max_id)
+
+        _, bah128 = split_fingerprint(self.test_resource_fingerprint)
+        self.assertEqual([(0, expected_ids[0])], resident_index.match(bah128))
+
+    def test_BAH128Index_refresh_loads_rows_created_with_lower_ids(self):
+        resident_index = bah128_index.BAH128Index(ApproximateResourceContentIndex)
+        self.assertEqual(2, resident_index.refresh())
+        max_id = resident_index.max_id
+
+        higher, _ = ApproximateResourceContentIndex.index(
+            "000018fba23a49e4cd40718d1297be719e6564a5", "foo/higher", self.test_package
+        )
+        ApproximateResourceContentIndex.objects.filter(pk=higher.pk).update(id=max_id + 10)
+        self.assertEqual(1, resident_index.refresh())
+        self.assertEqual(max_id + 10, resident_index.max_id)
+
+        # A row of a transaction that commits after the row with a higher id
+        lower, _ = ApproximateResourceContentIndex.index(
+            "000018fba23a49e4cd40718d1297be719e6564a6", "foo/lower", self.test_package
+        )
+        ApproximateResourceContentIndex.objects.filter(pk=lower.pk).update(id=max_id + 5)
+        self.assertEqual(1, resident_index.refresh())
+        self.assertEqual(0, resident_index.refresh())
+
+        expected_ids = list(
+            ApproximateResourceContentIndex.objects.order_by("id").values_list("id", flat=True)
+        )
+        self.assertEqual(expected_ids, sorted(resident_index.ids.tolist()))
+
+    def test_BAH128Index_reload_drops_deleted_rows(self):
+        resident_index = bah128_index.BAH128Index(ApproximateResourceContentIndex)
+        self.assertEqual(2, resident_index.refresh())
+
+        ApproximateResourceContentIndex.objects.filter(package=self.test_package).delete()
+        self.assertEqual(0, resident_index.refresh())
+        self.assertEqual(2, len(resident_index))
+
+        self.assertEqual(1, resident_index.reload())
+        expected_ids = list(ApproximateResourceContentIndex.objects.values_list("id", flat=True))
+        self.assertEqual(expected_ids, resident_index.ids.tolist())
+        _, bah128 = split_fingerprint(self.test_resource_fingerprint)
+        self.assertEqual([], resident_index.match(bah128))
+
+    @override_settings(MATCHCODE_RESIDENT_INDEX=True)
+    def test_update_resident_index_refreshes_on_commit(self):
+        resident_index = bah128_index.get_resident_index(ApproximateResourceContentIndex)
+        self.assertEqual(2, len(resident_index))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            ApproximateResourceContentIndex.index(
+                "000018fba23a49e4cd40718d1297be719e6564a5", "foo/bar", self.test_package
+            )
+            self.assertEqual(2, len(resident_index))
+        self.assertEqual(1, len(callbacks))
+        self.assertEqual(3, len(resident_index))
+
+    def test_load_resident_indexes(self):
+        bah128_index.load_resident_indexes()
+        self.assertEqual({}, bah128_index.RESIDENT_INDEX_BY_MODEL)
+
+        with override_settings(MATCHCODE_RESIDENT_INDEX=True):
+            bah128_index.load_resident_indexes()
+        loaded = bah128_index.RESIDENT_INDEX_BY_MODEL
+        self.assertEqual(
+            sorted(bah128_index.RESIDENT_INDEX_MODEL_NAMES),
+            sorted(model.__name__ for model in loaded),
+        )
+        self.assertEqual(2, len(loaded[ApproximateResourceContentIndex]))
+
+    @override_settings(MATCHCODE_RESIDENT_INDEX=True)
+    def test_ApproximateResourceContentIndex_match_with_resident_index(self):
+        test_file_loc = self.get_test_loc("match/approximate-file-matching/index-modified.js")
+        fingerprints = get_file_fingerprint_hashes(test_file_loc)
+        fp = fingerprints["halo1"]
+        matches = ApproximateResourceContentIndex.match(fp)
+        self.assertIn(ApproximateResourceContentIndex, bah128_index.RESIDENT_INDEX_BY_MODEL)
+        results = [match.package.to_dict() for match in matches]
+        expected_results_loc = self.get_test_loc(
+            "match/approximate-file-matching/index-modified.js-expected.json"
+        )
+        self.check_expected_results(results, expected_results_loc, regen=FIXTURES_REGEN)
+
 
 class MatchcodeModelUtilsTestCase(MatchcodeTestCase):
     def test_create_halohash_chunks(self):
@@ -647,7 +899,7 @@ class SnippetIndexTestCase(MatchcodeTestCase):
         assert match.package == self.test_package2
         expected_detections = [Span(0, 651), Span(659, 774), Span(780, 6093)]
         assert match.match_detections == expected_detections
-        assert match.similarity == 0.9286452947259566
+        assert match.similarity == 0.9375
 
     def test_SnippetIndexTestCase_match_resource_return_only_top_match(self):
         test_file_loc = self.get_test_loc("match/approximate-file-matching/inflate-mod.c")
@@ -663,7 +915,57 @@ class SnippetIndexTestCase(MatchcodeTestCase):
         assert match.package == self.test_package2
         expected_detections = [Span(0, 651), Span(659, 774), Span(780, 6093)]
         assert match.match_detections == expected_detections
-        assert match.similarity == 0.9286452947259566
+        assert match.similarity == 0.9375
+
+    def test_SnippetIndexTestCase_match_resources_with_same_similarity(self):
+        # index a copy of inflate.c: both copies have the same similarity and
+        # their matched query spans interleave
+        test_resource, _ = Resource.objects.get_or_create(
+            path="inflate-copy.c",
+            name="inflate-copy",
+            extension="c",
+            package=self.test_package1,
+        )
+        for snippet in self.test_resource3_snippets:
+            SnippetIndex.index(
+                snippet["snippet"],
+                snippet["position"],
+                test_resource,
+                self.test_package1,
+            )
+
+        test_file_loc = self.get_test_loc("match/approximate-file-matching/inflate-mod.c")
+        fingerprints = get_file_fingerprint_hashes(test_file_loc)
+        matches = SnippetIndex.match_resources(fingerprints=fingerprints["snippets"])
+
+        # there is a single match by Resource
+        resources = [match.resource for match in matches]
+        assert len(resources) == len(set(resources)) == 4
+        similarities = [match.similarity for match in matches]
+        assert similarities == sorted(similarities, reverse=True)
+
+        expected_detections = [Span(0, 651), Span(659, 774), Span(780, 6093)]
+        for match in matches[:2]:
+            assert match.resource in (self.test_resource3, test_resource)
+            assert match.match_detections == expected_detections
+            assert match.similarity == 0.9375
+
+    def test_SnippetIndex_update_resource_counts(self):
+        self.assertIsNone(Resource.objects.get(pk=self.test_resource3.pk).snippets_count)
+        SnippetIndex.update_resource_counts(Resource.objects.all())
+
+        resource3 = Resource.objects.get(pk=self.test_resource3.pk)
+        expected = SnippetIndex.objects.filter(resource=resource3).distinct("fingerprint").count()
+        self.assertEqual(expected, resource3.snippets_count)
+        self.assertEqual(0, resource3.stemmed_snippets_count or 0)
+
+        # Matching with the stored counts gives the same results
+        test_file_loc = self.get_test_loc("match/approximate-file-matching/inflate-mod.c")
+        fingerprints = get_file_fingerprint_hashes(test_file_loc)
+        matches = SnippetIndex.match_resources(fingerprints=fingerprints["snippets"])
+        match = matches[0]
+        assert match.resource == self.test_resource3
+        assert match.similarity == 0.9375
 
     def test_SnippetIndex_match_resources_match_to_resource_with_less_duplicates(self):
         test_file_loc = self.get_test_loc("match/approximate-file-matching/index-modified.js")
@@ -689,4 +991,4 @@ class SnippetIndexTestCase(MatchcodeTestCase):
         assert match.package == self.test_package1
         expected_match_detections = [Span(0, 153), Span(167, 398)]
         assert match.match_detections == expected_match_detections
-        assert match.similarity == 0.9206349206349206
+        assert match.similarity == 0.9354838709677419
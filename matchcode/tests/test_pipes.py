@@ -0,0 +1,117 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+from django.test import TestCase
+
+from scanpipe.models import CodebaseResource
+from scanpipe.models import DiscoveredPackage
+from scanpipe.models import Project
+from scanpipe.pipes import flag
+
+from matchcode.pipes import matching
+from matchcode.pipes.matching import PackageDataCache
+from packagedb.models import Package
+
+
+class PackageDataCacheTestCase(TestCase):
+    def setUp(self):
+        self.packages = [
+            Package.objects.create(
+                type="npm",
+                name=f"package{i}",
+                version="1.0.0",
+                download_url=f"https://example.com/package{i}-1.0.0.tgz",
+            )
+            for i in range(3)
+        ]
+
+    def test_PackageDataCache_get_many(self):
+        cache = PackageDataCache()
+        package1, package2, _ = self.packages
+
+        package_data_by_package_id = cache.get_many([package1.pk, package1.pk])
+        self.assertEqual({package1.pk: package1.to_dict()}, package_data_by_package_id)
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+
+        with self.assertNumQueries(4):
+            package_data_by_package_id = cache.get_many([package1.pk, package2.pk])
+        expected = {package1.pk: package1.to_dict(), package2.pk: package2.to_dict()}
+        self.assertEqual(expected, package_data_by_package_id)
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+
+        with self.assertNumQueries(0):
+            cache.get_many([package1.pk, package2.pk])
+        self.assertEqual((3, 2), (cache.hits, cache.misses))
+
+    def test_PackageDataCache_evicts_least_recently_used(self):
+        cache = PackageDataCache(max_size=2)
+        package1, package2, package3 = self.packages
+
+        cache.get_many([package1.pk])
+        cache.get_many([package2.pk])
+        cache.get_many([package1.pk])
+        cache.get_many([package3.pk])
+        self.assertEqual([package1.pk, package3.pk], list(cache.package_data_by_package_id))
+
+
+class MatchPurldbResourcesPostProcessTestCase(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name="post-process")
+        for path in ["a.zip-extract", "a.zip-extract/b.jar-extract"]:
+            CodebaseResource.objects.create(
+                project=self.project, path=path, type=CodebaseResource.Type.DIRECTORY
+            )
+        self.packages = [
+            DiscoveredPackage.objects.create(project=self.project, type="npm", name=name)
+            for name in ["p1", "p2", "p3"]
+        ]
+
+    def create_resource(self, path, packages):
+        resource = CodebaseResource.objects.create(
+            project=self.project,
+            path=path,
+            type=CodebaseResource.Type.FILE,
+            status=flag.MATCHED_TO_PURLDB_RESOURCE,
+        )
+        for package in packages:
+            package.add_resources([resource])
+        return resource
+
+    def test_match_purldb_resources_post_process(self):
+        p1, p2, p3 = self.packages
+        resources_and_packages = {
+            "a.zip-extract/f1": [p1, p2],
+            "a.zip-extract/f2": [p1],
+            "a.zip-extract/f3": [p1, p3],
+            "a.zip-extract/f4": [p2],
+            "a.zip-extract/b.jar-extract/g1": [p2, p3],
+            "a.zip-extract/b.jar-extract/g2": [p3],
+            "c.txt": [p1, p2],
+        }
+        for path, packages in resources_and_packages.items():
+            self.create_resource(path, packages)
+
+        logs = []
+        matching.match_purldb_resources_post_process(self.project, logger=logs.append)
+
+        results = {
+            resource.path: sorted(package.name for package in resource.discovered_packages.all())
+            for resource in self.project.codebaseresources.files()
+        }
+        expected = {
+            "a.zip-extract/f1": ["p1"],
+            "a.zip-extract/f2": ["p1"],
+            "a.zip-extract/f3": ["p1"],
+            "a.zip-extract/f4": ["p2"],
+            "a.zip-extract/b.jar-extract/g1": ["p3"],
+            "a.zip-extract/b.jar-extract/g2": ["p3"],
+            "c.txt": ["p1", "p2"],
+        }
+        self.assertEqual(expected, results)
+        self.assertIn("6 resource processed", logs)
@@ -35,6 +35,7 @@ from minecode.models import PriorityResourceURI
 from minecode.models import ResourceURI
 from minecode.models import ScannableURI
 from minecode.permissions import IsScanQueueWorkerAPIUser
+from minecode.utils import JSONStream
 from minecode.utils import get_temp_file
 from minecode.utils import get_webhook_url
 
@@ -188,31 +189,39 @@ def index_package_scan(request, key):
     endpoint, where `key` is the id of the purldb scan queue worker that has
     been encoded as a secret, save the package scan results and summary to files
     and create a new rq worker task to index the scan results and summary.
-    """
-    try:
-        json_data = json.loads(request.body.decode("utf-8"))
-    except json.JSONDecodeError:
-        raise Http404
 
+    The request body is streamed and the scan results and summary are copied
+    to files without being loaded in memory, as scans of large packages can
+    be several GB.
+    """
     user_id = signing.loads(key)
     User = get_user_model()
     get_object_or_404(User, id=user_id)
 
-    results = json_data.get("results")
-    summary = json_data.get("summary")
-    project_data = json_data.get("project")
-    extra_data = project_data.get("extra_data")
-    scannable_uri_uuid = extra_data.get("scannable_uri_uuid")
-
     # Save results to temporary files
     scan_results_location = get_temp_file(file_name="scan_results", extension=".json")
     scan_summary_location = get_temp_file(file_name="scan_summary", extension=".json")
+    locations_by_key = {
+        "results": scan_results_location,
+        "summary": scan_summary_location,
+    }
 
-    with open(scan_results_location, "w") as f:
-        json.dump(results, f)
+    project_data = {}
+    stream = JSONStream(request)
+    try:
+        for data_key in stream.iter_object_keys():
+            if data_key == "project":
+                project_data = stream.decode_value()
+            elif data_key in locations_by_key:
+                with open(locations_by_key[data_key], "w") as f:
+                    stream.skip_value(output=f)
+            else:
+                stream.skip_value()
+    except json.JSONDecodeError:
+        raise Http404
 
-    with open(scan_summary_location, "w") as f:
-        json.dump(summary, f)
+    extra_data = project_data.get("extra_data")
+    scannable_uri_uuid = extra_data.get("scannable_uri_uuid")
 
     scannable_uri = get_object_or_404(ScannableURI, uuid=scannable_uri_uuid)
     scannable_uri.process_scan_results(
@@ -21,8 +21,7 @@ from packageurl import PackageURL
 
 from minecode import priority_router
 from minecode.miners.maven import build_url_and_filename
-from minecode.miners.maven import get_artifacts
-from minecode.miners.maven import is_worthy_artifact
+from minecode.pipes.maven import get_index_packages
 from minecode.utils import fetch_http
 from minecode.utils import get_temp_file
 from minecode.utils import validate_sha1
@@ -66,71 +65,85 @@ class MavenNexusCollector:
             tmp.write(content)
         return temp_file
 
-    def get_packages(self, content=None):
-        """Yield Package objects from maven index"""
+    def get_packages(self, content=None, max_workers=1, checkpoint=None):
+        """
+        Yield Package objects from maven index.
+
+        With `max_workers` greater than 1, batches of index records are decoded
+        in this many processes. The packages are yielded in the index order
+        either way. The `checkpoint` mapping is updated in place with the index
+        records consumed and is used to resume a previous run on the same index.
+        """
         if content:
             index_location = content
         else:
             index_location = self.fetch_index()
 
-        artifacts = get_artifacts(index_location, worthyness=is_worthy_artifact)
-
-        for artifact in artifacts:
-            # we cannot do much without these
-            group_id = artifact.group_id
-            artifact_id = artifact.artifact_id
-            version = artifact.version
-            extension = artifact.extension
-
-            if not (group_id and artifact_id and version and extension):
-                continue
-
-            qualifiers = {}
-            if extension and extension != "jar":
-                qualifiers["type"] = extension
-
-            classifier = artifact.classifier
-            if classifier:
-                qualifiers["classifier"] = classifier
-
-            # FIXME: also use the Artifact.src_exist flags too?
-
-            # build a URL: This is the real JAR download URL
-            # FIXME: this should be set at the time of creating Artifacts
-            # instead together with the filename... especially we could use
-            # different REPOs.
-            jar_download_url, _ = build_url_and_filename(
-                group_id, artifact_id, version, extension, classifier
-            )
-
-            # FIXME: should this be set in the yielded URI too
-            last_mod = artifact.last_modified
-
-            urls = get_urls(
-                namespace=group_id,
-                name=artifact_id,
-                version=version,
-                qualifiers=qualifiers or None,
-            )
-
-            repository_homepage_url = urls["repository_homepage_url"]
-            repository_download_url = urls["repository_download_url"]
-            api_data_url = urls["api_data_url"]
-
-            yield PackageData(
-                type="maven",
-                namespace=group_id,
-                name=artifact_id,
-                version=version,
-                qualifiers=qualifiers or None,
-                download_url=jar_download_url,
-                size=artifact.size,
-                sha1=artifact.sha1,
-                release_date=last_mod,
-                repository_homepage_url=repository_homepage_url,
-                repository_download_url=repository_download_url,
-                api_data_url=api_data_url,
-            )
+        yield from get_index_packages(
+            locations=[index_location],
+            get_package=get_package_data,
+            max_workers=max_workers,
+            checkpoint=checkpoint,
+        )
+
+
+def get_package_data(artifact):
+    """Return a PackageData for an `artifact` or None if it lacks its coordinates."""
+    # we cannot do much without these
+    group_id = artifact.group_id
+    artifact_id = artifact.artifact_id
+    version = artifact.version
+    extension = artifact.extension
+
+    if not (group_id and artifact_id and version and extension):
+        return
+
+    qualifiers = {}
+    if extension and extension != "jar":
+        qualifiers["type"] = extension
+
+    classifier = artifact.classifier
+    if classifier:
+        qualifiers["classifier"] = classifier
+
+    # FIXME: also use the Artifact.src_exist flags too?
+
+    # build a URL: This is the real JAR download URL
+    # FIXME: this should be set at the time of creating Artifacts
+    # instead together with the filename... especially we could use
+    # different REPOs.
+    jar_download_url, _ = build_url_and_filename(
+        group_id, artifact_id, version, extension, classifier
+    )
+
+    # FIXME: should this be set in the yielded URI too
+    last_mod = artifact.last_modified
+
+    urls = get_urls(
+        namespace=group_id,
+        name=artifact_id,
+        version=version,
+        qualifiers=qualifiers or None,
+    )
+
+    repository_homepage_url = urls["repository_homepage_url"]
+    repository_download_url = urls["repository_download_url"]
+    api_data_url = urls["api_data_url"]
+
+    return PackageData(
+        type="maven",
+        namespace=group_id,
+        name=artifact_id,
+        version=version,
+        qualifiers=qualifiers or None,
+        download_url=jar_download_url,
+        size=artifact.size,
+        sha1=artifact.sha1,
+        release_date=last_mod,
+        repository_homepage_url=repository_homepage_url,
+        repository_download_url=repository_download_url,
+        api_data_url=api_data_url,
+    )
 
 
 def get_pom_text(namespace, name, version, qualifiers={}, base_url=MAVEN_BASE_URL):
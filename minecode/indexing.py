@@ -5,9 +5,14 @@
 import logging
 import sys
 import traceback
+from collections import Counter
+from collections import defaultdict
+
+from django.db import transaction
 
 from packagedcode.utils import combine_expressions
 
+from matchcode.bah128_index import update_resident_index
 from matchcode.models import ApproximateDirectoryContentIndex
 from matchcode.models import ApproximateDirectoryStructureIndex
 from matchcode.models import ApproximateResourceContentIndex
@@ -15,18 +20,204 @@ from matchcode.models import ExactFileIndex
 from matchcode.models import SnippetIndex
 from matchcode.models import StemmedSnippetIndex
 from minecode.management.commands import get_error_message
-from minecode.model_utils import update_or_create_resource
+from minecode.model_utils import build_resource
 from minecode.models import ScannableURI
+from packagedb.models import Resource
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(stream=sys.stdout)
 logger.setLevel(logging.INFO)
 
 
+# Number of rows written per INSERT statement when bulk indexing
+INDEXING_BATCH_SIZE = 5000
+
+
+def get_index_key(values):
+    """
+    Return a hashable tuple from a sequence of field `values`, where binary
+    values are normalized to bytes.
+    """
+    return tuple(
+        bytes(value) if isinstance(value, (bytearray, memoryview)) else value for value in values
+    )
+
+
+class BulkIndexer:
+    """
+    Stage the Resources and fingerprint index entries of a Package in memory
+    and write them to the database with a few bulk queries.
+
+    Index entries that already exist for the Package are not created again
+    and the number of rows created is tracked by model name in `counts`.
+    """
+
+    def __init__(self, package, batch_size=INDEXING_BATCH_SIZE):
+        self.package = package
+        self.batch_size = batch_size
+        self.counts = Counter()
+        # list of (resource_data, Resource) that are staged for writing
+        self.staged_resources = []
+        # list of (index model, build kwargs) to create once Resources are saved
+        self.staged_entries = []
+
+    def add(self, resource_data):
+        """
+        Stage the Resource and fingerprints from the scanned Resource mapping
+        `resource_data`.
+        """
+        resource = build_resource(self.package, resource_data)
+        self.staged_resources.append((resource_data, resource))
+
+        path = resource.path
+        package = self.package
+        if resource.sha1:
+            self.staged_entries.append((ExactFileIndex, dict(sha1=resource.sha1, package=package)))
+
+        extra_data = resource_data.get("extra_data", {})
+        approximate_fingerprints = [
+            (ApproximateDirectoryContentIndex, extra_data.get("directory_content", "")),
+            (ApproximateDirectoryStructureIndex, extra_data.get("directory_structure", "")),
+            (ApproximateResourceContentIndex, extra_data.get("halo1", "")),
+        ]
+        for model, fingerprint in approximate_fingerprints:
+            if fingerprint:
+                entry = dict(fingerprint=fingerprint, resource_path=path, package=package)
+                self.staged_entries.append((model, entry))
+
+        snippet_fingerprints = [
+            (SnippetIndex, extra_data.get("snippets", [])),
+            (StemmedSnippetIndex, extra_data.get("stemmed_snippets", [])),
+        ]
+        for model, snippets in snippet_fingerprints:
+            for snippet in snippets or []:
+                entry = dict(
+                    fingerprint=snippet["snippet"],
+                    position=snippet["position"],
+                    resource=resource,
+                    package=package,
+                )
+                self.staged_entries.append((model, entry))
+
+        if len(self.staged_resources) >= self.batch_size:
+            self.flush()
+
+    def get_existing_keys(self, model, index_entries):
+        """
+        Return a set of the index keys of the `model` index entries of the
+        Package that exist among the `index_entries` of a batch.
+        """
+        lookup_field = model.index_lookup_field
+        lookup_values = set(
+            get_index_key([getattr(entry, lookup_field)])[0] for entry in index_entries
+        )
+        existing_entries = model.objects.filter(
+            package=self.package,
+            **{f"{lookup_field}__in": lookup_values},
+        ).values_list(*model.index_key_fields)
+        return set(get_index_key(values) for values in existing_entries.iterator())
+
+    def flush(self):
+        """
+        Write the staged Resources and index entries in a single transaction.
+        """
+        if not self.staged_resources:
+            return
+
+        with transaction.atomic():
+            self.write_resources()
+            self.write_index_entries()
+            self.write_snippets_counts()
+
+        self.staged_resources = []
+        self.staged_entries = []
+
+    def write_resources(self):
+        """
+        Create the staged Resources that do not exist and update the scan data
+        of the ones that exist.
+        """
+        paths = [resource.path for _, resource in self.staged_resources]
+        existing_resources_by_path = {
+            resource.path: resource
+            for resource in Resource.objects.filter(package=self.package, path__in=paths)
+        }
+
+        new_resources = []
+        updated_resources = []
+        for resource_data, resource in self.staged_resources:
+            existing_resource = existing_resources_by_path.get(resource.path)
+            if not existing_resource:
+                new_resources.append(resource)
+                continue
+            # Point the staged snippet entries at the existing Resource
+            resource.pk = existing_resource.pk
+            existing_resource.set_scan_results(resource_data)
+            existing_resource.extra_data.update(resource.extra_data)
+            updated_resources.append(existing_resource)
+
+        Resource.objects.bulk_create(new_resources, batch_size=self.batch_size)
+        if updated_resources:
+            Resource.objects.bulk_update(
+                updated_resources,
+                fields=Resource.scan_fields() + ["extra_data"],
+                batch_size=self.batch_size,
+            )
+        self.counts[Resource.__name__] += len(new_resources)
+
+    def write_index_entries(self):
+        """
+        Create the staged index entries that do not already exist for the
+        Package.
+        """
+        index_entries_by_model = defaultdict(list)
+        for model, entry in self.staged_entries:
+            index_entries_by_model[model].append(model.build(**entry))
+
+        new_entries_by_model = {}
+        for model, index_entries in index_entries_by_model.items():
+            # Only the keys of this batch are kept in memory
+            seen_keys = self.get_existing_keys(model, index_entries)
+            new_entries = []
+            for index_entry in index_entries:
+                index_key = get_index_key(
+                    getattr(index_entry, field_name) for field_name in model.index_key_fields
+                )
+                if index_key in seen_keys:
+                    continue
+                seen_keys.add(index_key)
+                new_entries.append(index_entry)
+            new_entries_by_model[model] = new_entries
+
+        for model, new_entries in new_entries_by_model.items():
+            model.objects.bulk_create(
+                new_entries,
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+            self.counts[model.__name__] += len(new_entries)
+            update_resident_index(model)
+
+    def write_snippets_counts(self):
+        """
+        Store the number of distinct snippet fingerprints of the staged
+        Resources, used to score snippet matches.
+        """
+        resources = Resource.objects.filter(
+            pk__in=[resource.pk for _, resource in self.staged_resources]
+        )
+        SnippetIndex.update_resource_counts(resources)
+        StemmedSnippetIndex.update_resource_counts(resources)
+
+
 def index_package_files(package, scan_data, reindex=False):
     """
     Index scan data for `package` Package.
 
+    The "files" of the `scan_data` mapping can be an iterator of scanned
+    Resource mappings that is consumed incrementally: Resources are indexed in
+    batches of INDEXING_BATCH_SIZE.
+
     Return a list of scan index errors messages
 
     If `reindex` is True, then all fingerprints related to `package` will be
@@ -47,63 +238,14 @@ def index_package_files(package, scan_data, reindex=False):
         logger.info(
             f"Indexing Resources and fingerprints related to {package.package_url} from scan data"
         )
-        for resource in scan_data.get("files", []):
-            r, _, _ = update_or_create_resource(package, resource)
-            path = r.path
-            sha1 = r.sha1
-            if sha1:
-                _, _ = ExactFileIndex.index(sha1=sha1, package=package)
-
-            resource_extra_data = resource.get("extra_data", {})
-
-            directory_content_fingerprint = resource_extra_data.get("directory_content", "")
-            if directory_content_fingerprint:
-                _, _ = ApproximateDirectoryContentIndex.index(
-                    fingerprint=directory_content_fingerprint,
-                    resource_path=path,
-                    package=package,
-                )
-
-            directory_structure_fingerprint = resource_extra_data.get("directory_structure", "")
-
-            if directory_structure_fingerprint:
-                _, _ = ApproximateDirectoryStructureIndex.index(
-                    fingerprint=directory_structure_fingerprint,
-                    resource_path=path,
-                    package=package,
-                )
-
-            halo1 = resource_extra_data.get("halo1", "")
-            if halo1:
-                _, _ = ApproximateResourceContentIndex.index(
-                    fingerprint=halo1,
-                    resource_path=path,
-                    package=package,
-                )
-
-            snippets = resource_extra_data.get("snippets", [])
-            if snippets:
-                for s in snippets:
-                    snippet = s["snippet"]
-                    position = s["position"]
-                    _, _ = SnippetIndex.index(
-                        fingerprint=snippet,
-                        position=position,
-                        resource=r,
-                        package=package,
-                    )
-
-            stemmed_snippets = resource_extra_data.get("stemmed_snippets", [])
-            if stemmed_snippets:
-                for s in stemmed_snippets:
-                    snippet = s["snippet"]
-                    position = s["position"]
-                    _, _ = StemmedSnippetIndex.index(
-                        fingerprint=snippet,
-                        position=position,
-                        resource=r,
-                        package=package,
-                    )
+        indexer = BulkIndexer(package)
+        with transaction.atomic():
+            for resource in scan_data.get("files", []):
+                indexer.add(resource)
+            indexer.flush()
+
+        counts = ", ".join(f"{name}: {count}" for name, count in sorted(indexer.counts.items()))
+        logger.info(f"Indexed rows for {package.package_url}: {counts}")
 
     except Exception as e:
         msg = get_error_message(e)
@@ -0,0 +1,93 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+import logging
+import os
+import sys
+import time
+
+from minecode.management.commands import VerboseCommand
+from minecode.pipes import maven
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(stream=sys.stdout)
+logger.setLevel(logging.INFO)
+
+# Sample index used when no index is provided
+SAMPLE_INDEX = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    "tests",
+    "data",
+    "maven",
+    "index",
+    "nexus-maven-repository-index.gz",
+)
+
+
+def benchmark(get_entries, location, fields, repeat=1):
+    """
+    Return a tuple of (entries count, best duration in seconds) of `repeat`
+    runs of a `get_entries` function on the Maven index at `location`.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        entries_count = sum(1 for _ in get_entries(location, fields=fields))
+        durations.append(time.perf_counter() - start)
+    return entries_count, min(durations)
+
+
+class Command(VerboseCommand):
+    help = (
+        "Benchmark the Maven Nexus index decoders on a Gzipped index file, such as "
+        "a downloaded full central index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--index",
+            type=str,
+            default=SAMPLE_INDEX,
+            help="Location of a Gzipped Maven Nexus index. Defaults to a small sample index.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Number of runs of each decoder, the best run is reported.",
+        )
+        parser.add_argument(
+            "--all-fields",
+            action="store_true",
+            help="Decode all the fields instead of only the fields used to build artifacts.",
+        )
+        parser.add_argument(
+            "--skip-stream-decoder",
+            action="store_true",
+            help="Only benchmark the fast decoder, as the stream decoder takes hours on a full index.",
+        )
+
+    def handle(self, *args, **options):
+        logger.setLevel(self.get_verbosity(**options))
+        location = options["index"]
+        repeat = options["repeat"]
+        fields = () if options["all_fields"] else frozenset(maven.ENTRY_FIELDS)
+
+        decoders = [("fast decoder", maven.get_entries)]
+        if not options["skip_stream_decoder"]:
+            decoders.append(("stream decoder", maven.get_entries_from_stream))
+
+        logger.info(f"Benchmarking Maven index decoders on {location}")
+        for decoder_name, get_entries in decoders:
+            entries_count, duration = benchmark(get_entries, location, fields, repeat)
+            entries_per_second = entries_count / duration if duration else 0
+            logger.info(
+                f"{decoder_name}: {entries_count:,} entries in {duration:.3f} sec. "
+                f"({entries_per_second:,.0f} entries/sec.)"
+            )
@@ -0,0 +1,133 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+import logging
+import random
+import sys
+import time
+
+from django.db import transaction
+
+from matchcode.models import SnippetIndex
+from minecode.management.commands import VerboseCommand
+from packagedb.models import Package
+from packagedb.models import Resource
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(stream=sys.stdout)
+logger.setLevel(logging.INFO)
+
+
+def get_fingerprints(count, rng):
+    """Return a list of `count` random snippet fingerprint hex strings."""
+    return [f"{rng.getrandbits(128):032x}" for _ in range(count)]
+
+
+def index_resources(resources_count, resource_snippets_count, fingerprints, rng):
+    """
+    Create a Package with `resources_count` Resources that each have
+    `resource_snippets_count` snippets picked from a shared list of
+    `fingerprints`, such that a query matches many Resources.
+    """
+    package = Package.objects.create(
+        type="generic",
+        name="benchmark-snippet-matching",
+        version="1.0",
+        download_url="https://example.com/benchmark-snippet-matching-1.0.tar.gz",
+    )
+    resources = Resource.objects.bulk_create(
+        Resource(package=package, path=f"file-{i}.c") for i in range(resources_count)
+    )
+    for resource in resources:
+        snippets = [
+            SnippetIndex.build(fingerprint, position, resource, package)
+            for position, fingerprint in enumerate(
+                rng.sample(fingerprints, resource_snippets_count)
+            )
+        ]
+        SnippetIndex.objects.bulk_create(snippets)
+    SnippetIndex.update_resource_counts(Resource.objects.filter(package=package))
+
+
+def benchmark(query_fingerprints, repeat=1):
+    """
+    Return a tuple of (matches count, best duration in seconds) of `repeat`
+    runs of SnippetIndex.match_resources on `query_fingerprints`.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        matches_count = len(SnippetIndex.match_resources(fingerprints=query_fingerprints))
+        durations.append(time.perf_counter() - start)
+    return matches_count, min(durations)
+
+
+class Command(VerboseCommand):
+    help = (
+        "Benchmark the snippet matching latency by number of query snippets on "
+        "generated SnippetIndex entries. The generated entries are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--resources",
+            type=int,
+            default=50,
+            help="Number of indexed Resources.",
+        )
+        parser.add_argument(
+            "--resource-snippets",
+            type=int,
+            default=2000,
+            help="Number of snippets of each indexed Resource.",
+        )
+        parser.add_argument(
+            "--snippets",
+            type=int,
+            nargs="+",
+            default=[50, 200, 1000],
+            help="Numbers of query snippets to benchmark.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Number of runs for each number of query snippets, the best run is reported.",
+        )
+
+    def handle(self, *args, **options):
+        logger.setLevel(self.get_verbosity(**options))
+        resources_count = options["resources"]
+        resource_snippets_count = options["resource_snippets"]
+        repeat = options["repeat"]
+
+        rng = random.Random(42)  # noqa: S311
+        fingerprints = get_fingerprints(resource_snippets_count * 2, rng)
+
+        with transaction.atomic():
+            logger.info(
+                f"Indexing {resources_count:,} Resources of "
+                f"{resource_snippets_count:,} snippets each"
+            )
+            index_resources(resources_count, resource_snippets_count, fingerprints, rng)
+
+            for snippets_count in options["snippets"]:
+                query_fingerprints = [
+                    dict(snippet=fingerprint, position=position)
+                    for position, fingerprint in enumerate(
+                        rng.choices(fingerprints, k=snippets_count)
+                    )
+                ]
+                matches_count, duration = benchmark(query_fingerprints, repeat)
+                logger.info(
+                    f"{snippets_count:,} query snippets: {matches_count:,} matches "
+                    f"in {duration:.3f} sec."
+                )
+
+            transaction.set_rollback(True)
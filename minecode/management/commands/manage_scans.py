@@ -6,12 +6,16 @@ import logging
 import signal
 import sys
 import time
+from datetime import timedelta
 
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 
 from minecode.management.commands import VerboseCommand
 from minecode.models import ScannableURI
+from minecode.models import park
+from minecode.models import save_and_release
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(stream=sys.stdout)
@@ -136,9 +140,60 @@ class Command(ScanningCommand):
         "completed scans for indexing and updates."
     )
 
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--sweep",
+            dest="sweep",
+            default=False,
+            action="store_true",
+            help="Mark all the timed out scans at once at regular intervals instead "
+            "of checking each processable Scannable URI one at a time.",
+        )
+        parser.add_argument(
+            "--sweep-interval",
+            dest="sweep_interval",
+            type=int,
+            default=settings.MINECODE_SCAN_SWEEP_INTERVAL,
+            help="Number of seconds to wait between two sweeps of the timed out scans.",
+        )
+
     def handle(self, *args, **options):
         logger.setLevel(self.get_verbosity(**options))
-        ScanningCommand.handle(self, *args, **options)
+        if not options.get("sweep"):
+            ScanningCommand.handle(self, *args, **options)
+            return
+
+        timed_out_count = self.sweep_timed_out_scans(
+            sweep_interval=options["sweep_interval"],
+            exit_on_empty=options.get("exit_on_empty"),
+        )
+        self.stdout.write(f"Timed out {timed_out_count} ScannableURI.")
+
+    @classmethod
+    def sweep_timed_out_scans(cls, sweep_interval=60, exit_on_empty=False):
+        """
+        Run an infinite loop that marks all the timed out scans as timed out
+        every `sweep_interval` seconds. Return the timed out ScannableURIs count.
+        """
+        timed_out_count = 0
+
+        while True:
+            if cls.MUST_STOP:
+                cls.logger.info("Graceful exit of the scan sweeping loop.")
+                break
+
+            swept_count = ScannableURI.objects.timeout_scans()
+            timed_out_count += swept_count
+            cls.logger.info(f"Timed out {swept_count} scans ({timed_out_count} since start)")
+
+            if exit_on_empty and not swept_count:
+                cls.logger.info("exit-on-empty requested: No more timed out scans, exiting...")
+                break
+
+            time.sleep(sweep_interval)
+
+        return timed_out_count
 
     @classmethod
     def get_next_uri(self):
@@ -166,13 +221,16 @@ class Command(ScanningCommand):
             ScannableURI.SCAN_IN_PROGRESS,
         ):
             scan_duration = timezone.now() - scannable_uri.scan_date
-            scan_duration_hours = scan_duration.seconds / (60 * 60)
+            scan_timeout = timedelta(seconds=settings.MINECODE_SCAN_TIMEOUT)
 
-            if scan_duration_hours > 2:
+            if scan_duration > scan_timeout:
                 scannable_uri.scan_status = ScannableURI.SCAN_TIMEOUT
-                scannable_uri.wip_date = None
-                scannable_uri.save()
+                save_and_release(scannable_uri)
                 logger.info(f"Scan for URI has timed out: {scannable_uri}")
+            else:
+                # Keep the running scan out of the queue until it is indexed,
+                # failed or timed out, which clears its wip_date
+                park(scannable_uri)
 
 
 # support graceful death when used as a service
@@ -12,7 +12,6 @@ import signal
 import sys
 import time
 
-from django.db import transaction
 from django.utils import timezone
 
 # UnusedImport here!
@@ -22,6 +21,9 @@ from minecode import priority_router
 from minecode.management.commands import VerboseCommand
 from minecode.management.commands import get_error_message
 from minecode.models import PriorityResourceURI
+from minecode.models import release
+from minecode.models import renew_leases
+from minecode.models import save_and_release
 from minecode.route import NoRouteAvailable
 
 logger = logging.getLogger(__name__)
@@ -35,6 +37,9 @@ if TRACE:
 # sleep duration in seconds when the queue is empty
 SLEEP_WHEN_EMPTY = 10
 
+# number of PriorityResourceURI leased at once
+REQUEST_BATCH_SIZE = 10
+
 MUST_STOP = False
 
 
@@ -60,16 +65,22 @@ class Command(VerboseCommand):
 
         sleeping = False
         processed_counter = 0
+        priority_resource_uris = []
 
         while True:
             if MUST_STOP:
                 logger.info("Graceful exit of the request queue.")
+                release(priority_resource_uris)
                 break
 
-            with transaction.atomic():
-                priority_resource_uri = PriorityResourceURI.objects.get_next_request()
+            # Keep the leases of the PriorityResourceURIs waiting to be processed
+            priority_resource_uris = renew_leases(priority_resource_uris)
+            if not priority_resource_uris:
+                priority_resource_uris = PriorityResourceURI.objects.lease_requests(
+                    count=REQUEST_BATCH_SIZE
+                )
 
-            if not priority_resource_uri:
+            if not priority_resource_uris:
                 # Only log a single message when we go to sleep
                 if not sleeping:
                     sleeping = True
@@ -79,6 +90,7 @@ class Command(VerboseCommand):
                 continue
 
             sleeping = False
+            priority_resource_uri = priority_resource_uris.pop(0)
 
             # process request
             logger.info(f"Processing {priority_resource_uri}")
@@ -94,8 +106,7 @@ class Command(VerboseCommand):
                     priority_resource_uri.processing_error = errors
                     logger.error(errors)
                 priority_resource_uri.processed_date = timezone.now()
-                priority_resource_uri.wip_date = None
-                priority_resource_uri.save()
+                save_and_release(priority_resource_uri)
                 processed_counter += 1
 
         return processed_counter
@@ -124,10 +135,6 @@ def process_request(priority_resource_uri, _priority_router=priority_router):
     except NoRouteAvailable:
         error = f"No route available for {purl_to_visit}"
         logger.error(error)
-        # TODO: For now, when a route is not yet supported, we keep a value for
-        # the wip_date value so the instance is not back in the queue. It will
-        # not be selected by a worker again until the wip_date is manually
-        # cleared. This manual cleaning should be done once the support for the
-        # route was added. It would be best if the clearing was automatic when
-        # a route is added.
+        # The request is marked as processed with this error such that it is
+        # not back in the queue, and is not parked with a wip_date.
         return error
@@ -24,8 +24,12 @@ from minecode import miners  # NOQA
 from minecode.management.commands import VerboseCommand
 from minecode.management.commands import get_error_message
 from minecode.model_utils import merge_or_create_package
+from minecode.model_utils import merge_or_create_packages
 from minecode.models import ResourceURI
 from minecode.models import ScannableURI
+from minecode.models import release
+from minecode.models import renew_leases
+from minecode.models import save_and_release
 
 TRACE = True
 
@@ -81,7 +85,7 @@ class Command(VerboseCommand):
                 logger.info("Graceful exit of the map loop.")
                 break
 
-            mappables = ResourceURI.objects.get_mappables()[:MAP_BATCH_SIZE]
+            mappables = ResourceURI.objects.lease_mappables(count=MAP_BATCH_SIZE)
 
             if not mappables:
                 if exit_on_empty:
@@ -98,9 +102,88 @@ class Command(VerboseCommand):
 
             sleeping = False
 
-            for resource_uri in mappables:
-                logger.info(f"Mapping {resource_uri}")
-                map_uri(resource_uri)
+            if MUST_STOP:
+                release(mappables)
+                continue
+            logger.info(f"Mapping {len(mappables)} ResourceURIs")
+            map_uris(mappables)
+
+
+def map_uris(resource_uris, _map_router=map_router):
+    """
+    Call a mapper for each ResourceURI of a ``resource_uris`` list and save
+    all the mapped packages at once: the existing Packages are fetched with a
+    single query and the new Packages and their ScannableURIs are inserted in
+    bulk.
+
+    If saving the whole batch fails, each ResourceURI mapped packages are saved
+    one at a time as map_uri does, so that an error is reported only on the
+    ResourceURI that caused it.
+    `_map_router` is the Router to use for routing. Used for tests only.
+    """
+    mapped_scanned_packages_by_resource_uri = []
+    for resource_uri in resource_uris:
+        # Keep the leases of the ResourceURIs waiting to be mapped
+        renew_leases(resource_uris)
+        logger.info(f"Mapping {resource_uri}")
+        mapped_scanned_packages = get_mapped_scanned_packages(resource_uri, _map_router)
+        if mapped_scanned_packages:
+            mapped_scanned_packages_by_resource_uri.append((resource_uri, mapped_scanned_packages))
+
+    if not mapped_scanned_packages_by_resource_uri:
+        return
+
+    scanned_packages_and_levels = [
+        (scanned_package, resource_uri.mining_level)
+        for resource_uri, mapped_scanned_packages in mapped_scanned_packages_by_resource_uri
+        for scanned_package in mapped_scanned_packages
+    ]
+
+    try:
+        with transaction.atomic():
+            results = merge_or_create_packages(scanned_packages_and_levels)
+
+            # Add the created Packages to the scan queue once, skipping the
+            # ScannableURIs that exist like map_uri does with get_or_create
+            scannable_uris_by_key = {}
+            for (scanned_package, _), (package, package_created, _, _) in zip(
+                scanned_packages_and_levels, results
+            ):
+                key = (scanned_package.download_url, package.id)
+                if package_created and key not in scannable_uris_by_key:
+                    scannable_uri = ScannableURI(uri=scanned_package.download_url, package=package)
+                    scannable_uri.set_computed_fields()
+                    scannable_uris_by_key[key] = scannable_uri
+
+            package_ids = [package_id for _, package_id in scannable_uris_by_key]
+            existing_keys = set(
+                ScannableURI.objects.filter(package_id__in=package_ids).values_list(
+                    "uri", "package_id"
+                )
+            )
+            scannable_uris = [
+                scannable_uri
+                for key, scannable_uri in scannable_uris_by_key.items()
+                if key not in existing_keys
+            ]
+            ScannableURI.objects.bulk_create(scannable_uris)
+            logger.debug(f" + Inserted {len(scannable_uris)} ScannableURIs")
+
+    except Exception as e:
+        msg = "Error: Failed to map ResourceURIs in batch, mapping one at a time\n"
+        msg += get_error_message(e)
+        logger.error(msg)
+        for resource_uri, mapped_scanned_packages in mapped_scanned_packages_by_resource_uri:
+            save_mapped_scanned_packages(resource_uri, mapped_scanned_packages)
+        return
+
+    results = iter(results)
+    for resource_uri, mapped_scanned_packages in mapped_scanned_packages_by_resource_uri:
+        map_error = ""
+        for _ in mapped_scanned_packages:
+            _, _, _, m_err = next(results)
+            map_error += m_err
+        set_mapped(resource_uri, map_error)
 
 
 def map_uri(resource_uri, _map_router=map_router):
@@ -108,6 +191,17 @@ def map_uri(resource_uri, _map_router=map_router):
     Call a mapper for a ResourceURI.
     `_map_router` is the Router to use for routing. Used for tests only.
     """
+    mapped_scanned_packages = get_mapped_scanned_packages(resource_uri, _map_router)
+    if mapped_scanned_packages:
+        save_mapped_scanned_packages(resource_uri, mapped_scanned_packages)
+
+
+def get_mapped_scanned_packages(resource_uri, _map_router=map_router):
+    """
+    Return a list of the ScanCode packages mapped from a ``resource_uri``
+    ResourceURI. Return an empty list and flag and save ``resource_uri`` as
+    mapped with an error if no package is mapped.
+    """
     # FIXME: returning a string or sequence is UGLY
     try:
         mapped_scanned_packages = _map_router.process(resource_uri.uri, resource_uri=resource_uri)
@@ -120,21 +214,26 @@ def map_uri(resource_uri, _map_router=map_router):
         if not mapped_scanned_packages:
             msg = "No visited scanned packages returned."
             logger.error(msg)
-            resource_uri.last_map_date = timezone.now()
-            resource_uri.map_error = msg
-            resource_uri.save()
-            return
+            set_mapped(resource_uri, msg)
+            return []
 
     except Exception as e:
         msg = f"Error: Failed to map while processing ResourceURI: {repr(resource_uri)}\n"
         msg += get_error_message(e)
         logger.error(msg)
         # we had an error, so mapped_scanned_packages is an error string
-        resource_uri.last_map_date = timezone.now()
-        resource_uri.map_error = msg
-        resource_uri.save()
-        return
+        set_mapped(resource_uri, msg)
+        return []
+
+    return mapped_scanned_packages
 
+
+def save_mapped_scanned_packages(resource_uri, mapped_scanned_packages):
+    """
+    Save the ``mapped_scanned_packages`` ScanCode packages mapped from a
+    ``resource_uri`` ResourceURI as new or updated Packages, then flag and save
+    ``resource_uri`` as mapped.
+    """
     # if we reached this place, we have mapped_scanned_packages that contains
     # packages in ScanCode models format that these are ready to save to the DB
 
@@ -170,13 +269,16 @@ def map_uri(resource_uri, _map_router=map_router):
         # this is enough to save the error to the ResourceURI which is done at last
         map_error += msg
 
-    # finally flag and save the processed resource_uri as mapped
+    set_mapped(resource_uri, map_error)
+
+
+def set_mapped(resource_uri, map_error=""):
+    """Flag and save the processed ``resource_uri`` as mapped with ``map_error``."""
     resource_uri.last_map_date = timezone.now()
-    resource_uri.wip_date = None
     # always set the map error, resetting it to empty if the mapping was
     # successful
     if map_error:
         resource_uri.map_error = map_error
     else:
         resource_uri.map_error = None
-    resource_uri.save()
+    save_and_release(resource_uri)
@@ -29,6 +29,10 @@ from minecode import visit_router
 from minecode.management.commands import VerboseCommand
 from minecode.management.commands import get_error_message
 from minecode.models import ResourceURI
+from minecode.models import park
+from minecode.models import release
+from minecode.models import renew_leases
+from minecode.models import save_and_release
 from minecode.route import NoRouteAvailable
 
 logger = logging.getLogger(__name__)
@@ -43,6 +47,12 @@ if TRACE:
 # sleep duration in seconds when the queue is empty
 SLEEP_WHEN_EMPTY = 10
 
+# number of visitable ResourceURI leased at once
+VISIT_BATCH_SIZE = 10
+
+# number of ResourceURI collected by a visit inserted at once
+VISITED_URIS_BATCH_SIZE = 1000
+
 # Create a global cache for robots.txt. Note that this is process specific and does
 # not span multiple workers
 robots = reppy.cache.RobotsCache()
@@ -165,16 +175,20 @@ def visit_uris(
     uri_counter_by_visitor = Counter()
 
     sleeping = False
+    resource_uris = []
 
     while True:
         if MUST_STOP:
             logger.info("Graceful exit of the visit loop.")
+            release(resource_uris)
             break
 
-        with transaction.atomic():
-            resource_uri = ResourceURI.objects.get_next_visitable()
+        # Keep the leases of the ResourceURIs waiting to be visited
+        resource_uris = renew_leases(resource_uris)
+        if not resource_uris:
+            resource_uris = ResourceURI.objects.lease_visitables(count=VISIT_BATCH_SIZE)
 
-        if not resource_uri:
+        if not resource_uris:
             if exit_on_empty:
                 logger.info("exit-on-empty requested: No more visitable resource, exiting...")
                 break
@@ -188,14 +202,14 @@ def visit_uris(
             continue
 
         sleeping = False
+        resource_uri = resource_uris.pop(0)
 
         if not ignore_robots and robots.disallowed(resource_uri.uri, user_agent):
             msg = "Denied by robots.txt"
             logger.error(msg)
             resource_uri.last_visit_date = timezone.now()
-            resource_uri.wip_date = None
             resource_uri.visit_error = msg
-            resource_uri.save()
+            save_and_release(resource_uri)
             continue
 
         if not ignore_throttle:
@@ -222,6 +236,7 @@ def visit_uris(
 
         if max_loops and int(visited_counter) > int(max_loops):
             logger.info(f"Stopping visits after max_loops: {max_loops} visit loops.")
+            release(resource_uris)
             break
 
     return visited_counter, inserted_counter
@@ -244,7 +259,7 @@ def visit_uri(resource_uri, max_uris=0, uri_counter_by_visitor=None, _visit_rout
         uri_counter_by_visitor = Counter()
 
     visit_errors = []
-    new_uris_to_visit = visited_data = visit_error = None
+    new_uris_to_visit = visited_data = visit_error = visitor_key = None
 
     try:
         # Get the visitor class names
@@ -274,6 +289,7 @@ def visit_uri(resource_uri, max_uris=0, uri_counter_by_visitor=None, _visit_rout
         # cleared. This manual cleaning should be done once the support for the
         # route was added. It would be best if the clearing was automatic when
         # a route is added.
+        park(resource_uri)
         return 0
     except (ConnectionError, Timeout, Exception) as e:
         # FIXME: is catching all exceptions here correct?
@@ -297,12 +313,19 @@ def visit_uri(resource_uri, max_uris=0, uri_counter_by_visitor=None, _visit_rout
     # uris needs to be an iterable (list, set, generator...)
     new_uris_to_visit = new_uris_to_visit or []
 
-    inserted_count = 0
+    if max_uris:
+        visitor_uri_counter = (uri_counter_by_visitor, visitor_key)
+    else:
+        visitor_uri_counter = None
+    writer = VisitedURIWriter(
+        visit_errors=visit_errors,
+        max_uris=max_uris,
+        visitor_uri_counter=visitor_uri_counter,
+    )
 
     try:
         # NOTE: new_uris_to_visit here is an iterable of visitors.URI
         # objects, NEITHER strings NOR ResourceURI models
-        # TODO: use batching for inserts or create for more efficient DB processing
         for vuri_count, vuri in enumerate(new_uris_to_visit):
             # FIXME: should we really do this smart_str here??
             uri_str = smart_str(vuri.uri)
@@ -316,46 +339,25 @@ def visit_uri(resource_uri, max_uris=0, uri_counter_by_visitor=None, _visit_rout
                 logger.debug(f" * Processed: {vuri_count} visited URIs")
 
             try:
-                # insert new if pre-visited
                 pre_visited = visited_uri.pop("visited")
                 if pre_visited:
                     # set last visit date for this pre-visited URI
                     visited_uri["last_visit_date"] = timezone.now()
-                    new_uri = ResourceURI(**visited_uri)
-                    new_uri.save()
-                    logger.debug(f" + Inserted pre-visited:\t{uri_str}")
-                    inserted_count += 1
-                    if max_uris:
-                        uri_counter_by_visitor[visitor_key] += 1
                 else:
-                    # if not pre-visited only insert if not existing
-                    if not ResourceURI.objects.filter(uri=vuri.uri, last_visit_date=None).exists():
-                        visited_uri["last_visit_date"] = None
-                        new_uri = ResourceURI(**visited_uri)
-                        new_uri.save()
-                        logger.debug(f" + Inserted new:\t{uri_str}")
-                        inserted_count += 1
-                        if max_uris:
-                            uri_counter_by_visitor[visitor_key] += 1
-                    else:
-                        logger.debug(f" + NOT Inserted:\t{uri_str}")
+                    visited_uri["last_visit_date"] = None
+                new_uri = ResourceURI(**visited_uri)
+                new_uri.set_computed_fields()
+                writer.add(uri_str, visited_uri, new_uri)
 
             except Exception as e:
                 # FIXME: is catching all exceptions here correct?
-                msg = f"ERROR while processing URI from a visit through: {uri_str}"
-                msg += "\n"
-                msg += repr(visited_uri)
-                msg += "\n"
-                msg += get_error_message(e)
-                visit_errors.append(msg)
-                logger.error(msg)
-                if len(visit_errors) > 10:
-                    logger.error(
-                        f" ! Breaking after processing over 10 vuris errors for: {uri_str}"
-                    )
-                    break
-
-            if max_uris and int(uri_counter_by_visitor[visitor_key]) > int(max_uris):
+                writer.add_error(uri_str, visited_uri, e)
+
+            if writer.has_too_many_errors():
+                logger.error(f" ! Breaking after processing over 10 vuris errors for: {uri_str}")
+                break
+
+            if writer.has_reached_max_uris():
                 logger.info(f" ! Breaking after processing max-uris: {max_uris} URIs.")
                 break
 
@@ -367,21 +369,159 @@ def visit_uri(resource_uri, max_uris=0, uri_counter_by_visitor=None, _visit_rout
         logger.error(msg)
 
     finally:
+        # Insert the remaining staged URIs
+        writer.flush()
+        inserted_count = writer.inserted_count
+
         # Flag the processed resource_uri as completed and attach data.
         resource_uri.last_visit_date = timezone.now()
-        resource_uri.wip_date = None
         if visited_data:
             logger.debug(" + Data collected.")
             resource_uri.data = visited_data
         if visit_errors:
             logger.debug(" ! Errors.")
             resource_uri.visit_error = "\n".join(visit_errors)[:5000]
-        resource_uri.save()
+        save_and_release(resource_uri)
 
     logger.debug(f" Inserted\t: {inserted_count} new URI(s).")
     return inserted_count
 
 
+class VisitedURIWriter:
+    """
+    Insert the ResourceURIs of the URIs collected during a visit in batches of
+    `batch_size` ResourceURIs, VISITED_URIS_BATCH_SIZE by default.
+
+    Pre-visited URIs are always inserted. Other URIs are inserted only if the
+    same URI is not already waiting for a visit, including earlier in the same
+    visit.
+
+    If `max_uris` is set, insert up to `max_uris` + 1 URIs for a visitor, as
+    counted in the visitor_uri_counter tuple of (Counter of inserted URIs by
+    visitor, visitor key). Errors are appended to the `visit_errors` list.
+    """
+
+    def __init__(
+        self,
+        visit_errors,
+        max_uris=0,
+        visitor_uri_counter=None,
+        batch_size=None,
+    ):
+        self.visit_errors = visit_errors
+        self.max_uris = max_uris
+        self.visitor_uri_counter = visitor_uri_counter
+        self.batch_size = batch_size or VISITED_URIS_BATCH_SIZE
+        self.inserted_count = 0
+        # List of staged (uri string, visited URI mapping, ResourceURI) tuples
+        self.staged = []
+
+    def add(self, uri_str, visited_uri, resource_uri):
+        """
+        Stage a `resource_uri` for insertion, inserting a batch when full or
+        when the staged URIs could reach `max_uris`, such that the visit stops
+        as soon as `max_uris` is reached.
+        """
+        self.staged.append((uri_str, visited_uri, resource_uri))
+        if len(self.staged) >= self.batch_size or self.may_reach_max_uris():
+            self.flush()
+
+    def add_error(self, uri_str, visited_uri, exception):
+        msg = f"ERROR while processing URI from a visit through: {uri_str}"
+        msg += "\n"
+        msg += repr(visited_uri)
+        msg += "\n"
+        msg += get_error_message(exception)
+        self.visit_errors.append(msg)
+        logger.error(msg)
+
+    def has_too_many_errors(self):
+        return len(self.visit_errors) > 10
+
+    def get_uri_count(self):
+        uri_counter_by_visitor, visitor_key = self.visitor_uri_counter
+        return int(uri_counter_by_visitor[visitor_key])
+
+    def has_reached_max_uris(self):
+        if not (self.max_uris and self.visitor_uri_counter):
+            return False
+        return self.get_uri_count() > int(self.max_uris)
+
+    def may_reach_max_uris(self):
+        """
+        Return True if inserting all the staged URIs would reach `max_uris`.
+        """
+        if not (self.max_uris and self.visitor_uri_counter):
+            return False
+        return self.get_uri_count() + len(self.staged) > int(self.max_uris)
+
+    def get_new_staged(self):
+        """
+        Return the list of staged tuples with a ResourceURI that must be
+        inserted.
+        """
+        not_visited_uris = {
+            resource_uri.uri
+            for _, _, resource_uri in self.staged
+            if resource_uri.last_visit_date is None
+        }
+        existing_uris = set(
+            ResourceURI.objects.filter(
+                uri__in=not_visited_uris,
+                last_visit_date=None,
+            ).values_list("uri", flat=True)
+        )
+
+        new_staged = []
+        for uri_str, visited_uri, resource_uri in self.staged:
+            if resource_uri.last_visit_date is None:
+                if resource_uri.uri in existing_uris:
+                    logger.debug(f" + NOT Inserted:\t{uri_str}")
+                    continue
+                existing_uris.add(resource_uri.uri)
+            new_staged.append((uri_str, visited_uri, resource_uri))
+
+        if self.max_uris and self.visitor_uri_counter:
+            remaining = int(self.max_uris) + 1 - self.get_uri_count()
+            new_staged = new_staged[: max(remaining, 0)]
+        return new_staged
+
+    def flush(self):
+        """Insert the staged ResourceURIs."""
+        if not self.staged:
+            return
+
+        new_staged = self.get_new_staged()
+        self.staged = []
+        try:
+            with transaction.atomic():
+                ResourceURI.objects.bulk_create([resource_uri for _, _, resource_uri in new_staged])
+        except Exception:
+            # Insert one at a time to report the errors of each URI
+            for uri_str, visited_uri, resource_uri in new_staged:
+                resource_uri.pk = None
+                try:
+                    with transaction.atomic():
+                        resource_uri.save()
+                except Exception as e:
+                    resource_uri.pk = None
+                    self.add_error(uri_str, visited_uri, e)
+
+        # Only the inserted ResourceURIs have a primary key
+        inserted = [staged for staged in new_staged if staged[2].pk is not None]
+
+        for uri_str, _, resource_uri in inserted:
+            if resource_uri.last_visit_date:
+                logger.debug(f" + Inserted pre-visited:\t{uri_str}")
+            else:
+                logger.debug(f" + Inserted new:\t{uri_str}")
+
+        self.inserted_count += len(inserted)
+        if self.max_uris and self.visitor_uri_counter:
+            uri_counter_by_visitor, visitor_key = self.visitor_uri_counter
+            uri_counter_by_visitor[visitor_key] += len(inserted)
+
+
 def get_sleep_time(resource_uri, minimum_delay_between_visits=1, user_agent=USER_AGENT):
     """
     Return the sleep time in seconds the worker should wait in order to
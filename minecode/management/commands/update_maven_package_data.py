@@ -6,7 +6,9 @@
 # See https://github.com/aboutcode-org/purldb for support or download.
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
+import json
 import logging
+import os
 import sys
 import traceback
 from os.path import basename
@@ -21,6 +23,7 @@ from packageurl import normalize_qualifiers
 from minecode.collectors.maven import MavenNexusCollector
 from minecode.management.commands import VerboseCommand
 from minecode.models import ProcessingError
+from minecode.pipes.maven import MAVEN_INDEX_MAX_WORKERS
 from packagedb.models import Package
 
 DEFAULT_TIMEOUT = 30
@@ -242,6 +245,31 @@ def update_maven_packages(maven_package, fields_to_update, lowercased_purl_field
         return None, []
 
 
+def load_checkpoint(checkpoint_location):
+    """
+    Return the Maven index checkpoint mapping saved in the
+    ``checkpoint_location`` JSON file or an empty mapping.
+    """
+    if not checkpoint_location or not os.path.exists(checkpoint_location):
+        return {}
+    with open(checkpoint_location) as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint_location, checkpoint):
+    """
+    Save the Maven index ``checkpoint`` mapping in the ``checkpoint_location``
+    JSON file.
+    """
+    if not checkpoint_location:
+        return
+    # Write to a temporary file first to not leave a truncated checkpoint
+    temp_location = f"{checkpoint_location}.tmp"
+    with open(temp_location, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_location, checkpoint_location)
+
+
 class Command(VerboseCommand):
     help = "Update maven Package values"
 
@@ -251,9 +279,24 @@ class Command(VerboseCommand):
             type=bool,
             help="Create new Maven Packages if it does not exist in our database",
         )
+        parser.add_argument(
+            "--max-workers",
+            type=int,
+            default=1,
+            help=(
+                "Number of processes decoding the Maven index, such as "
+                f"{MAVEN_INDEX_MAX_WORKERS}. Packages are processed in the index order."
+            ),
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            help="Location of a JSON file to save the progress to and to resume from.",
+        )
 
     def handle(self, *args, **options):
         create_package = options.get("create_package", False)
+        checkpoint_location = options.get("checkpoint")
         updated_packages_count = 0
         created_packages_count = 0
         deleted_packages_count = 0
@@ -262,9 +305,17 @@ class Command(VerboseCommand):
         unsaved_existing_packages_lowercased = []
         packages_to_delete = []
 
+        checkpoint = load_checkpoint(checkpoint_location)
+        if checkpoint:
+            logger.info(f"Resuming after {checkpoint['records']:,} records of the Maven Index")
+
         logger.info("Updating or Adding new Packages from Maven Index")
         collector = MavenNexusCollector()
-        for i, maven_package in enumerate(collector.get_packages()):
+        maven_packages = collector.get_packages(
+            max_workers=options.get("max_workers") or 1,
+            checkpoint=checkpoint,
+        )
+        for i, maven_package in enumerate(maven_packages):
             if not i % 1000:
                 logger.info(f"Processed {i:,} Maven Artifacts")
             if not i % 2000:
@@ -285,6 +336,8 @@ class Command(VerboseCommand):
                     created_packages_count=created_packages_count,
                     deleted_packages_count=deleted_packages_count,
                 )
+                # All the packages consumed before this one are now saved
+                save_checkpoint(checkpoint_location, checkpoint)
 
             fields_to_update = [
                 "download_url",
@@ -361,3 +414,4 @@ class Command(VerboseCommand):
             created_packages_count=created_packages_count,
             deleted_packages_count=deleted_packages_count,
         )
+        save_checkpoint(checkpoint_location, checkpoint)
@@ -0,0 +1,68 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+import logging
+import sys
+
+from matchcode.models import SnippetIndex
+from matchcode.models import StemmedSnippetIndex
+from minecode.management.commands import VerboseCommand
+from packagedb.models import Resource
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(stream=sys.stdout)
+logger.setLevel(logging.INFO)
+
+
+class Command(VerboseCommand):
+    help = (
+        "Compute and store the number of distinct snippet and stemmed snippet "
+        "fingerprints of the Resources where it has not been computed yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Number of Resources updated per query.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recompute the count of all the Resources.",
+        )
+
+    def handle(self, *args, **options):
+        logger.setLevel(self.get_verbosity(**options))
+        batch_size = options["batch_size"]
+
+        updated_count = 0
+        for snippet_index in (SnippetIndex, StemmedSnippetIndex):
+            count_field = snippet_index.resource_count_field
+            resources = Resource.objects.order_by("pk")
+            if not options["all"]:
+                resources = resources.filter(**{f"{count_field}__isnull": True})
+
+            last_resource_id = 0
+            while True:
+                resource_ids = list(
+                    resources.filter(pk__gt=last_resource_id).values_list("pk", flat=True)[
+                        :batch_size
+                    ]
+                )
+                if not resource_ids:
+                    break
+                last_resource_id = resource_ids[-1]
+                updated_count += snippet_index.update_resource_counts(
+                    Resource.objects.filter(pk__in=resource_ids)
+                )
+                logger.info(f"Updated {count_field} up to Resource {last_resource_id:,}")
+
+        logger.info(f"Updated {updated_count:,} Resource snippet counts")
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.6 on 2026-10-17 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("minecode", "0038_alter_importableuri_has_processing_error_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="priorityresourceuri",
+            name="is_parked",
+            field=models.BooleanField(
+                default=False,
+                help_text="When set to True (Yes), the wip_date was kept on purpose to keep this URI out of the queue, such as when no route is available to process it or while its scan is running, and it is not an expired worker lease. Set back to False when this URI is leased.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="resourceuri",
+            name="is_parked",
+            field=models.BooleanField(
+                default=False,
+                help_text="When set to True (Yes), the wip_date was kept on purpose to keep this URI out of the queue, such as when no route is available to process it or while its scan is running, and it is not an expired worker lease. Set back to False when this URI is leased.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="scannableuri",
+            name="is_parked",
+            field=models.BooleanField(
+                default=False,
+                help_text="When set to True (Yes), the wip_date was kept on purpose to keep this URI out of the queue, such as when no route is available to process it or while its scan is running, and it is not an expired worker lease. Set back to False when this URI is leased.",
+            ),
+        ),
+    ]
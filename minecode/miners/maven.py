@@ -35,6 +35,7 @@ from minecode.miners import HttpVisitor
 from minecode.miners import Mapper
 from minecode.miners import NonPersistentHttpVisitor
 from minecode.miners import java_stream
+from minecode.pipes import maven_index
 from minecode.utils import parse_date
 
 """
@@ -710,6 +711,18 @@ def get_entries(location, fields=frozenset(ENTRY_FIELDS)):
     Yield Maven index entry mappings from a Gzipped Maven nexus index
     data file at `location`. Only includes `fields` names.
     """
+    with GzipFileWithTrailing(location, "rb") as nexus_index:
+        yield from maven_index.iter_entries(nexus_index, fields)
+
+
+def get_entries_from_stream(location, fields=frozenset(ENTRY_FIELDS)):
+    """
+    Yield Maven index entry mappings from a Gzipped Maven nexus index
+    data file at `location`. Only includes `fields` names.
+
+    This reads each field from a Java-like stream and is much slower than
+    `get_entries`.
+    """
     buffer_size = 128 * 1024 * 1024
     if TRACE_DEEP:
         entry = None
@@ -1,6 +1,7 @@
 import copy
 import logging
 import sys
+from collections import defaultdict
 
 from django.utils import timezone
 
@@ -67,6 +68,47 @@ def add_package_to_scan_queue(package, pipelines=DEFAULT_PIPELINES, priority=0,
         logger.debug(f" + Inserted ScannableURI\t: {uri}")
 
 
+def add_packages_to_scan_queue(packages_and_pipelines, priority=0, reindex_uri=False):
+    """
+    Add each Package of a list of (Package, `pipelines`) tuples to the scan
+    queue like `add_package_to_scan_queue` does, fetching the existing
+    ScannableURIs of all the Packages with one query and creating the new
+    ScannableURIs in bulk. Return the number of new ScannableURIs.
+    """
+    if not all(pipelines for _, pipelines in packages_and_pipelines):
+        raise Exception("pipelines required to add package to scan queue")
+
+    package_ids = [package.id for package, _ in packages_and_pipelines]
+    existing_keys = set()
+    existing_scannable_uris = ScannableURI.objects.filter(
+        package_id__in=package_ids,
+        reindex_uri=reindex_uri,
+        priority=priority,
+    ).values_list("uri", "package_id", "pipelines")
+    for uri, package_id, pipelines in existing_scannable_uris.iterator():
+        existing_keys.add((uri, package_id, tuple(pipelines or ())))
+
+    new_scannable_uris = []
+    for package, pipelines in packages_and_pipelines:
+        key = (package.download_url, package.id, tuple(pipelines))
+        if key in existing_keys:
+            continue
+        existing_keys.add(key)
+        scannable_uri = ScannableURI(
+            uri=package.download_url,
+            pipelines=pipelines,
+            package=package,
+            reindex_uri=reindex_uri,
+            priority=priority,
+        )
+        scannable_uri.set_computed_fields()
+        new_scannable_uris.append(scannable_uri)
+
+    ScannableURI.objects.bulk_create(new_scannable_uris)
+    logger.debug(f" + Inserted {len(new_scannable_uris)} ScannableURIs")
+    return len(new_scannable_uris)
+
+
 def merge_packages(existing_package, new_package_data, replace=False):
     """
     Merge the data from the `new_package_data` mapping into the
@@ -249,18 +291,8 @@ def merge_or_create_package(scanned_package, visit_level, override=False, filena
         # this will force the data override
         visit_level = +1
 
-    if not isinstance(scanned_package, PackageData):
-        msg = "Not a ScanCode PackageData type:" + repr(scanned_package)
-        map_error += msg + "\n"
-        logger.error(msg)
-        raise RuntimeError(msg)
-
-    if not scanned_package.download_url:
-        # TODO: there could be valid cases where we have no download URL
-        # and still want to create a package???
-        msg = "No download_url for package:" + repr(scanned_package)
-        map_error += msg + "\n"
-        logger.error(msg)
+    map_error = check_scanned_package(scanned_package)
+    if map_error:
         return package, created, merged, map_error
 
     package_uri = scanned_package.download_url
@@ -278,58 +310,7 @@ def merge_or_create_package(scanned_package, visit_level, override=False, filena
         pass
 
     if stored_package:
-        # Here we have a pre-existing package that we are updating.
-        # Based on the mining levels, we replace or merge fields
-        # differently
-
-        existing_level = stored_package.mining_level
-
-        if visit_level < existing_level:
-            # if the level of the new visit is lower than the level
-            # of the current package, then existing package data
-            # wins and is more important. Its attributes can only be
-            # updated if there was a null values and there is a non-
-            # null values in the new package data from the visit.
-            updated_fields = merge_packages(
-                existing_package=stored_package,
-                new_package_data=scanned_package.to_dict(),
-                replace=False,
-            )
-            # for a foreign key, such as dependencies and parties, we will adopt the
-            # same logic. In this case, parties or dependencies coming from a scanned
-            # package are only added if there is no parties or dependencies in the
-            # existing stored package
-        else:
-            # if the level of the new visit is higher or equal to
-            # the level of the existing package, then new package
-            # data from the visit is more important and wins and its
-            # non-null values replace the values of the existing
-            # package which is updated in the DB.
-            updated_fields = merge_packages(
-                existing_package=stored_package,
-                new_package_data=scanned_package.to_dict(),
-                replace=True,
-            )
-            # for a foreign key, such as dependencies and parties, we will adopt the
-            # same logic. In this case, parties or dependencies coming from a scanned
-            # package will override existing values. If there are parties in the scanned
-            # package and the existing package, the existing package parties should be
-            # deleted first and then the new package's parties added.
-
-            stored_package.mining_level = mining_level
-
-        if updated_fields:
-            data = {
-                "updated_fields": updated_fields,
-            }
-            stored_package.append_to_history("Package field values have been updated.", data=data)
-
-        # TODO: append updated_fields information to the package's history
-
-        stored_package.last_modified_date = timezone.now()
-        stored_package.save()
-        logger.debug(f" + Updated package\t: {package_uri}")
-        package = stored_package
+        package = update_stored_package(stored_package, scanned_package, visit_level, mining_level)
         merged = True
 
     else:
@@ -346,50 +327,8 @@ def merge_or_create_package(scanned_package, visit_level, override=False, filena
             version=scanned_package.version,
         )
         existing_related_package = existing_related_packages.first()
-        package_content = scanned_package.extra_data.get("package_content")
-
-        if not filename:
-            filename = fileutils.file_name(package_uri)
-
-        package_data = dict(
-            # FIXME: we should get the file_name in the
-            # PackageData object instead.
-            filename=filename,
-            # TODO: update the PackageDB model
-            release_date=scanned_package.release_date,
-            mining_level=mining_level,
-            type=scanned_package.type,
-            namespace=scanned_package.namespace,
-            name=scanned_package.name,
-            version=scanned_package.version,
-            qualifiers=normalize_qualifiers(scanned_package.qualifiers, encode=True),
-            subpath=scanned_package.subpath,
-            primary_language=scanned_package.primary_language,
-            description=scanned_package.description,
-            keywords=scanned_package.keywords,
-            homepage_url=scanned_package.homepage_url,
-            download_url=scanned_package.download_url,
-            size=scanned_package.size,
-            sha1=scanned_package.sha1,
-            md5=scanned_package.md5,
-            sha256=scanned_package.sha256,
-            sha512=scanned_package.sha512,
-            bug_tracking_url=scanned_package.bug_tracking_url,
-            code_view_url=scanned_package.code_view_url,
-            vcs_url=scanned_package.vcs_url,
-            copyright=scanned_package.copyright,
-            holder=scanned_package.holder,
-            declared_license_expression=scanned_package.declared_license_expression,
-            license_detections=scanned_package.license_detections,
-            other_license_expression=scanned_package.other_license_expression,
-            other_license_detections=scanned_package.other_license_detections,
-            extracted_license_statement=scanned_package.extracted_license_statement,
-            notice_text=scanned_package.notice_text,
-            source_packages=scanned_package.source_packages,
-            package_content=package_content,
-        )
 
-        stringify_null_purl_fields(package_data)
+        package_data = get_package_data(scanned_package, mining_level, filename)
 
         # if we try to create a package more than once it should not fail
         created_package, created = Package.objects.get_or_create(**package_data)
@@ -417,26 +356,8 @@ def merge_or_create_package(scanned_package, visit_level, override=False, filena
                 for package_set in existing_related_package.package_sets.all():
                     package_set.add_to_package_set(created_package)
 
-        for party in scanned_package.parties:
-            Party.objects.create(
-                package=created_package,
-                type=party.type,
-                role=party.role,
-                name=party.name,
-                email=party.email,
-                url=party.url,
-            )
-
-        for dependency in scanned_package.dependencies:
-            DependentPackage.objects.create(
-                package=created_package,
-                purl=dependency.purl,
-                extracted_requirement=dependency.extracted_requirement,
-                scope=dependency.scope,
-                is_runtime=dependency.is_runtime,
-                is_optional=dependency.is_optional,
-                is_pinned=dependency.is_pinned,
-            )
+        Party.objects.bulk_create(build_parties(created_package, scanned_package))
+        DependentPackage.objects.bulk_create(build_dependencies(created_package, scanned_package))
 
         time = timezone.now()
         created_package.created_date = time
@@ -449,6 +370,371 @@ def merge_or_create_package(scanned_package, visit_level, override=False, filena
     return package, created, merged, map_error
 
 
+def check_scanned_package(scanned_package):
+    """
+    Return an error message if ``scanned_package`` has no download URL and
+    cannot be stored in the PackageDB or an empty string otherwise.
+    Raise a RuntimeError if ``scanned_package`` is not a PackageData.
+    """
+    if not isinstance(scanned_package, PackageData):
+        msg = "Not a ScanCode PackageData type:" + repr(scanned_package)
+        logger.error(msg)
+        raise RuntimeError(msg)
+
+    if not scanned_package.download_url:
+        # TODO: there could be valid cases where we have no download URL
+        # and still want to create a package???
+        msg = "No download_url for package:" + repr(scanned_package)
+        logger.error(msg)
+        return msg + "\n"
+
+    return ""
+
+
+def update_stored_package(stored_package, scanned_package, visit_level, mining_level):
+    """
+    Update and return the ``stored_package`` Package with the data of
+    ``scanned_package`` based on the `visit_level` and the mining level of
+    ``stored_package``.
+    """
+    # Here we have a pre-existing package that we are updating.
+    # Based on the mining levels, we replace or merge fields
+    # differently
+
+    existing_level = stored_package.mining_level
+
+    if visit_level < existing_level:
+        # if the level of the new visit is lower than the level
+        # of the current package, then existing package data
+        # wins and is more important. Its attributes can only be
+        # updated if there was a null values and there is a non-
+        # null values in the new package data from the visit.
+        updated_fields = merge_packages(
+            existing_package=stored_package,
+            new_package_data=scanned_package.to_dict(),
+            replace=False,
+        )
+        # for a foreign key, such as dependencies and parties, we will adopt the
+        # same logic. In this case, parties or dependencies coming from a scanned
+        # package are only added if there is no parties or dependencies in the
+        # existing stored package
+    else:
+        # if the level of the new visit is higher or equal to
+        # the level of the existing package, then new package
+        # data from the visit is more important and wins and its
+        # non-null values replace the values of the existing
+        # package which is updated in the DB.
+        updated_fields = merge_packages(
+            existing_package=stored_package,
+            new_package_data=scanned_package.to_dict(),
+            replace=True,
+        )
+        # for a foreign key, such as dependencies and parties, we will adopt the
+        # same logic. In this case, parties or dependencies coming from a scanned
+        # package will override existing values. If there are parties in the scanned
+        # package and the existing package, the existing package parties should be
+        # deleted first and then the new package's parties added.
+
+        stored_package.mining_level = mining_level
+
+    if updated_fields:
+        data = {
+            "updated_fields": updated_fields,
+        }
+        stored_package.append_to_history("Package field values have been updated.", data=data)
+
+    # TODO: append updated_fields information to the package's history
+
+    stored_package.last_modified_date = timezone.now()
+    stored_package.save()
+    logger.debug(f" + Updated package\t: {scanned_package.download_url}")
+    return stored_package
+
+
+def get_package_data(scanned_package, mining_level, filename=None):
+    """
+    Return a mapping of Package field values to create a new Package from
+    ``scanned_package``.
+    """
+    if not filename:
+        filename = fileutils.file_name(scanned_package.download_url)
+
+    package_data = dict(
+        # FIXME: we should get the file_name in the
+        # PackageData object instead.
+        filename=filename,
+        # TODO: update the PackageDB model
+        release_date=scanned_package.release_date,
+        mining_level=mining_level,
+        type=scanned_package.type,
+        namespace=scanned_package.namespace,
+        name=scanned_package.name,
+        version=scanned_package.version,
+        qualifiers=normalize_qualifiers(scanned_package.qualifiers, encode=True),
+        subpath=scanned_package.subpath,
+        primary_language=scanned_package.primary_language,
+        description=scanned_package.description,
+        keywords=scanned_package.keywords,
+        homepage_url=scanned_package.homepage_url,
+        download_url=scanned_package.download_url,
+        size=scanned_package.size,
+        sha1=scanned_package.sha1,
+        md5=scanned_package.md5,
+        sha256=scanned_package.sha256,
+        sha512=scanned_package.sha512,
+        bug_tracking_url=scanned_package.bug_tracking_url,
+        code_view_url=scanned_package.code_view_url,
+        vcs_url=scanned_package.vcs_url,
+        copyright=scanned_package.copyright,
+        holder=scanned_package.holder,
+        declared_license_expression=scanned_package.declared_license_expression,
+        license_detections=scanned_package.license_detections,
+        other_license_expression=scanned_package.other_license_expression,
+        other_license_detections=scanned_package.other_license_detections,
+        extracted_license_statement=scanned_package.extracted_license_statement,
+        notice_text=scanned_package.notice_text,
+        source_packages=scanned_package.source_packages,
+        package_content=scanned_package.extra_data.get("package_content"),
+    )
+
+    stringify_null_purl_fields(package_data)
+    return package_data
+
+
+def build_parties(package, scanned_package):
+    """Return a list of new Party objects of ``package`` from ``scanned_package``."""
+    return [
+        Party(
+            package=package,
+            type=party.type,
+            role=party.role,
+            name=party.name,
+            email=party.email,
+            url=party.url,
+        )
+        for party in scanned_package.parties
+    ]
+
+
+def build_dependencies(package, scanned_package):
+    """
+    Return a list of new DependentPackage objects of ``package`` from
+    ``scanned_package``.
+    """
+    return [
+        DependentPackage(
+            package=package,
+            purl=dependency.purl,
+            extracted_requirement=dependency.extracted_requirement,
+            scope=dependency.scope,
+            is_runtime=dependency.is_runtime,
+            is_optional=dependency.is_optional,
+            is_pinned=dependency.is_pinned,
+        )
+        for dependency in scanned_package.dependencies
+    ]
+
+
+def get_purl_key(package):
+    return package.type, package.namespace, package.name, package.version
+
+
+def merge_or_create_packages(scanned_packages_and_levels):
+    """
+    Merge or create Packages in bulk from a list of (``scanned_package``,
+    `visit_level`) tuples and return a list of (package, created, merged,
+    map_error) tuples, one for each input tuple, like merge_or_create_package
+    would for each ``scanned_package`` processed in sequence.
+
+    The existing Packages of all the ``scanned_package`` are fetched with one
+    query. The new Packages, their Parties, DependentPackages and PackageSets
+    are inserted with bulk_create.
+
+    NOTE: this should be called from within a transaction.atomic block.
+    """
+    results = [None] * len(scanned_packages_and_levels)
+
+    download_urls = set()
+    for scanned_package, _ in scanned_packages_and_levels:
+        if not check_scanned_package(scanned_package):
+            download_urls.add(scanned_package.download_url)
+
+    stored_packages_by_download_url = {}
+    for stored_package in Package.objects.filter(download_url__in=download_urls):
+        stored_packages_by_download_url.setdefault(stored_package.download_url, stored_package)
+
+    # The index of each scanned package to create and the new Package
+    new_packages = []
+    # The index of the scanned packages with a download URL already seen in
+    # this batch: these are merged once the new Packages are created.
+    to_merge = []
+    for index, (scanned_package, visit_level) in enumerate(scanned_packages_and_levels):
+        map_error = check_scanned_package(scanned_package)
+        if map_error:
+            results[index] = (None, False, False, map_error)
+            continue
+
+        download_url = scanned_package.download_url
+        if download_url in download_urls:
+            download_urls.remove(download_url)
+        else:
+            to_merge.append(index)
+            continue
+
+        stored_package = stored_packages_by_download_url.get(download_url)
+        if stored_package:
+            package = update_stored_package(
+                stored_package, scanned_package, visit_level, mining_level=visit_level
+            )
+            results[index] = (package, False, True, "")
+            continue
+
+        package = Package(**get_package_data(scanned_package, mining_level=visit_level))
+        package.append_to_history(f"New Package created from URI: {download_url}")
+        # This is used in the case of Maven packages created from the priority queue
+        for h in scanned_package.extra_data.get("history", []):
+            package.append_to_history(h)
+        time = timezone.now()
+        package.created_date = time
+        package.last_modified_date = time
+        new_packages.append((index, package))
+
+    if new_packages:
+        Package.objects.bulk_create([package for _, package in new_packages])
+
+        parties = []
+        dependencies = []
+        for index, package in new_packages:
+            scanned_package, _ = scanned_packages_and_levels[index]
+            parties.extend(build_parties(package, scanned_package))
+            dependencies.extend(build_dependencies(package, scanned_package))
+            results[index] = (package, True, False, "")
+            logger.debug(f" + Inserted package\t: {package.download_url}")
+        Party.objects.bulk_create(parties)
+        DependentPackage.objects.bulk_create(dependencies)
+
+        add_to_related_package_sets([package for _, package in new_packages])
+
+    for index in to_merge:
+        scanned_package, visit_level = scanned_packages_and_levels[index]
+        results[index] = merge_or_create_package(scanned_package, visit_level)
+
+    return results
+
+
+def add_to_related_package_sets(new_packages):
+    """
+    Add the list of ``new_packages`` created in this order to the PackageSets
+    of the first existing Package with the same type, namespace, name and
+    version, or to a new PackageSet with that related Package, like
+    merge_or_create_package does for a single new Package.
+    """
+    purl_keys = {get_purl_key(package) for package in new_packages}
+    new_package_ids = [package.id for package in new_packages]
+
+    # The first Package with the same purl fields that existed before each
+    # new Package was created.
+    first_related_packages_by_purl_key = {}
+    candidates = (
+        Package.objects.filter(
+            type__in={package.type for package in new_packages},
+            name__in={package.name for package in new_packages},
+        )
+        .exclude(id__in=new_package_ids)
+        .only("id", "type", "namespace", "name", "version")
+        .order_by("id")
+    )
+    for package in candidates:
+        purl_key = get_purl_key(package)
+        if purl_key in purl_keys:
+            first_related_packages_by_purl_key.setdefault(purl_key, package)
+
+    package_set_ids_by_package_id = defaultdict(list)
+    related_package_ids = [package.id for package in first_related_packages_by_purl_key.values()]
+    through_model = Package.package_sets.through
+    for package_id, package_set_id in through_model.objects.filter(
+        package_id__in=related_package_ids
+    ).values_list("package_id", "packageset_id"):
+        package_set_ids_by_package_id[package_id].append(package_set_id)
+
+    new_package_sets = []
+    # List of (package id, PackageSet or PackageSet id) memberships to create
+    memberships = []
+    for package in new_packages:
+        purl_key = get_purl_key(package)
+        related_package = first_related_packages_by_purl_key.get(purl_key)
+        if not related_package:
+            first_related_packages_by_purl_key[purl_key] = package
+            continue
+
+        related_package_set_ids = package_set_ids_by_package_id[related_package.id]
+        if not related_package_set_ids or package.package_content == PackageContentType.BINARY:
+            # Binary packages can only be part of one set
+            package_set = PackageSet()
+            new_package_sets.append(package_set)
+            memberships.append((related_package.id, package_set))
+            memberships.append((package.id, package_set))
+            related_package_set_ids.append(package_set)
+            package_set_ids_by_package_id[package.id].append(package_set)
+        else:
+            for package_set_id in related_package_set_ids:
+                memberships.append((package.id, package_set_id))
+                package_set_ids_by_package_id[package.id].append(package_set_id)
+
+    PackageSet.objects.bulk_create(new_package_sets)
+    through_model.objects.bulk_create(
+        [
+            through_model(
+                package_id=package_id,
+                packageset_id=getattr(package_set, "id", package_set),
+            )
+            for package_id, package_set in memberships
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def get_resource_extra_data(resource_data):
+    """
+    Return the `extra_data` mapping to store on a purldb Resource from
+    Resource data `resource_data`, without the directory fingerprints that are
+    only stored in the fingerprint indexes.
+    """
+    extra_data = copy.deepcopy(resource_data.get("extra_data", {}))
+    extra_data.pop("directory_content", None)
+    extra_data.pop("directory_structure", None)
+    return extra_data
+
+
+def build_resource(package, resource_data):
+    """
+    Return a new unsaved purldb Resource from `package` using Resource data
+    from `resource_data`.
+    """
+    resource = Resource(
+        package=package,
+        path=resource_data.get("path"),
+        is_file=resource_data.get("type") == "file",
+        name=resource_data.get("name"),
+        extension=resource_data.get("extension"),
+        size=resource_data.get("size"),
+        md5=resource_data.get("md5"),
+        sha1=resource_data.get("sha1"),
+        sha256=resource_data.get("sha256"),
+        mime_type=resource_data.get("mime_type"),
+        file_type=resource_data.get("file_type"),
+        programming_language=resource_data.get("programming_language"),
+        is_binary=resource_data.get("is_binary"),
+        is_text=resource_data.get("is_text"),
+        is_archive=resource_data.get("is_archive"),
+        is_media=resource_data.get("is_media"),
+        is_key_file=resource_data.get("is_key_file"),
+        extra_data=get_resource_extra_data(resource_data),
+    )
+    resource.set_scan_results(resource_data)
+    return resource
+
+
 def update_or_create_resource(package, resource_data):
     """
     Create or update the corresponding purldb Resource from `package` using
@@ -463,34 +749,13 @@ def update_or_create_resource(package, resource_data):
     resource = None
     path = resource_data.get("path")
 
-    extra_data = copy.deepcopy(resource_data.get("extra_data", {}))
-    extra_data.pop("directory_content", None)
-    extra_data.pop("directory_structure", None)
+    extra_data = get_resource_extra_data(resource_data)
 
     try:
         resource = Resource.objects.get(package=package, path=path)
         updated = True
     except Resource.DoesNotExist:
-        resource = Resource(
-            package=package,
-            path=path,
-            is_file=resource_data.get("type") == "file",
-            name=resource_data.get("name"),
-            extension=resource_data.get("extension"),
-            size=resource_data.get("size"),
-            md5=resource_data.get("md5"),
-            sha1=resource_data.get("sha1"),
-            sha256=resource_data.get("sha256"),
-            mime_type=resource_data.get("mime_type"),
-            file_type=resource_data.get("file_type"),
-            programming_language=resource_data.get("programming_language"),
-            is_binary=resource_data.get("is_binary"),
-            is_text=resource_data.get("is_text"),
-            is_archive=resource_data.get("is_archive"),
-            is_media=resource_data.get("is_media"),
-            is_key_file=resource_data.get("is_key_file"),
-            extra_data=extra_data,
-        )
+        resource = build_resource(package, resource_data)
         created = True
     _ = resource.set_scan_results(resource_data, save=True)
     resource.update_extra_data(extra_data)
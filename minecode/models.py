@@ -10,10 +10,14 @@
 import logging
 import sys
 import uuid
+from collections import defaultdict
 from datetime import timedelta
 
 from django.conf import settings
+from django.db import connections
 from django.db import models
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 
 import django_rq
@@ -53,6 +57,167 @@ def get_canonical(uri):
     return normalized.unicode
 
 
+def get_leasable_lookup(lease_expiry=None):
+    """
+    Return a Q lookup for the queue rows that are not leased by a worker, e.g.
+    with an empty wip_date, or whose lease is older than `lease_expiry`
+    seconds. `lease_expiry` defaults to the MINECODE_LEASE_EXPIRY setting and
+    leases never expire if it is 0.
+
+    Parked rows, whose wip_date is kept on purpose to keep them out of the
+    queue, are not expired leases.
+    """
+    if lease_expiry is None:
+        lease_expiry = getattr(settings, "MINECODE_LEASE_EXPIRY", 0)
+
+    leasable = Q(wip_date__isnull=True)
+    if lease_expiry:
+        leasable |= Q(
+            wip_date__lt=timezone.now() - timedelta(seconds=lease_expiry),
+            is_parked=False,
+        )
+    return leasable
+
+
+def lease(queryset, count=1):
+    """
+    Lease up to `count` rows from the ordered queue `queryset` and return a
+    list of these rows in the `queryset` order.
+
+    The rows are claimed with a single ``UPDATE ... WHERE id IN (SELECT ...
+    FOR UPDATE SKIP LOCKED LIMIT count) RETURNING *`` statement that sets their
+    wip_date and resets their is_parked flag. Rows locked by other workers are
+    skipped. The callers release a leased row by resetting its wip_date to
+    null once processed, or park it with `park()` to keep it out of the queue.
+
+    Note: `queryset` is expected to exclude leased rows, for instance using
+    `get_leasable_lookup()`.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    pk_column = quote_name(model._meta.pk.column)
+    wip_date_column = quote_name(model._meta.get_field("wip_date").column)
+    is_parked_column = quote_name(model._meta.get_field("is_parked").column)
+
+    candidates = queryset.select_for_update(skip_locked=True).values("pk")[:count]
+    with transaction.atomic(using=queryset.db):
+        candidates_sql, candidates_params = candidates.query.sql_with_params()
+        # Only quoted names and the compiled candidates query are interpolated
+        sql = (
+            f"UPDATE {table} SET {wip_date_column} = %s, {is_parked_column} = %s "  # noqa: S608
+            f"WHERE {pk_column} IN ({candidates_sql}) RETURNING *"
+        )
+        leased = list(model.objects.raw(sql, [timezone.now(), False, *candidates_params]))
+
+    # RETURNING does not preserve the order of the queue: sort like the
+    # database would, with NULLs sorted last in ascending order
+    for field_name in reversed(queryset.query.order_by):
+        descending = field_name.startswith("-")
+        field_name = field_name.lstrip("-")
+
+        def get_sort_key(row, field_name=field_name):
+            value = getattr(row, field_name)
+            return (True,) if value is None else (False, value)
+
+        leased.sort(key=get_sort_key, reverse=descending)
+    return leased
+
+
+def get_held_lookup(rows):
+    """
+    Return a Q lookup for the leased queue `rows` whose lease is still held by
+    this worker, e.g. whose wip_date was not changed by another lease.
+    """
+    held = Q(pk__in=[])
+    for row in rows:
+        held |= Q(pk=row.pk, wip_date=row.wip_date)
+    return held
+
+
+def renew_leases(rows, lease_expiry=None):
+    """
+    Renew the leases of a list of leased queue `rows` once half of the
+    `lease_expiry` seconds have elapsed since they were leased or renewed, such
+    that rows waiting to be processed by this worker are not leased again by
+    another worker. `lease_expiry` defaults to the MINECODE_LEASE_EXPIRY
+    setting.
+
+    Return a list of the `rows` whose lease is still held by this worker.
+    """
+    if lease_expiry is None:
+        lease_expiry = getattr(settings, "MINECODE_LEASE_EXPIRY", 0)
+    if not rows or not lease_expiry:
+        return rows
+
+    now = timezone.now()
+    renew_before = now - timedelta(seconds=lease_expiry / 2)
+    expiring = [row for row in rows if row.wip_date and row.wip_date < renew_before]
+    if not expiring:
+        return rows
+
+    model = rows[0].__class__
+    model.objects.filter(get_held_lookup(expiring)).update(wip_date=now)
+    renewed_pks = set(
+        model.objects.filter(pk__in=[row.pk for row in expiring], wip_date=now).values_list(
+            "pk", flat=True
+        )
+    )
+
+    expiring_pks = {row.pk for row in expiring}
+    held = []
+    for row in rows:
+        if row.pk in expiring_pks:
+            if row.pk not in renewed_pks:
+                logger.warning(f"Lease lost for {row!r}")
+                continue
+            row.wip_date = now
+        held.append(row)
+    return held
+
+
+def release(rows):
+    """
+    Release the lease of a list of queue `rows` that were not processed, if
+    their lease is still held by this worker.
+    """
+    if not rows:
+        return
+    model = rows[0].__class__
+    model.objects.filter(get_held_lookup(rows)).update(wip_date=None)
+
+
+def save_and_release(row):
+    """
+    Release the lease of a processed queue `row` and save it, if its lease is
+    still held by this worker. Return True if saved.
+
+    The row is locked while checking its lease such that it cannot be leased
+    again by another worker before it is saved.
+    """
+    model = row.__class__
+    with transaction.atomic():
+        is_held = model.objects.select_for_update().filter(get_held_lookup([row])).exists()
+        if not is_held:
+            logger.warning(f"Lease lost for {row!r}: not saved")
+            return False
+        row.wip_date = None
+        row.save()
+    return True
+
+
+def park(row):
+    """
+    Park a leased queue `row`, if its lease is still held by this worker: keep
+    its wip_date such that it stays out of the queue and its lease does not
+    expire until its wip_date is cleared.
+    """
+    model = row.__class__
+    model.objects.filter(get_held_lookup([row])).update(is_parked=True)
+    row.is_parked = True
+
+
 class BaseURI(models.Model):
     """
     A base abstract model to store URI for crawling, scanning and indexing.
@@ -179,6 +344,24 @@ class BaseURI(models.Model):
 
 
 # TODO: Use the QuerySet.as_manager() for more flexibility and chaining.
+class ParkableMixin(models.Model):
+    """
+    A mixin for the queue models whose leased rows can be parked to keep them
+    out of the queue.
+    """
+
+    is_parked = models.BooleanField(
+        default=False,
+        help_text="When set to True (Yes), the wip_date was kept on purpose to "
+        "keep this URI out of the queue, such as when no route is available "
+        "to process it or while its scan is running, and it is not an "
+        "expired worker lease. Set back to False when this URI is leased.",
+    )
+
+    class Meta:
+        abstract = True
+
+
 class ResourceURIManager(models.Manager):
     def insert(self, uri, **extra_fields):
         """
@@ -251,64 +434,56 @@ class ResourceURIManager(models.Manager):
         )
         return revisitables
 
-    def get_visitables(self):
+    def get_visitables(self, lease_expiry=0):
         """
-        Return an ordered query set of all visitable ResourceURIs.
+        Return an ordered query set of all visitable ResourceURIs. These are
+        the never visited ResourceURIs and the revisitable ResourceURIs as
+        returned by `never_visited()` and `get_revisitables(hours=240)`.
+
+        Also include the ResourceURIs whose lease is older than `lease_expiry`
+        seconds. See `get_leasable_lookup()`.
+
         Note: this does not evaluate the query set and does not lock the
         database for update.
         """
-        never_visited = self.never_visited().filter(is_visitable__exact=True)
-        revisitables = self.get_revisitables(hours=240)
-
-        if revisitables.exists():
-            # Combine both QuerySets
-
-            # TODO: consider returning chunks (.iterator())
-            visitables = never_visited.union(revisitables)
-        else:
-            visitables = never_visited
-
+        never_visited = Q(last_visit_date__isnull=True)
+        revisitables = Q(
+            last_visit_date__lt=timezone.now() - timedelta(hours=240),
+        ) & ~Q(is_mappable=True, last_map_date__isnull=True)
+
+        visitables = self.filter(
+            get_leasable_lookup(lease_expiry),
+            never_visited | revisitables,
+            is_visitable=True,
+        )
         # NOTE: this matches an index for efficient ordering
         visitables = visitables.order_by("-priority", "-uri")
         return visitables
 
-    def get_next_visitable(self):
+    def lease_visitables(self, count=1, lease_expiry=None):
         """
-        Return the next ResourceURI candidate for visit and mark it as
-        being "in_progress" by setting the wip_date field.
-        Return None when there is no candidate left to visit.
+        Lease and return a list of up to `count` ResourceURI candidates for
+        visit, marking them as being "in_progress" by setting their wip_date.
 
-        NOTE: this method can only be called from within a
-        transaction.atomic block.
+        ResourceURIs with a lease older than `lease_expiry` seconds are leased
+        again. See `get_leasable_lookup()`.
 
         Note: the ResourceURI table is used as a queue that can be
         sorted by priority and tracks the status of visits of each
         ResourceURI. ResourceURI that have not yet been visited are
         sorted by decreasing priority.
         """
-        # We use select_for_update to ensure an atomic query. We ignore
-        # locked rows by using skip_locked=True available since Django
-        # 1.11.
-
-        # Locked row are being updated in other workers and therefore
-        # there is nothing to do with these. This is a great way to get
-        # an efficient queue in a model.
-
-        # Per Postgres doc:
-        # With SKIP LOCKED, any selected rows that cannot be immediately
-        # locked are skipped. Skipping locked rows provides an
-        # inconsistent view of the data, so this is not suitable for
-        # general purpose work, but can be used to avoid lock contention
-        # with multiple consumers accessing a queue-like table.
-        resource_uri = self.get_visitables().select_for_update(skip_locked=True).first()
-        if not resource_uri:
-            return
+        return lease(self.get_visitables(lease_expiry=lease_expiry), count=count)
 
-        # Mark the URI as wip: Callers mark this done by resetting
-        # wip_date to null
-        resource_uri.wip_date = timezone.now()
-        resource_uri.save(update_fields=["wip_date"])
-        return resource_uri
+    def get_next_visitable(self):
+        """
+        Return the next ResourceURI candidate for visit and mark it as
+        being "in_progress" by setting the wip_date field.
+        Return None when there is no candidate left to visit.
+        """
+        resource_uris = self.lease_visitables(count=1)
+        if resource_uris:
+            return resource_uris[0]
 
     def never_mapped(self):
         """
@@ -332,19 +507,40 @@ class ResourceURIManager(models.Manager):
         """Limit the QuerySet to ResourceURIs that were mapped with errors."""
         return self.mapped().filter(has_map_error=True)
 
-    def get_mappables(self):
+    def get_mappables(self, lease_expiry=0):
         """
         Return an ordered query set of all mappable ResourceURIs.
+
+        Also include the ResourceURIs whose lease is older than `lease_expiry`
+        seconds. See `get_leasable_lookup()`.
+
         Note: this does not evaluate the query set and does not lock the
         database for update.
         """
-        qs = self.never_mapped().filter(is_mappable__exact=True, has_map_error=False)
+        qs = self.filter(
+            get_leasable_lookup(lease_expiry),
+            last_visit_date__isnull=False,
+            has_visit_error=False,
+            last_map_date__isnull=True,
+            is_mappable=True,
+            has_map_error=False,
+        )
         # NOTE: this matches an index for efficient ordering
         qs = qs.order_by("-priority")
         return qs
 
+    def lease_mappables(self, count=1, lease_expiry=None):
+        """
+        Lease and return a list of up to `count` ResourceURI candidates for
+        mapping, marking them as being "in_progress" by setting their wip_date.
+
+        ResourceURIs with a lease older than `lease_expiry` seconds are leased
+        again. See `get_leasable_lookup()`.
+        """
+        return lease(self.get_mappables(lease_expiry=lease_expiry), count=count)
+
 
-class ResourceURI(BaseURI):
+class ResourceURI(BaseURI, ParkableMixin):
     """
     Stores URI that are crawled (aka. visited) and the progress of this process.
     Also used as a processing "to do" queue for visiting and mapping these URIs.
@@ -482,12 +678,19 @@ class ResourceURI(BaseURI):
         self.is_visitable = visit_router.is_routable(uri)
         self.is_mappable = map_router.is_routable(uri)
 
-    def save(self, *args, **kwargs):
-        """Save, adding defaults for computed fields and validating fields."""
+    def set_computed_fields(self):
+        """
+        Set defaults for computed fields and validate fields. This is done on
+        save() and must be called on ResourceURIs created with bulk_create().
+        """
         self._set_defauts()
         self.normalize_fields()
         self.has_map_error = True if self.map_error else False
         self.has_visit_error = True if self.visit_error else False
+
+    def save(self, *args, **kwargs):
+        """Save, adding defaults for computed fields and validating fields."""
+        self.set_computed_fields()
         super().save(*args, **kwargs)
 
 
@@ -503,96 +706,98 @@ class ScannableURIManager(models.Manager):
         qs = qs.order_by("-priority")
         return qs
 
-    def get_next_scannable(self):
+    def lease_scannables(self, count=1, lease_expiry=None):
         """
-        Return the next ScannableURI candidate for scan and mark it as
-        being "processed" by setting the wip_date field.
-        Return None when there is no candidate left to scan.
+        Lease and return a list of up to `count` ScannableURI candidates for
+        scan, marking them as being "processed" by setting their wip_date.
 
-        NOTE: this method can only be called from within a
-        transaction.atomic block.
+        ScannableURIs with a lease older than `lease_expiry` seconds are leased
+        again. See `get_leasable_lookup()`.
         """
-        return self.__get_next_candidate(self.get_scannables())
+        scannables = self.get_scannables().filter(get_leasable_lookup(lease_expiry))
+        return lease(scannables, count=count)
 
-    def __get_next_candidate(self, qs):
+    def get_next_scannable(self):
         """
-        Return and "lock" the next candidate ScannableURI from the `qs` query
-        set or None.
-
-        Mark it as being "processed" by setting the wip_date field. Return None
-        when there is no candidate left.
-
-        Note: this table is used as a queue that can be
-        sorted by priority and tracks the status of scan requests.
-        URI that have not yet been requested for scan are
-        sorted by decreasing priority.
+        Return the next ScannableURI candidate for scan and mark it as
+        being "processed" by setting the wip_date field.
+        Return None when there is no candidate left to scan.
         """
-        # FIXME: use a shared function for this
-
-        # We use select_for_update to ensure an atomic query. We ignore
-        # locked rows by using skip_locked=True available since Django
-        # 1.11.
-
-        # Locked row are being updated in other workers and therefore
-        # there is nothing to do with these. This is a great way to get
-        # an efficient queue in a model.
-
-        # Per Postgres doc:
-        # With SKIP LOCKED, any selected rows that cannot be immediately
-        # locked are skipped. Skipping locked rows provides an
-        # inconsistent view of the data, so this is not suitable for
-        # general purpose work, but can be used to avoid lock contention
-        # with multiple consumers accessing a queue-like table.
-        candidate_uris = qs.select_for_update(skip_locked=True)
-
-        # keep the top record if there is one
-        candidate_uris = candidate_uris[:1]
-
-        # This force the evaluation of the query but only once
-        # (previously exists then get was evaluating two QS)
-        candidate_uris = list(candidate_uris)
-        if not candidate_uris:
-            return
-
-        canidate_uri = candidate_uris[0]
-
-        # Mark the URI as wip: Callers mark this done by resetting
-        # wip_date to null
-        canidate_uri.wip_date = timezone.now()
-        canidate_uri.save(update_fields=["wip_date"])
-        return canidate_uri
+        scannable_uris = self.lease_scannables(count=1)
+        if scannable_uris:
+            return scannable_uris[0]
 
-    def get_processables(self):
+    def get_processables(self, lease_expiry=0):
         """
         Return an ordered query set of all "processable" ScannableURIs that have
         been submitted and are in a state where they can be processed.
 
+        Also include the ScannableURIs whose lease is older than `lease_expiry`
+        seconds. See `get_leasable_lookup()`.
+
         Note: this does not evaluate the query set and does not lock the
         database for update.
         """
         qs = self.filter(
+            get_leasable_lookup(lease_expiry),
             scan_status__in=[
                 ScannableURI.SCAN_SUBMITTED,
                 ScannableURI.SCAN_IN_PROGRESS,
                 ScannableURI.SCAN_COMPLETED,
             ],
-            wip_date=None,
             scan_error=None,
         )
         # NOTE: this matches an index for efficient ordering
         qs = qs.order_by("-scan_status", "-priority")
         return qs
 
+    def lease_processables(self, count=1, lease_expiry=None):
+        """
+        Lease and return a list of up to `count` processable ScannableURIs,
+        marking them as being "in_progress" by setting their wip_date.
+
+        ScannableURIs with a lease older than `lease_expiry` seconds are leased
+        again. See `get_leasable_lookup()`.
+        """
+        return lease(self.get_processables(lease_expiry=lease_expiry), count=count)
+
     def get_next_processable(self):
         """
         Return the next ScannableURI candidate for visit and mark it as
         being "in_progress" by setting the wip_date field.
         Return None when there is no candidate left to visit.
+        """
+        scannable_uris = self.lease_processables(count=1)
+        if scannable_uris:
+            return scannable_uris[0]
 
-        NOTE: this method can only be called from within a
-        transaction.atomic block.
+    def get_timed_out(self, scan_timeout=None):
         """
-        return self.__get_next_candidate(self.get_processables())
+        Return a query set of the submitted or in progress ScannableURIs with a
+        scan started more than `scan_timeout` seconds ago. `scan_timeout`
+        defaults to the MINECODE_SCAN_TIMEOUT setting.
+        """
+        if scan_timeout is None:
+            scan_timeout = settings.MINECODE_SCAN_TIMEOUT
+        return self.filter(
+            scan_status__in=[
+                ScannableURI.SCAN_SUBMITTED,
+                ScannableURI.SCAN_IN_PROGRESS,
+            ],
+            scan_date__lt=timezone.now() - timedelta(seconds=scan_timeout),
+        )
+
+    def timeout_scans(self, scan_timeout=None):
+        """
+        Mark all the submitted or in progress ScannableURIs with a scan started
+        more than `scan_timeout` seconds ago as timed out with a single UPDATE
+        query and release their lease. Return the number of timed out
+        ScannableURIs.
+        """
+        return self.get_timed_out(scan_timeout=scan_timeout).update(
+            scan_status=ScannableURI.SCAN_TIMEOUT,
+            wip_date=None,
+        )
 
     def statistics(self):
         """Return a statistics mapping with summary counts of ScannableURI grouped by status."""
@@ -645,7 +850,7 @@ class ScannableURIManager(models.Manager):
             yield recent
 
 
-class ScannableURI(BaseURI):
+class ScannableURI(BaseURI, ParkableMixin):
     """
     Stores URLs for downloadable packages to scan.
     Used as a processing "to do" queue for controlling scanning of these URLs.
@@ -773,11 +978,18 @@ class ScannableURI(BaseURI):
             models.Index(fields=["-priority"]),
         ]
 
-    def save(self, *args, **kwargs):
-        """Save, adding defaults for computed fields and validating fields."""
+    def set_computed_fields(self):
+        """
+        Set defaults for computed fields and validate fields. This is done on
+        save() and must be called on ScannableURIs created with bulk_create().
+        """
         if not self.canonical:
             self.canonical = get_canonical(self.uri)
         self.normalize_fields()
+
+    def save(self, *args, **kwargs):
+        """Save, adding defaults for computed fields and validating fields."""
+        self.set_computed_fields()
         super().save(*args, **kwargs)
 
     def process_scan_results(
@@ -819,50 +1031,101 @@ class PriorityResourceURIManager(models.Manager):
         """
         # TODO: be able to create a request for an existing purl if the previous request has been completed already
 
-        priority_resource_uris = self.filter(uri=uri, package_url=uri, **extra_fields)
-        if priority_resource_uris.count() == 0 or all(
-            p.processed_date for p in priority_resource_uris
-        ):
+        pending = self.filter(uri=uri, package_url=uri, processed_date__isnull=True, **extra_fields)
+        if not pending.exists():
             priority_resource_uri = self.create(uri=uri, package_url=uri, **extra_fields)
             return priority_resource_uri
 
+    def insert_many(self, uris_and_extra_fields, batch_size=1000):
+        """
+        Create new PriorityResourceURIs in bulk from a list of (uri,
+        extra_fields mapping) tuples and return a list with the new
+        PriorityResourceURI or None for each tuple, like `insert()` does.
+
+        No PriorityResourceURI is created for a `uri` that has a request with
+        the same `extra_fields` that is not processed yet. The pending requests
+        of the `uri` are fetched with one query for each `batch_size` uris.
+        """
+        # Mapping of {uri: [pending request field values mapping, ...]}
+        pending_by_uri = defaultdict(list)
+        field_names = sorted(
+            {name for _, extra_fields in uris_and_extra_fields for name in extra_fields}
+        )
+        uris = list({uri for uri, _ in uris_and_extra_fields})
+        for start in range(0, len(uris), batch_size):
+            pending = self.filter(
+                uri__in=uris[start : start + batch_size],
+                processed_date__isnull=True,
+            ).values("uri", "package_url", *field_names)
+            for values in pending:
+                if values["uri"] == values["package_url"]:
+                    pending_by_uri[values["uri"]].append(values)
+
+        new_priority_resource_uris = []
+        results = []
+        for uri, extra_fields in uris_and_extra_fields:
+            is_pending = any(
+                all(values[name] == value for name, value in extra_fields.items())
+                for values in pending_by_uri[uri]
+            )
+            if is_pending:
+                results.append(None)
+                continue
+            priority_resource_uri = self.model(uri=uri, package_url=uri, **extra_fields)
+            priority_resource_uri.normalize_fields()
+            new_priority_resource_uris.append(priority_resource_uri)
+            results.append(priority_resource_uri)
+            pending_by_uri[uri].append(dict(extra_fields))
+
+        self.bulk_create(new_priority_resource_uris, batch_size=batch_size)
+        return results
+
     def in_progress(self):
         """Limit the QuerySet to PriorityResourceURI being processed."""
         return self.filter(wip_date__isnull=False)
 
-    def never_processed(self):
+    def never_processed(self, lease_expiry=0):
         """
         Limit the QuerySet to PriorityResourceURIs that have never been processed.
         This is usually the state of a PriorityResourceURI after upon creation.
+
+        Also include the PriorityResourceURIs whose lease is older than
+        `lease_expiry` seconds. See `get_leasable_lookup()`.
         """
-        return self.filter(processed_date__isnull=True, wip_date__isnull=True).order_by(
-            "request_date"
-        )
+        return self.filter(
+            get_leasable_lookup(lease_expiry),
+            processed_date__isnull=True,
+        ).order_by("request_date")
 
-    def get_requests(self):
+    def get_requests(self, lease_expiry=0):
         """Return an ordered query set of all processable PriorityResourceURIs."""
-        never_processed = self.never_processed()
+        never_processed = self.never_processed(lease_expiry=lease_expiry)
         return never_processed
 
+    def lease_requests(self, count=1, lease_expiry=None):
+        """
+        Lease and return a list of up to `count` PriorityResourceURI requests
+        for processing, marking them as being "in_progress" by setting their
+        wip_date.
+
+        PriorityResourceURIs with a lease older than `lease_expiry` seconds are
+        leased again. See `get_leasable_lookup()`.
+        """
+        return lease(self.get_requests(lease_expiry=lease_expiry), count=count)
+
     def get_next_request(self):
         """
         Return the next PriorityResourceURI request for processing and mark it
         as being "in_progress" by setting the wip_date field.
 
         Return None when there is no request left to visit.
-
-        NOTE: this method can only be called from within a transaction.atomic
-        block.
         """
-        priority_resource_uri = self.get_requests().select_for_update(skip_locked=True).first()
-        if not priority_resource_uri:
-            return
-        priority_resource_uri.wip_date = timezone.now()
-        priority_resource_uri.save(update_fields=["wip_date"])
-        return priority_resource_uri
+        priority_resource_uris = self.lease_requests(count=1)
+        if priority_resource_uris:
+            return priority_resource_uris[0]
 
 
-class PriorityResourceURI(BaseURI):
+class PriorityResourceURI(BaseURI, ParkableMixin):
     """
     Stores URI that are crawled (aka. visited) and the progress of this process.
     Also used as a processing "to do" queue for visiting and mapping these URIs.
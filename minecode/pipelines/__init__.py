@@ -22,8 +22,8 @@ from scanpipe.pipelines import Pipeline
 from scanpipe.pipes import federatedcode
 
 from minecode import pipes
+from minecode.pipes import add_packageurls_to_checkout
 from minecode.pipes import write_package_data_to_file
-from minecode.pipes import write_packageurls_to_file
 
 module_logger = logging.getLogger(__name__)
 
@@ -162,6 +162,8 @@ def commit_and_push_packageurls(
     If `checkpoint_on_commit` is True and `checkpoint_func` exists, then we execute `checkpoint_func`.
 
     If `checkpoint_on_commit` is False, then we determine if it is time to call `checkpoint_func` or not.
+
+    Return the time of the last call to `checkpoint_func`, updated from `last_checkpoint_call`.
     """
 
     if logger:
@@ -184,6 +186,8 @@ def commit_and_push_packageurls(
             checkpoint_func()
             last_checkpoint_call = time_now
 
+    return last_checkpoint_call
+
 
 def get_repo_checkout_from_data_cluster(
     data_cluster, purl, checked_out_repos, working_path, logger, datafile_name=None
@@ -256,8 +260,8 @@ def _mine_and_publish_packageurls(
         if purls_package_repo_checkout not in current_working_repos:
             current_working_repos.append(purls_package_repo_checkout)
 
-        purl_file = write_packageurls_to_file(
-            repo=purls_package_repo_checkout["repo"],
+        purl_file = add_packageurls_to_checkout(
+            repo_checkout=purls_package_repo_checkout,
             relative_datafile_path=purls_datafile_path,
             packageurls=purls,
             append=append_purls,
@@ -267,7 +271,7 @@ def _mine_and_publish_packageurls(
         currently_processed_files_count += 1
 
         if currently_processed_files_count > batch_size:
-            commit_and_push_packageurls(
+            last_checkpoint_call = commit_and_push_packageurls(
                 current_working_repos=current_working_repos,
                 commit_msg_func=commit_msg_func,
                 checkpoint_func=checkpoint_func,
@@ -314,7 +318,7 @@ def _mine_and_publish_packageurls(
             currently_processed_files_count += 1
 
             if currently_processed_files_count > batch_size:
-                commit_and_push_packageurls(
+                last_checkpoint_call = commit_and_push_packageurls(
                     current_working_repos=current_working_repos,
                     commit_msg_func=commit_msg_func,
                     checkpoint_func=checkpoint_func,
@@ -68,6 +68,23 @@ class MineMaven(MineCodeBasePipeline):
             logger=self.log,
         )
 
+    def save_index_checkpoint(self):
+        """
+        Save the index records consumed by the current MavenNexusCollector to
+        resume mining this index from there if the pipeline run is interrupted.
+        """
+        checkpoint = {
+            "last_incremental": self.last_incremental,
+            "index_checkpoint": self.maven_nexus_collector.checkpoint,
+        }
+        self.log(f"Saving checkpoint: {checkpoint}")
+        pipes.update_checkpoints_in_github(
+            checkpoint=checkpoint,
+            cloned_repo=self.checkpoint_config_repo,
+            path=self.checkpoint_path,
+            logger=self.log,
+        )
+
     @optional_step("repo1.maven.org")
     def fetch_maven_index_repo1_maven_org(self):
         checkpoint_path = "maven/repo.maven.org/checkpoints.json"
@@ -78,10 +95,14 @@ class MineMaven(MineCodeBasePipeline):
         )
         last_incremental = checkpoint.get("last_incremental")
         self.log(f"last_incremental: {last_incremental}")
+        self.checkpoint_path = checkpoint_path
+        self.last_incremental = last_incremental
         self.maven_nexus_collector = maven.MavenNexusCollector(
             maven_url=maven_url,
             last_incremental=last_incremental,
             logger=self.log,
+            max_workers=maven.MAVEN_INDEX_MAX_WORKERS,
+            checkpoint=checkpoint.get("index_checkpoint"),
         )
 
     @optional_step("repo1.maven.org")
@@ -95,6 +116,7 @@ class MineMaven(MineCodeBasePipeline):
             append_purls=self.append_purls,
             commit_msg_func=self.commit_message,
             logger=self.log,
+            checkpoint_func=self.save_index_checkpoint,
         )
 
     @optional_step("repo1.maven.org")
@@ -122,10 +144,14 @@ class MineMaven(MineCodeBasePipeline):
         )
         last_incremental = checkpoint.get("last_incremental")
         self.log(f"last_incremental: {last_incremental}")
+        self.checkpoint_path = checkpoint_path
+        self.last_incremental = last_incremental
         self.maven_nexus_collector = maven.MavenNexusCollector(
             maven_url=maven_url,
             last_incremental=last_incremental,
             logger=self.log,
+            max_workers=maven.MAVEN_INDEX_MAX_WORKERS,
+            checkpoint=checkpoint.get("index_checkpoint"),
         )
 
     @optional_step("repo.spring.io/release")
@@ -139,6 +165,7 @@ class MineMaven(MineCodeBasePipeline):
             append_purls=self.append_purls,
             commit_msg_func=self.commit_message,
             logger=self.log,
+            checkpoint_func=self.save_index_checkpoint,
         )
 
     @optional_step("repo.spring.io/release")
@@ -166,10 +193,14 @@ class MineMaven(MineCodeBasePipeline):
         )
         last_incremental = checkpoint.get("last_incremental")
         self.log(f"last_incremental: {last_incremental}")
+        self.checkpoint_path = checkpoint_path
+        self.last_incremental = last_incremental
         self.maven_nexus_collector = maven.MavenNexusCollector(
             maven_url=maven_url,
             last_incremental=last_incremental,
             logger=self.log,
+            max_workers=maven.MAVEN_INDEX_MAX_WORKERS,
+            checkpoint=checkpoint.get("index_checkpoint"),
         )
 
     @optional_step("repo.spring.io/milestone")
@@ -183,6 +214,7 @@ class MineMaven(MineCodeBasePipeline):
             append_purls=self.append_purls,
             commit_msg_func=self.commit_message,
             logger=self.log,
+            checkpoint_func=self.save_index_checkpoint,
         )
 
     @optional_step("repo.spring.io/milestone")
@@ -210,10 +242,14 @@ class MineMaven(MineCodeBasePipeline):
         )
         last_incremental = checkpoint.get("last_incremental")
         self.log(f"last_incremental: {last_incremental}")
+        self.checkpoint_path = checkpoint_path
+        self.last_incremental = last_incremental
         self.maven_nexus_collector = maven.MavenNexusCollector(
             maven_url=maven_url,
             last_incremental=last_incremental,
             logger=self.log,
+            max_workers=maven.MAVEN_INDEX_MAX_WORKERS,
+            checkpoint=checkpoint.get("index_checkpoint"),
         )
 
     @optional_step("plugins.gradle.org")
@@ -227,6 +263,7 @@ class MineMaven(MineCodeBasePipeline):
             append_purls=self.append_purls,
             commit_msg_func=self.commit_message,
             logger=self.log,
+            checkpoint_func=self.save_index_checkpoint,
         )
 
     @optional_step("plugins.gradle.org")
@@ -254,10 +291,14 @@ class MineMaven(MineCodeBasePipeline):
         )
         last_incremental = checkpoint.get("last_incremental")
         self.log(f"last_incremental: {last_incremental}")
+        self.checkpoint_path = checkpoint_path
+        self.last_incremental = last_incremental
         self.maven_nexus_collector = maven.MavenNexusCollector(
             maven_url=maven_url,
             last_incremental=last_incremental,
             logger=self.log,
+            max_workers=maven.MAVEN_INDEX_MAX_WORKERS,
+            checkpoint=checkpoint.get("index_checkpoint"),
         )
 
     @optional_step("repository.apache.org")
@@ -271,6 +312,7 @@ class MineMaven(MineCodeBasePipeline):
             append_purls=self.append_purls,
             commit_msg_func=self.commit_message,
             logger=self.log,
+            checkpoint_func=self.save_index_checkpoint,
         )
 
     @optional_step("repository.apache.org")
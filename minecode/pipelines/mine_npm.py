@@ -75,11 +75,11 @@ class MineNPM(MineCodeBasePipeline):
     def save_check_point(self):
         npm.save_mined_packages_in_checkpoint(
             packages_mined=self.packages_mined,
-            synced_packages=self.synced_packages,
             config_repo=self.config_repo,
             logger=self.log,
         )
-        self.packages_mined = []
+        # The mining generator keeps appending to this same list
+        self.packages_mined.clear()
 
     def mine_and_publish_packageurls(self):
         """Mine and publish PackageURLs."""
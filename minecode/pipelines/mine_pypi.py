@@ -76,7 +76,8 @@ class MinePypi(MineCodeBasePipeline):
             config_repo=self.config_repo,
             logger=self.log,
         )
-        self.packages_mined = []
+        # The mining generator keeps appending to this same list
+        self.packages_mined.clear()
 
     def mine_and_publish_packageurls(self):
         """Mine and publish PackageURLs."""
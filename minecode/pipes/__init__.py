@@ -48,11 +48,13 @@ def write_packages_json(packages, name):
     return temp_file
 
 
-def fetch_checkpoint_from_github(config_repo, checkpoint_path):
+def get_raw_github_url(config_repo, path):
     repo_name = config_repo.split("github.com")[-1]
-    checkpoints_file = (
-        "https://raw.githubusercontent.com/" + repo_name + "refs/heads/main/" + checkpoint_path
-    )
+    return "https://raw.githubusercontent.com/" + repo_name + "refs/heads/main/" + path
+
+
+def fetch_checkpoint_from_github(config_repo, checkpoint_path):
+    checkpoints_file = get_raw_github_url(config_repo, checkpoint_path)
 
     response = requests.get(checkpoints_file)
     if not response.ok:
@@ -103,26 +105,95 @@ def update_checkpoints_file_in_github(checkpoints_file, cloned_repo, path):
     )
 
 
+def get_mined_packages_path(checkpoint_path):
+    """
+    Return the path of the mined packages file for the JSON mined packages
+    `checkpoint_path`.
+
+    This file is an append-only list of mined packages, one per line, stored
+    as a series of gzip members: one for each batch of mined packages.
+    Concatenated gzip members are decompressed as a single file.
+    """
+    base_path, _extension = os.path.splitext(checkpoint_path)
+    return base_path + ".txt.gz"
+
+
+def read_mined_packages(content):
+    """Return a set of mined packages from a mined packages file `content` bytes."""
+    if not content:
+        return set()
+    lines = gzip.decompress(content).decode("utf-8").splitlines()
+    return {line for line in lines if line}
+
+
 def get_mined_packages_from_checkpoint(config_repo, checkpoint_path):
+    """
+    Return a set of the mined packages saved in the `config_repo` for the
+    `checkpoint_path`. This includes the packages of the mined packages file and
+    of the legacy JSON "packages_mined" list.
+    """
     checkpoint = fetch_checkpoint_from_github(
         config_repo=config_repo,
         checkpoint_path=checkpoint_path,
     )
-    return checkpoint.get("packages_mined", [])
+    mined_packages = set(checkpoint.get("packages_mined", []))
 
+    mined_packages_file = get_raw_github_url(config_repo, get_mined_packages_path(checkpoint_path))
+    response = requests.get(mined_packages_file)
+    if response.ok:
+        mined_packages.update(read_mined_packages(response.content))
+    return mined_packages
 
-def update_mined_packages_in_checkpoint(
-    packages, config_repo, cloned_repo, checkpoint_path, logger=None
-):
-    mined_packages = get_mined_packages_from_checkpoint(
-        config_repo=config_repo,
-        checkpoint_path=checkpoint_path,
+
+def update_mined_packages_in_checkpoint(packages, cloned_repo, checkpoint_path, logger=None):
+    """
+    Append the mined `packages` to the mined packages file of the
+    `checkpoint_path` in the `cloned_repo`, then commit and push this file.
+    Only the new `packages` are written and pushed, not all the packages
+    mined so far.
+    """
+    from scanpipe.pipes.federatedcode import commit_and_push_changes
+
+    if not packages:
+        return
+
+    mined_packages_path = os.path.join(
+        cloned_repo.working_dir, get_mined_packages_path(checkpoint_path)
     )
-    packages_to_update = {"packages_mined": packages + mined_packages}
-    update_checkpoints_in_github(
-        checkpoint=packages_to_update,
-        cloned_repo=cloned_repo,
-        path=checkpoint_path,
+    os.makedirs(os.path.dirname(mined_packages_path), exist_ok=True)
+    content = "".join(f"{package}\n" for package in sorted(set(packages)))
+    with open(mined_packages_path, "ab") as f:
+        f.write(gzip.compress(content.encode("utf-8")))
+
+    commit_message = """Update federatedcode purl mining checkpoint"""
+    commit_and_push_changes(
+        repo=cloned_repo,
+        files_to_commit=[mined_packages_path],
+        commit_message=commit_message,
+        logger=logger,
+    )
+
+
+def clear_mined_packages_in_checkpoint(cloned_repo, checkpoint_path, logger=None):
+    """
+    Clear the mined packages of the `checkpoint_path` in the `cloned_repo`,
+    then commit and push the cleared files.
+    """
+    from scanpipe.pipes.federatedcode import commit_and_push_changes
+
+    json_checkpoint_path = os.path.join(cloned_repo.working_dir, checkpoint_path)
+    write_data_to_json_file(path=json_checkpoint_path, data={"packages_mined": []})
+    mined_packages_path = os.path.join(
+        cloned_repo.working_dir, get_mined_packages_path(checkpoint_path)
+    )
+    with open(mined_packages_path, "wb"):
+        pass
+
+    commit_message = """Update federatedcode purl mining checkpoint"""
+    commit_and_push_changes(
+        repo=cloned_repo,
+        files_to_commit=[json_checkpoint_path, mined_packages_path],
+        commit_message=commit_message,
         logger=logger,
     )
 
@@ -171,6 +242,49 @@ def write_packageurls_to_file(repo, relative_datafile_path, packageurls, append=
     return relative_datafile_path
 
 
+def add_packageurls_to_checkout(repo_checkout, relative_datafile_path, packageurls, append=False):
+    """
+    Add the `packageurls` list to the purl file at `relative_datafile_path` of
+    a `repo_checkout` and return this path. Replace the purls of the file
+    unless `append` is True.
+
+    The purls of each file are kept in memory for the duration of a run and
+    the file is only written when the checkout is committed, once per commit
+    however many times purls were added to it.
+    """
+    if not isinstance(packageurls, list):
+        raise Exception("`packageurls` needs to be a list")
+
+    purls_by_file = repo_checkout["purls_by_file"]
+    purls = purls_by_file.get(relative_datafile_path)
+    if purls is None:
+        purls = purls_by_file[relative_datafile_path] = set()
+        purl_file_full_path = Path(repo_checkout["repo"].working_dir) / relative_datafile_path
+        if append and purl_file_full_path.exists():
+            purls.update(load_data_from_yaml_file(purl_file_full_path) or [])
+    elif not append:
+        purls.clear()
+
+    purls.update(packageurls)
+    repo_checkout["purl_files_to_write"].add(relative_datafile_path)
+    return relative_datafile_path
+
+
+def write_checkout_packageurls(repo_checkout):
+    """
+    Write the purl files of a `repo_checkout` that had purls added since they
+    were last written.
+    """
+    repo = repo_checkout["repo"]
+    purls_by_file = repo_checkout["purls_by_file"]
+    for relative_datafile_path in repo_checkout["purl_files_to_write"]:
+        write_data_to_yaml_file(
+            path=Path(repo.working_dir) / relative_datafile_path,
+            data=sorted(purls_by_file[relative_datafile_path]),
+        )
+    repo_checkout["purl_files_to_write"].clear()
+
+
 def write_package_data_to_file(repo, relative_api_package_metadata_datafile_path, package_data):
     api_package_metadata_datafile_full_path = (
         Path(repo.working_dir) / relative_api_package_metadata_datafile_path
@@ -298,12 +412,16 @@ def init_local_checkout(repo_name, working_path, logger):
         "file_to_commit": set(),
         "file_processed_count": 0,
         "commit_count": 0,
+        # purls by purl file path, see add_packageurls_to_checkout()
+        "purls_by_file": {},
+        "purl_files_to_write": set(),
     }
 
 
 def commit_and_push_checkout(local_checkout, commit_message, logger):
     from scanpipe.pipes.federatedcode import commit_and_push_changes
 
+    write_checkout_packageurls(local_checkout)
     if commit_and_push_changes(
         commit_message=commit_message,
         repo=local_checkout["repo"],
@@ -26,7 +26,7 @@ from pathlib import Path
 from aboutcode.hashid import get_core_purl
 from packageurl import PackageURL
 
-import requests
+from minecode.pipes import fetch
 
 
 def get_cargo_packages(packages):
@@ -53,11 +53,13 @@ def get_cargo_packages(packages):
 
 def yield_cargo_package_data(name, packageurls=[]):
     api_url_template = "https://crates.io/api/v1/crates/{name}/{version}"
+    package_data_urls = []
     for purl in packageurls:
         package_url = PackageURL.from_string(purl)
-        package_data_url = api_url_template.format(name=name, version=package_url.version)
-        response = requests.get(package_data_url)
-        if not response.ok:
+        package_data_urls.append(api_url_template.format(name=name, version=package_url.version))
+    responses = fetch.fetch_all(package_data_urls)
+    for purl, response in zip(packageurls, responses):
+        if response is None or not response.ok:
             continue
         yield purl, response.json()
 
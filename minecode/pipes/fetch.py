@@ -0,0 +1,126 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+"""
+Fetch the package metadata of the mining pipelines concurrently.
+
+The requests share a pool of keep-alive HTTP connections, are retried with an
+exponential backoff on connection errors and on rate limiting or server errors,
+and are bounded by host to not overload a package registry.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of concurrent requests
+FETCH_MAX_WORKERS = 16
+
+# Maximum number of concurrent requests to the same host
+FETCH_MAX_WORKERS_BY_HOST = 8
+
+# Timeout in seconds of a request
+FETCH_TIMEOUT = 30
+
+# Number of retries of a failed request. The backoff factor is the delay in
+# seconds before the second retry, doubling for each following retry.
+FETCH_MAX_RETRIES = 3
+FETCH_BACKOFF_FACTOR = 1
+
+# HTTP status codes of the responses to retry
+FETCH_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def get_session(pool_size=FETCH_MAX_WORKERS, max_retries=FETCH_MAX_RETRIES):
+    """
+    Return a requests Session keeping up to `pool_size` HTTP connections open
+    by host for reuse across threads, and retrying failed GET requests up to
+    `max_retries` times.
+    """
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=FETCH_BACKOFF_FACTOR,
+        status_forcelist=FETCH_RETRY_STATUSES,
+        allowed_methods=("GET",),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# this session and executor are shared by all the pipes
+session = get_session()
+executor = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS, thread_name_prefix="minecode-fetch")
+
+# BoundedSemaphore limiting the concurrent requests, by host
+semaphore_by_host = {}
+semaphore_by_host_lock = threading.Lock()
+
+
+def get_host_semaphore(url):
+    """
+    Return the BoundedSemaphore limiting the concurrent requests to the host of
+    `url`.
+    """
+    host = urlparse(url).netloc
+    with semaphore_by_host_lock:
+        return semaphore_by_host.setdefault(
+            host, threading.BoundedSemaphore(FETCH_MAX_WORKERS_BY_HOST)
+        )
+
+
+def fetch(url, headers=None, timeout=FETCH_TIMEOUT):
+    """
+    Return the requests Response of a GET request to `url` or None if the
+    request failed after its retries.
+    """
+    with get_host_semaphore(url):
+        try:
+            return session.get(url, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            logger.error(f"Failed to fetch {url}: {e}")
+
+
+def fetch_all(urls, headers=None):
+    """
+    Return an iterator of the requests Response, or None for a failed request,
+    of GET requests to each of the `urls`, in the order of the `urls`. The
+    requests start right away and run concurrently.
+    """
+    futures = [executor.submit(fetch, url, headers) for url in urls]
+    return (future.result() for future in futures)
+
+
+def read_ahead(iterable, size=None):
+    """
+    Yield the items of an `iterable` in order, reading up to `size` items ahead
+    of the consumer, such that the requests started when these items are
+    created run while the previous items are consumed. `size` defaults to the
+    maximum number of concurrent requests.
+    """
+    size = size or FETCH_MAX_WORKERS
+    pending = deque()
+    for item in iterable:
+        pending.append(item)
+        if len(pending) > size:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
@@ -9,14 +9,15 @@
 
 import gzip
 import io
+import multiprocessing
 import os
+from collections import deque
 from collections import namedtuple
-from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
 from shutil import rmtree
 
 import arrow
 import javaproperties
-import requests
 from dateutil import tz
 from jawa.util.utf import decode_modified_utf8
 
@@ -27,7 +28,9 @@ from packagedcode.models import PackageData
 from packageurl import PackageURL
 
 
+from minecode.pipes import fetch
 from minecode.pipes import java_stream
+from minecode.pipes import maven_index
 
 TRACE = False
 TRACE_DEEP = False
@@ -41,6 +44,12 @@ MAVEN_INDEX_PROPERTIES_URL = (
     "https://repo1.maven.org/maven2/.index/nexus-maven-repository-index.properties"
 )
 
+# Number of Maven index records decoded together in a worker process
+MAVEN_INDEX_BATCH_SIZE = 10000
+
+# Number of worker processes decoding a Maven index: use all the cores
+MAVEN_INDEX_MAX_WORKERS = os.cpu_count() or 1
+
 
 def is_worthy_artifact(artifact):
     """
@@ -393,6 +402,18 @@ def get_entries(location, fields=frozenset(ENTRY_FIELDS)):
     Yield Maven index entry mappings from a Gzipped Maven nexus index
     data file at `location`. Only includes `fields` names.
     """
+    with GzipFileWithTrailing(location, "rb") as nexus_index:
+        yield from maven_index.iter_entries(nexus_index, fields)
+
+
+def get_entries_from_stream(location, fields=frozenset(ENTRY_FIELDS)):
+    """
+    Yield Maven index entry mappings from a Gzipped Maven nexus index
+    data file at `location`. Only includes `fields` names.
+
+    This reads each field from a Java-like stream and is much slower than
+    `get_entries`.
+    """
     buffer_size = 128 * 1024 * 1024
     if TRACE_DEEP:
         entry = None
@@ -578,6 +599,8 @@ class MavenNexusCollector:
         index_properties_location=None,
         last_incremental=None,
         logger=None,
+        max_workers=1,
+        checkpoint=None,
     ):
         if index_location and last_incremental:
             raise Exception(
@@ -587,6 +610,8 @@ class MavenNexusCollector:
             )
 
         self.downloads = []
+        self.max_workers = max_workers
+        self.checkpoint = dict(checkpoint or {})
 
         if index_properties_location:
             self.index_properties_location = index_properties_location
@@ -666,99 +691,281 @@ class MavenNexusCollector:
                 index_increment_downloads.append(index_increment)
         return index_increment_downloads
 
-    def _get_packages(self, content=None):
-        artifacts = get_artifacts(content, worthyness=is_worthy_artifact)
+    def get_packages(self):
+        """
+        Yield tuples of (PackageURL, list of purl strings, package data
+        generator) from the maven index or index increments.
+
+        With `max_workers` greater than 1, batches of index records are decoded
+        in this many processes. The packages are yielded in the index order
+        either way and the POMs of the next packages are fetched while a
+        package is consumed. The `checkpoint` mapping records the index records
+        consumed and is used to resume a previous run.
+        """
+        if self.index_increment_locations:
+            locations = self.index_increment_locations
+        elif self.index_location:
+            locations = [self.index_location]
+        else:
+            return
+
+        index_checkpoint = dict(self.checkpoint)
+        packages = get_index_packages(
+            locations=locations,
+            get_package=get_package_urls,
+            max_workers=self.max_workers,
+            checkpoint=index_checkpoint,
+        )
+
+        def get_packages_with_poms():
+            for current_purl, packageurls, api_data_url in packages:
+                # this yields a tuple containing purl str, dict containing api info
+                purls_and_package_data = yield_maven_package_data(
+                    purl=current_purl, pom_urls=[api_data_url]
+                )
+                # the index checkpoint when a package is read does not include
+                # this package
+                yield dict(index_checkpoint), (current_purl, packageurls, purls_and_package_data)
 
-        for artifact in artifacts:
-            # we cannot do much without these
-            group_id = artifact.group_id
-            artifact_id = artifact.artifact_id
-            version = artifact.version
-            extension = artifact.extension
+        # Read packages ahead to fetch their POMs concurrently, but only
+        # checkpoint the packages consumed by the caller
+        for checkpoint, package in fetch.read_ahead(get_packages_with_poms()):
+            self.checkpoint = checkpoint
+            yield package
+        self.checkpoint = index_checkpoint
 
-            if not (group_id and artifact_id and version and extension):
-                continue
 
-            qualifiers = {}
-            if extension and extension != "jar":
-                qualifiers["type"] = extension
+def get_package_urls(artifact):
+    """
+    Return a tuple of (PackageURL, list of purl strings, API data URL) for an
+    `artifact` or None if the artifact lacks its coordinates.
+    """
+    # we cannot do much without these
+    group_id = artifact.group_id
+    artifact_id = artifact.artifact_id
+    version = artifact.version
+    extension = artifact.extension
 
-            classifier = artifact.classifier
-            if classifier:
-                qualifiers["classifier"] = classifier
+    if not (group_id and artifact_id and version and extension):
+        return
 
-            # FIXME: also use the Artifact.src_exist flags too?
+    qualifiers = {}
+    if extension and extension != "jar":
+        qualifiers["type"] = extension
 
-            # build a URL: This is the real JAR download URL
-            # FIXME: this should be set at the time of creating Artifacts
-            # instead together with the filename... especially we could use
-            # different REPOs.
-            jar_download_url, _ = build_url_and_filename(
-                group_id, artifact_id, version, extension, classifier
-            )
+    classifier = artifact.classifier
+    if classifier:
+        qualifiers["classifier"] = classifier
 
-            # FIXME: should this be set in the yielded URI too
-            last_mod = artifact.last_modified
+    # FIXME: also use the Artifact.src_exist flags too?
 
-            urls = get_urls(
-                namespace=group_id,
-                name=artifact_id,
-                version=version,
-                qualifiers=qualifiers or None,
-            )
+    # build a URL: This is the real JAR download URL
+    # FIXME: this should be set at the time of creating Artifacts
+    # instead together with the filename... especially we could use
+    # different REPOs.
+    jar_download_url, _ = build_url_and_filename(
+        group_id, artifact_id, version, extension, classifier
+    )
 
-            repository_homepage_url = urls["repository_homepage_url"]
-            repository_download_url = urls["repository_download_url"]
-            api_data_url = urls["api_data_url"]
-
-            package = PackageData(
-                type="maven",
-                namespace=group_id,
-                name=artifact_id,
-                version=version,
-                qualifiers=qualifiers or None,
-                download_url=jar_download_url,
-                size=artifact.size,
-                sha1=artifact.sha1,
-                release_date=last_mod,
-                repository_homepage_url=repository_homepage_url,
-                repository_download_url=repository_download_url,
-                api_data_url=api_data_url,
-            )
-            current_purl = PackageURL(
-                type="maven",
-                namespace=group_id,
-                name=artifact_id,
-                version=version,
-                qualifiers=qualifiers,
-            )
-            packageurls = [package.purl]
+    # FIXME: should this be set in the yielded URI too
+    last_mod = artifact.last_modified
+
+    urls = get_urls(
+        namespace=group_id,
+        name=artifact_id,
+        version=version,
+        qualifiers=qualifiers or None,
+    )
+
+    repository_homepage_url = urls["repository_homepage_url"]
+    repository_download_url = urls["repository_download_url"]
+    api_data_url = urls["api_data_url"]
+
+    package = PackageData(
+        type="maven",
+        namespace=group_id,
+        name=artifact_id,
+        version=version,
+        qualifiers=qualifiers or None,
+        download_url=jar_download_url,
+        size=artifact.size,
+        sha1=artifact.sha1,
+        release_date=last_mod,
+        repository_homepage_url=repository_homepage_url,
+        repository_download_url=repository_download_url,
+        api_data_url=api_data_url,
+    )
+    current_purl = PackageURL(
+        type="maven",
+        namespace=group_id,
+        name=artifact_id,
+        version=version,
+        qualifiers=qualifiers,
+    )
+    packageurls = [package.purl]
+    return current_purl, packageurls, api_data_url
 
-            # this yields a tuple containing purl str, dict containing api info
 
-            purls_and_package_data = yield_maven_package_data(
-                purl=current_purl, pom_urls=[api_data_url]
+def get_index_packages(locations, get_package, max_workers=1, checkpoint=None):
+    """
+    Yield the packages returned by a `get_package(artifact)` function for the
+    worthy artifacts of the Gzipped Maven nexus index data files at
+    `locations`, in the index order. `get_package` is a module-level function
+    returning a picklable package or None.
+
+    With `max_workers` greater than 1, batches of index records are decoded and
+    turned into packages in this many worker processes while the index is
+    decompressed and split in batches in the current process.
+
+    The `checkpoint` mapping is updated in place with the "index" file name,
+    the "timestamp" of this index and the number of "records" of this index
+    consumed. A record is consumed once the next package is requested. A run
+    resumes from a `checkpoint` of a previous run on the same index files.
+    """
+    if checkpoint is None:
+        checkpoint = {}
+
+    index_names = [os.path.basename(location) for location in locations]
+    if checkpoint.get("index") in index_names:
+        locations = locations[index_names.index(checkpoint["index"]) :]
+
+    executor = None
+    if max_workers > 1:
+        # Do not fork this process as it may run threads, such as for fetches
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=init_index_worker,
+        )
+    try:
+        for location in locations:
+            yield from get_index_file_packages(
+                location=location,
+                get_package=get_package,
+                checkpoint=checkpoint,
+                executor=executor,
+                max_pending_batches=max_workers * 2,
             )
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
 
-            yield current_purl, packageurls, purls_and_package_data
 
-    def _get_packages_from_index_increments(self):
-        for index_increment in self.index_increment_locations:
-            yield self._get_packages(content=index_increment)
+def init_index_worker():
+    """
+    Set up Django in an index worker process, as the `get_package` functions
+    may be defined in modules importing Django models.
+    """
+    import django
 
-    def get_packages(self):
-        """Yield Package objects from maven index or index increments"""
-        packages = []
-        if self.index_increment_locations:
-            packages = chain(self._get_packages_from_index_increments())
-        elif self.index_location:
-            packages = self._get_packages(content=self.index_location)
-        return packages
+    django.setup()
 
 
-def yield_maven_package_data(purl, pom_urls=[]):
-    for pom_url in pom_urls:
-        response = requests.get(pom_url)
-        if not response.ok:
+def get_index_file_packages(
+    location, get_package, checkpoint, executor=None, max_pending_batches=1
+):
+    """
+    Yield the packages returned by a `get_package(artifact)` function for the
+    worthy artifacts of the Gzipped Maven nexus index data file at `location`,
+    in the index order, updating the `checkpoint` mapping as packages are
+    consumed. The records already consumed according to the `checkpoint` are
+    skipped if it is for the same index.
+
+    Decode batches of records in the `executor` processes if provided with up
+    to `max_pending_batches` batches submitted at once.
+    """
+    with GzipFileWithTrailing(location, "rb") as nexus_index:
+        _index_version, timestamp, buffer = maven_index.read_index_header(nexus_index)
+
+        # the index timestamp changes when an index file is updated
+        start = 0
+        if checkpoint.get("timestamp") == timestamp:
+            start = checkpoint.get("records") or 0
+        checkpoint.update(index=os.path.basename(location), timestamp=timestamp, records=start)
+
+        batches = get_record_batches(nexus_index, buffer, start_record=start)
+        results = map_in_order(
+            executor,
+            get_batch_packages,
+            ((batch, get_package) for batch in batches),
+            max_pending=max_pending_batches,
+        )
+        for first_record, records_count, packages in results:
+            for record_number, package in packages:
+                if record_number < start:
+                    continue
+                yield package
+                checkpoint["records"] = record_number + 1
+            checkpoint["records"] = max(start, first_record + records_count)
+
+
+def get_record_batches(nexus_index, buffer, start_record=0):
+    """
+    Yield tuples of (first record number, records count, data bytes) for the
+    batches of records of a decompressed `nexus_index` stream that contain
+    records numbered from `start_record`.
+    """
+    first_record = 0
+    for records_count, data in maven_index.iter_record_batches(
+        nexus_index, buffer=buffer, batch_size=MAVEN_INDEX_BATCH_SIZE
+    ):
+        if first_record + records_count > start_record:
+            yield first_record, records_count, data
+        first_record += records_count
+
+
+def get_batch_packages(batch, get_package):
+    """
+    Return a tuple of (first record number, records count, packages) for a
+    `batch` tuple of (first record number, records count, data bytes) of index
+    records. `packages` is a list of (record number, package) for the packages
+    returned by a `get_package(artifact)` function for the worthy artifacts of
+    these records.
+    """
+    first_record, records_count, data = batch
+    field_name_by_name = maven_index.get_field_name_by_name(ENTRY_FIELDS)
+    packages = []
+    offset = 0
+    for record_number in range(first_record, first_record + records_count):
+        entry, offset = maven_index.decode_entry(data, offset, field_name_by_name)
+        if not entry:
             continue
-        yield purl, response.content
+        artifact = build_artifact(entry)
+        if not (artifact and is_worthy_artifact(artifact)):
+            continue
+        package = get_package(artifact)
+        if package:
+            packages.append((record_number, package))
+    return first_record, records_count, packages
+
+
+def map_in_order(executor, func, arguments, max_pending=1):
+    """
+    Yield the results of calling `func(*args)` for each `args` tuple of an
+    `arguments` iterable, in order. Submit the calls to an `executor` if
+    provided with at most `max_pending` calls submitted at once to bound the
+    memory used. Otherwise, call `func` in the current process.
+    """
+    if not executor:
+        for args in arguments:
+            yield func(*args)
+        return
+
+    pending = deque()
+    for args in arguments:
+        pending.append(executor.submit(func, *args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def yield_maven_package_data(purl, pom_urls=[]):
+    """
+    Return an iterator of (purl, POM content) tuples for the `pom_urls` of a
+    `purl`. The POMs are fetched concurrently, starting right away.
+    """
+    responses = fetch.fetch_all(pom_urls)
+    return (
+        (purl, response.content) for response in responses if response is not None and response.ok
+    )
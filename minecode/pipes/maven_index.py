@@ -0,0 +1,230 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+import struct
+
+from jawa.util.utf import decode_modified_utf8
+
+"""
+Fast decoder for the entries of a Maven Nexus index data file.
+
+This decodes the same data layout as the `decode_entry` function of
+`minecode.pipes.maven` that reads one field at a time from a Java-like stream,
+but it works on large buffers of decompressed data instead:
+
+- the integers are unpacked in place with precompiled `struct.Struct` objects,
+- the fields that are not requested are skipped without decoding their name or
+  value,
+- the ASCII field values, which are the vast majority, are decoded with
+  `bytes.decode`. Other values go through the Java "Modified UTF-8" decoder,
+- the records can be split in batches without decoding them, such that these
+  batches are decoded independently, for instance in worker processes.
+"""
+
+# Number of decompressed bytes read at once from an index
+INDEX_READ_SIZE = 16 * 1024 * 1024
+
+# Number of bytes of the header of an index: a version byte and a long timestamp
+INDEX_HEADER_SIZE = 9
+
+unpack_byte = struct.Struct(">b").unpack_from
+unpack_unsigned_short = struct.Struct(">H").unpack_from
+unpack_int = struct.Struct(">i").unpack_from
+unpack_long = struct.Struct(">q").unpack_from
+
+
+class IncompleteEntry(Exception):
+    """Raised when the data of an entry is not fully available in a buffer."""
+
+
+def iter_entries(stream, fields=()):
+    """
+    Yield Maven index entry mappings from a decompressed Maven Nexus index
+    binary `stream`. Only includes `fields` names, or all fields if `fields`
+    is empty. Stop at the end of the stream or at a truncated last entry.
+    """
+    _index_version, _timestamp, buffer = read_index_header(stream)
+    field_name_by_name = get_field_name_by_name(fields)
+    offset = 0
+
+    while True:
+        try:
+            entry, offset = decode_entry(buffer, offset, field_name_by_name)
+        except IncompleteEntry:
+            data = read_stream(stream, INDEX_READ_SIZE)
+            if not data:
+                return
+            buffer = buffer[offset:] + data
+            offset = 0
+            continue
+
+        if entry:
+            yield entry
+
+
+def iter_record_batches(stream, buffer=b"", batch_size=10000):
+    """
+    Yield tuples of (records count, data bytes) for batches of up to
+    `batch_size` complete records read from a decompressed Maven Nexus index
+    binary `stream` positioned past its header, starting with the data of a
+    `buffer` already read from this stream. The records are not decoded and
+    each batch can be decoded on its own with `decode_entry`. Stop at the end
+    of the stream or at a truncated last record.
+    """
+    batch_start = offset = records_count = 0
+    while True:
+        try:
+            offset = skip_entry(buffer, offset)
+        except IncompleteEntry:
+            data = read_stream(stream, INDEX_READ_SIZE)
+            if not data:
+                if records_count:
+                    yield records_count, buffer[batch_start:offset]
+                return
+            buffer = buffer[batch_start:] + data
+            offset -= batch_start
+            batch_start = 0
+            continue
+
+        records_count += 1
+        if records_count == batch_size:
+            yield records_count, buffer[batch_start:offset]
+            batch_start = offset
+            records_count = 0
+
+
+def read_index_header(stream):
+    """
+    Return a tuple of (index_version, timestamp, buffer) decoded from the
+    header of a decompressed Maven Nexus index binary `stream` where `buffer`
+    holds the data read from the stream past the header.
+    """
+    buffer = read_stream(stream, INDEX_READ_SIZE)
+    while len(buffer) < INDEX_HEADER_SIZE:
+        data = read_stream(stream, INDEX_READ_SIZE)
+        if not data:
+            break
+        buffer += data
+    index_version, timestamp, offset = decode_index_header(buffer)
+    return index_version, timestamp, buffer[offset:]
+
+
+def read_stream(stream, size):
+    """
+    Return up to `size` bytes read from a `stream` or empty bytes at the end of
+    the stream. Treat an EOFError raised for trailing data as the end.
+    """
+    try:
+        return stream.read(size)
+    except EOFError:
+        return b""
+
+
+def decode_index_header(buffer):
+    """
+    Return a tuple of (index_version, timestamp, offset) decoded from the start
+    of the `buffer` of a Maven index where `timestamp` is a Java timestamp in
+    milliseconds or -1 and `offset` is the offset of the first entry.
+    """
+    supported_format_version = 1
+    if len(buffer) < INDEX_HEADER_SIZE:
+        raise EOFError("Truncated Maven index header")
+    (index_version,) = unpack_byte(buffer, 0)
+    assert supported_format_version == index_version
+    (timestamp,) = unpack_long(buffer, 1)
+    return index_version, timestamp, INDEX_HEADER_SIZE
+
+
+def get_field_name_by_name(fields):
+    """
+    Return a mapping of {encoded field name bytes: field name} for `fields`
+    names or None if all fields should be included.
+    """
+    if not fields:
+        return
+    return {name.encode("utf-8"): name for name in fields}
+
+
+# Cache of decoded field names, by encoded name bytes
+decoded_names = {}
+
+
+def decode_entry(buffer, offset, field_name_by_name=None):
+    """
+    Return a tuple of (entry mapping of name -> values, offset of the next
+    entry) for the Maven index entry starting at `offset` in `buffer`. Only
+    includes the field names of the `field_name_by_name` mapping if provided.
+    Raise an IncompleteEntry if the `buffer` ends before the end of the entry.
+
+    See `minecode.pipes.maven.decode_entry` for the layout of an entry.
+    """
+    buffer_length = len(buffer)
+    entry = {}
+    try:
+        (field_count,) = unpack_int(buffer, offset)
+        offset += 4
+        for _ in range(field_count):
+            # skip the Lucene indexing flags byte, then read the field name
+            # length on 2 bytes
+            (name_length,) = unpack_unsigned_short(buffer, offset + 1)
+            name_start = offset + 3
+            value_start = name_start + name_length + 4
+            # the value length is a full int, not the 2 bytes of a Java UTF
+            (value_length,) = unpack_int(buffer, value_start - 4)
+            offset = value_start + value_length
+            if offset > buffer_length:
+                raise IncompleteEntry
+
+            name = buffer[name_start : value_start - 4]
+            if field_name_by_name is None:
+                decoded_name = decoded_names.get(name)
+                if decoded_name is None:
+                    decoded_name = decoded_names[name] = decode_value(name)
+            else:
+                decoded_name = field_name_by_name.get(name)
+                if decoded_name is None:
+                    continue
+
+            entry[decoded_name] = decode_value(buffer[value_start:offset])
+    except struct.error as e:
+        raise IncompleteEntry from e
+
+    return entry, offset
+
+
+def skip_entry(buffer, offset):
+    """
+    Return the offset of the entry following the Maven index entry starting at
+    `offset` in `buffer` without decoding this entry. Raise an IncompleteEntry
+    if the `buffer` ends before the end of the entry.
+    """
+    try:
+        (field_count,) = unpack_int(buffer, offset)
+        offset += 4
+        for _ in range(field_count):
+            (name_length,) = unpack_unsigned_short(buffer, offset + 1)
+            value_start = offset + 3 + name_length + 4
+            (value_length,) = unpack_int(buffer, value_start - 4)
+            offset = value_start + value_length
+    except struct.error as e:
+        raise IncompleteEntry from e
+    if offset > len(buffer):
+        raise IncompleteEntry
+    return offset
+
+
+def decode_value(value):
+    """
+    Return a string decoded from a Java "Modified UTF-8" encoded `value` bytes.
+    Non-ASCII values are decoded with the same decoder as the stream decoder
+    of `minecode.pipes.maven` to return the same strings.
+    """
+    if value.isascii():
+        return value.decode("ascii")
+    return decode_modified_utf8(value)
@@ -30,6 +30,7 @@ from packageurl import PackageURL
 from scanpipe.pipes.federatedcode import clone_repository
 from scanpipe.pipes.federatedcode import delete_local_clone
 
+from minecode.pipes import fetch
 from minecode.pipes import fetch_checkpoint_from_github
 from minecode.pipes import update_checkpoints_in_github
 from minecode.pipes import update_checkpoints_file_in_github
@@ -171,13 +172,15 @@ def get_version_from_package_dict(name, package_dict):
 
 
 def yield_nix_package_data(name, packageurls=[]):
+    package_data_urls = []
     for purl in packageurls:
         package_url = PackageURL.from_string(purl)
-        package_data_url = (
+        package_data_urls.append(
             f"https://search.devbox.sh/v2/resolve?name={name}&version={package_url.version}"
         )
-        response = requests.get(package_data_url)
-        if not response.ok:
+    responses = fetch.fetch_all(package_data_urls)
+    for purl, response in zip(packageurls, responses):
+        if response is None or not response.ok:
             continue
         yield purl, response.json()
 
@@ -302,21 +305,22 @@ def get_nix_packages_to_sync(packages_file, state, logger=None):
         if logger:
             logger(f"Starting package mining for {len(packages_to_sync)} packages")
 
-        synced_packages = []
+        synced_packages = set()
 
     elif state == INITIAL_SYNC_STATE or state == PERIODIC_SYNC_STATE:
         synced_packages = get_mined_packages_from_checkpoint(
             config_repo=MINECODE_PIPELINES_CONFIG_REPO,
             checkpoint_path=NIX_PACKAGES_CHECKPOINT_PATH,
         )
-        if state == INITIAL_SYNC_STATE:
-            packages_to_sync = synced_packages
-        else:
-            packages_to_sync = list(set(packages).difference(set(synced_packages)))
-            if logger:
-                logger(
-                    f"Starting initial package mining for {len(packages_to_sync)} packages from checkpoint"
-                )
+        packages_to_sync = [
+            package_name
+            for package_name in dict.fromkeys(packages)
+            if package_name not in synced_packages
+        ]
+        if logger:
+            logger(
+                f"Starting initial package mining for {len(packages_to_sync)} packages from checkpoint"
+            )
 
     return packages_to_sync, synced_packages
 
@@ -347,17 +351,15 @@ def mine_and_publish_nix_packageurls(packages_dict, packages_to_sync, packages_m
             yield base_purl, packageurls, []
 
 
-def save_mined_packages_in_checkpoint(packages_mined, synced_packages, config_repo, logger=None):
+def save_mined_packages_in_checkpoint(packages_mined, config_repo, logger=None):
     # As we are mining the packages to sync with the index,
     # we need to update mined packages checkpoint for every batch
     # so we can continue mining the other packages after restarting
     if logger:
         logger(f"Checkpointing processed packages to: {NIX_PACKAGES_CHECKPOINT_PATH}")
 
-    packages_checkpoint = packages_mined + synced_packages
     update_mined_packages_in_checkpoint(
-        packages=packages_checkpoint,
-        config_repo=MINECODE_PIPELINES_CONFIG_REPO,
+        packages=packages_mined,
         cloned_repo=config_repo,
         checkpoint_path=NIX_PACKAGES_CHECKPOINT_PATH,
         logger=logger,
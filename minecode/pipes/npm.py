@@ -28,6 +28,8 @@ from packageurl import PackageURL
 from scanpipe.pipes.federatedcode import clone_repository
 from scanpipe.pipes.federatedcode import delete_local_clone
 
+from minecode.pipes import clear_mined_packages_in_checkpoint
+from minecode.pipes import fetch
 from minecode.pipes import fetch_checkpoint_from_github
 from minecode.pipes import update_checkpoints_in_github
 from minecode.pipes import update_checkpoints_file_in_github
@@ -187,11 +189,14 @@ def get_npm_packageurls(name, npm_repo=NPM_REGISTRY_REPO):
 
 
 def yield_npm_package_data(name, packageurls=[]):
-    for purl in packageurls or get_npm_packageurls(name):
+    packageurls = packageurls or get_npm_packageurls(name)
+    package_data_urls = []
+    for purl in packageurls:
         package_url = PackageURL.from_string(purl)
-        package_data_url = NPM_REGISTRY_REPO + name + "/" + package_url.version
-        response = requests.get(package_data_url)
-        if not response.ok:
+        package_data_urls.append(NPM_REGISTRY_REPO + name + "/" + package_url.version)
+    responses = fetch.fetch_all(package_data_urls)
+    for purl, response in zip(packageurls, responses):
+        if response is None or not response.ok:
             continue
         yield purl, response.json()
 
@@ -364,14 +369,18 @@ def get_npm_packages_to_sync(packages_file, state, logger=None):
         if logger:
             logger(f"Starting package mining for {len(packages_to_sync)} packages")
 
-        synced_packages = []
+        synced_packages = set()
 
     elif state == INITIAL_SYNC_STATE or state == PERIODIC_SYNC_STATE:
         synced_packages = get_mined_packages_from_checkpoint(
             config_repo=MINECODE_PIPELINES_CONFIG_REPO,
             checkpoint_path=NPM_PACKAGES_CHECKPOINT_PATH,
         )
-        packages_to_sync = list(set(packages).difference(set(synced_packages)))
+        packages_to_sync = [
+            package_name
+            for package_name in dict.fromkeys(packages)
+            if package_name and get_npm_base_purl(package_name) not in synced_packages
+        ]
         if logger:
             logger(
                 f"Starting initial package mining for {len(packages_to_sync)} packages from checkpoint"
@@ -380,6 +389,11 @@ def get_npm_packages_to_sync(packages_file, state, logger=None):
     return packages_to_sync, synced_packages
 
 
+def get_npm_base_purl(name):
+    """Return the base purl string of an npm package `name`, as saved in checkpoints."""
+    return PackageURL(type=NPM_TYPE, name=name).to_string()
+
+
 def mine_and_publish_npm_packageurls(packages_to_sync, packages_mined, logger=None):
     if logger:
         logger("Starting package mining for a batch of packages")
@@ -401,23 +415,21 @@ def mine_and_publish_npm_packageurls(packages_to_sync, packages_mined, logger=No
         # this yields a tuple containing purl str, dict containing api info
         purls_and_package_data = yield_npm_package_data(package_name, packageurls)
 
-        base_purl = PackageURL(type=NPM_TYPE, name=package_name).to_string()
+        base_purl = get_npm_base_purl(package_name)
         packages_mined.append(base_purl)
 
         yield base_purl, packageurls, purls_and_package_data
 
 
-def save_mined_packages_in_checkpoint(packages_mined, synced_packages, config_repo, logger=None):
+def save_mined_packages_in_checkpoint(packages_mined, config_repo, logger=None):
     # As we are mining the packages to sync with the index,
     # we need to update mined packages checkpoint for every batch
     # so we can continue mining the other packages after restarting
     if logger:
         logger(f"Checkpointing processed packages to: {NPM_PACKAGES_CHECKPOINT_PATH}")
 
-    packages_checkpoint = packages_mined + synced_packages
     update_mined_packages_in_checkpoint(
-        packages=packages_checkpoint,
-        config_repo=MINECODE_PIPELINES_CONFIG_REPO,
+        packages=packages_mined,
         cloned_repo=config_repo,
         checkpoint_path=NPM_PACKAGES_CHECKPOINT_PATH,
         logger=logger,
@@ -451,10 +463,9 @@ def update_state_and_checkpoints(state, last_seq, config_repo, logger=None):
         )
 
     # Refresh mined packages checkpoint
-    update_checkpoints_in_github(
-        checkpoint={"packages_mined": []},
+    clear_mined_packages_in_checkpoint(
         cloned_repo=config_repo,
-        path=NPM_PACKAGES_CHECKPOINT_PATH,
+        checkpoint_path=NPM_PACKAGES_CHECKPOINT_PATH,
         logger=logger,
     )
 
@@ -31,6 +31,8 @@ from scanpipe.pipes.federatedcode import delete_local_clone
 from minecode.pipes import INITIAL_SYNC_STATE
 from minecode.pipes import MINECODE_PIPELINES_CONFIG_REPO
 from minecode.pipes import PERIODIC_SYNC_STATE
+from minecode.pipes import clear_mined_packages_in_checkpoint
+from minecode.pipes import fetch
 from minecode.pipes import fetch_checkpoint_from_github
 from minecode.pipes import get_mined_packages_from_checkpoint
 from minecode.pipes import get_packages_file_from_checkpoint
@@ -114,13 +116,16 @@ def get_pypi_packageurls(name):
 
 
 def yield_pypi_package_data(name, packageurls=[]):
-    for purl in packageurls or get_pypi_packageurls(name):
+    packageurls = packageurls or get_pypi_packageurls(name)
+    package_data_urls = []
+    for purl in packageurls:
         package_url = PackageURL.from_string(purl)
-        package_data_url = (
+        package_data_urls.append(
             PYPI_METADATA_REPO + "/" + name + "/" + package_url.version + "/" + "json"
         )
-        response = requests.get(package_data_url, headers=pypi_json_headers)
-        if not response.ok:
+    responses = fetch.fetch_all(package_data_urls, headers=pypi_json_headers)
+    for purl, response in zip(packageurls, responses):
+        if response is None or not response.ok:
             continue
         yield purl, response.json()
 
@@ -274,7 +279,7 @@ def get_pypi_packages_to_sync(packages_file, state, logger=None):
             package
             for package in packages
             if last_serial_fetched < package.get("_last-serial")
-            and package.get("name") not in synced_packages
+            and get_pypi_base_purl(package.get("name")) not in synced_packages
         ]
         if logger:
             logger(
@@ -284,7 +289,9 @@ def get_pypi_packages_to_sync(packages_file, state, logger=None):
 
     elif state == INITIAL_SYNC_STATE:
         packages_to_sync = [
-            package for package in packages if package.get("name") not in synced_packages
+            package
+            for package in packages
+            if get_pypi_base_purl(package.get("name")) not in synced_packages
         ]
         if logger:
             logger(
@@ -294,6 +301,11 @@ def get_pypi_packages_to_sync(packages_file, state, logger=None):
     return packages_to_sync, last_serial
 
 
+def get_pypi_base_purl(name):
+    """Return the base purl string of a PyPI package `name`, as saved in checkpoints."""
+    return PackageURL(type=PYPI_TYPE, name=name).to_string()
+
+
 def mine_and_publish_pypi_packageurls(
     packages_to_sync,
     packages_mined,
@@ -309,7 +321,7 @@ def mine_and_publish_pypi_packageurls(
             logger(f"getting packageURLs for package: {name}")
 
         # get repo and path for package
-        base_purl = PackageURL(type=PYPI_TYPE, name=name).to_string()
+        base_purl = get_pypi_base_purl(name)
         packageurls = get_pypi_packageurls(name)
         if not packageurls:
             if logger and LOG_PACKAGEURL_DETAILS:
@@ -338,7 +350,6 @@ def save_mined_packages_in_checkpoint(packages_mined, config_repo, logger=None):
     update_mined_packages_in_checkpoint(
         packages=packages_mined,
         cloned_repo=config_repo,
-        config_repo=MINECODE_PIPELINES_CONFIG_REPO,
         checkpoint_path=PYPI_PACKAGES_CHECKPOINT_PATH,
         logger=logger,
     )
@@ -359,10 +370,9 @@ def update_state_and_checkpoints(config_repo, state, last_serial, logger=None):
         )
 
     # refresh packages checkpoint once to only checkpoint new packages
-    update_checkpoints_in_github(
-        checkpoint={"packages_mined": []},
+    clear_mined_packages_in_checkpoint(
         cloned_repo=config_repo,
-        path=PYPI_PACKAGES_CHECKPOINT_PATH,
+        checkpoint_path=PYPI_PACKAGES_CHECKPOINT_PATH,
         logger=logger,
     )
 
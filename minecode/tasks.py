@@ -13,6 +13,7 @@ from commoncode.fileutils import delete
 
 from minecode.indexing import index_package
 from minecode.models import ScannableURI
+from minecode.utils import iter_json_array
 
 
 def process_scan_results(
@@ -28,9 +29,11 @@ def process_scan_results(
 
     `scan_results_location` and `scan_summary_location` are deleted after the
     indexing process has finished.
+
+    The scanned files are read incrementally from `scan_results_location` and
+    indexed in batches, such that large scans are not loaded in memory.
     """
-    with open(scan_results_location) as f:
-        scan_data = json.load(f)
+    scan_data = {"files": iter_json_array(scan_results_location, path=("files",))}
     with open(scan_summary_location) as f:
         summary_data = json.load(f)
 
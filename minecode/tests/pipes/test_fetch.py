@@ -0,0 +1,83 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+import threading
+import time
+from unittest import TestCase
+from unittest import mock
+
+import requests
+
+from minecode.pipes import fetch
+
+
+class FetchTest(TestCase):
+    def setUp(self):
+        fetch.semaphore_by_host.clear()
+
+    def tearDown(self):
+        fetch.semaphore_by_host.clear()
+
+    def test_get_session_retries_with_backoff(self):
+        session = fetch.get_session()
+        retry = session.get_adapter("https://pypi.org").max_retries
+        self.assertEqual(fetch.FETCH_MAX_RETRIES, retry.total)
+        self.assertEqual(fetch.FETCH_BACKOFF_FACTOR, retry.backoff_factor)
+        self.assertIn(429, retry.status_forcelist)
+
+    @mock.patch("minecode.pipes.fetch.session.get")
+    def test_fetch_returns_none_on_request_error(self, mock_get):
+        mock_get.side_effect = requests.ConnectionError("unreachable")
+        self.assertIsNone(fetch.fetch("https://example.com/1"))
+
+    @mock.patch("minecode.pipes.fetch.session.get")
+    def test_fetch_all_returns_responses_in_order(self, mock_get):
+        def get(url, headers=None, timeout=None):
+            # the first URLs are the slowest to respond
+            time.sleep(0.01 * (5 - int(url.rsplit("/", 1)[-1])))
+            return url
+
+        mock_get.side_effect = get
+        urls = [f"https://example.com/{i}" for i in range(5)]
+        self.assertEqual(urls, list(fetch.fetch_all(urls)))
+
+    @mock.patch("minecode.pipes.fetch.FETCH_MAX_WORKERS_BY_HOST", 2)
+    @mock.patch("minecode.pipes.fetch.session.get")
+    def test_fetch_all_limits_concurrent_requests_by_host(self, mock_get):
+        lock = threading.Lock()
+        running = {"example.com": 0, "example.org": 0}
+        max_running = dict(running)
+
+        def get(url, headers=None, timeout=None):
+            host = url.split("/")[2]
+            with lock:
+                running[host] += 1
+                max_running[host] = max(max_running[host], running[host])
+            time.sleep(0.02)
+            with lock:
+                running[host] -= 1
+            return url
+
+        mock_get.side_effect = get
+        urls = [f"https://example.{tld}/{i}" for i in range(6) for tld in ("com", "org")]
+        self.assertEqual(urls, list(fetch.fetch_all(urls)))
+        self.assertEqual({"example.com": 2, "example.org": 2}, max_running)
+
+    def test_read_ahead_yields_items_in_order_ahead_of_consumer(self):
+        read = []
+
+        def items():
+            for i in range(5):
+                read.append(i)
+                yield i
+
+        iterator = fetch.read_ahead(items(), size=2)
+        self.assertEqual(0, next(iterator))
+        self.assertEqual([0, 1, 2], read)
+        self.assertEqual([1, 2, 3, 4], list(iterator))
@@ -8,6 +8,8 @@
 #
 
 import os
+from itertools import islice
+from unittest import mock
 
 from commoncode.testcase import check_against_expected_json_file
 from commoncode.testcase import FileBasedTesting
@@ -230,3 +232,132 @@ class MavenMiscTest(FileBasedTesting):
             "https://repo1.maven.org/maven2/de/alpharogroup/address-book-domain/maven-metadata.xml"
         )
         self.assertEqual(expected, maven.build_maven_xml_url(**test))
+
+
+class MavenIndexPackagesTest(FileBasedTesting):
+    test_data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+    def get_expected_packages(self, *indexes):
+        expected = []
+        for index in indexes:
+            for artifact in maven.get_artifacts(index):
+                package = maven.get_package_urls(artifact)
+                if package:
+                    expected.append(package)
+        return expected
+
+    def test_get_index_packages_same_as_get_artifacts(self):
+        index = self.get_test_loc("maven/index/nexus-maven-repository-index.gz")
+        expected = self.get_expected_packages(index)
+        checkpoint = {}
+        with mock.patch("minecode.pipes.maven.MAVEN_INDEX_BATCH_SIZE", 5):
+            result = list(
+                maven.get_index_packages(
+                    [index], get_package=maven.get_package_urls, checkpoint=checkpoint
+                )
+            )
+        self.assertTrue(expected)
+        self.assertEqual(expected, result)
+        expected_checkpoint = {
+            "index": "nexus-maven-repository-index.gz",
+            "timestamp": 1242931407355,
+            "records": 32,
+        }
+        self.assertEqual(expected_checkpoint, checkpoint)
+
+    def test_get_index_packages_with_workers_keeps_index_order(self):
+        indexes = [
+            self.get_test_loc("maven/index/increment/nexus-maven-repository-index.445.gz"),
+            self.get_test_loc("maven/index/increment2/nexus-maven-repository-index.457.gz"),
+        ]
+        expected = self.get_expected_packages(*indexes)
+        with mock.patch("minecode.pipes.maven.MAVEN_INDEX_BATCH_SIZE", 3):
+            result = list(
+                maven.get_index_packages(indexes, get_package=maven.get_package_urls, max_workers=2)
+            )
+        self.assertTrue(expected)
+        self.assertEqual(expected, result)
+
+    def test_get_index_packages_resumes_from_checkpoint(self):
+        index = self.get_test_loc("maven/index/nexus-maven-repository-index.gz")
+        expected = self.get_expected_packages(index)
+        checkpoint = {}
+        with mock.patch("minecode.pipes.maven.MAVEN_INDEX_BATCH_SIZE", 5):
+            packages = maven.get_index_packages(
+                [index], get_package=maven.get_package_urls, checkpoint=checkpoint
+            )
+            consumed = list(islice(packages, 8))
+            packages.close()
+            self.assertEqual(expected[:8], consumed)
+
+            # the last package was not fully consumed and is yielded again
+            result = list(
+                maven.get_index_packages(
+                    [index], get_package=maven.get_package_urls, checkpoint=dict(checkpoint)
+                )
+            )
+        self.assertEqual(expected[7:], result)
+
+    def test_get_index_packages_resumes_from_checkpoint_of_index_increment(self):
+        indexes = [
+            self.get_test_loc("maven/index/increment/nexus-maven-repository-index.445.gz"),
+            self.get_test_loc("maven/index/increment2/nexus-maven-repository-index.457.gz"),
+        ]
+        expected = self.get_expected_packages(indexes[1])
+        checkpoint = {"index": "nexus-maven-repository-index.457.gz", "records": 0}
+        result = list(
+            maven.get_index_packages(
+                indexes, get_package=maven.get_package_urls, checkpoint=checkpoint
+            )
+        )
+        self.assertEqual(expected, result)
+
+    def test_get_index_packages_ignores_checkpoint_of_another_index(self):
+        index = self.get_test_loc("maven/index/nexus-maven-repository-index.gz")
+        expected = self.get_expected_packages(index)
+        checkpoint = {
+            "index": "nexus-maven-repository-index.gz",
+            "timestamp": 1,
+            "records": 20,
+        }
+        result = list(
+            maven.get_index_packages(
+                [index], get_package=maven.get_package_urls, checkpoint=checkpoint
+            )
+        )
+        self.assertEqual(expected, result)
+
+    @mock.patch("minecode.pipes.fetch.FETCH_MAX_WORKERS", 4)
+    @mock.patch("minecode.pipes.fetch.fetch")
+    def test_collector_get_packages_checkpoints_packages_consumed(self, mock_get):
+        mock_get.return_value = mock.Mock(ok=True, content=b"<project/>")
+        index = self.get_test_loc("maven/index/nexus-maven-repository-index.gz")
+        properties = self.get_test_loc(
+            "maven/index/increment/nexus-maven-repository-index.properties"
+        )
+        expected = self.get_expected_packages(index)
+        collector = maven.MavenNexusCollector(
+            index_location=index, index_properties_location=properties
+        )
+        packages = collector.get_packages()
+        for current_purl, packageurls, _api_data_url in expected[:3]:
+            result = next(packages)
+            self.assertEqual((current_purl, packageurls), result[:2])
+            self.assertEqual([(current_purl, b"<project/>")], list(result[2]))
+
+        # the packages read ahead to fetch their POMs are not checkpointed as
+        # consumed: only the last package yielded is yielded again
+        resumed = maven.MavenNexusCollector(
+            index_location=index,
+            index_properties_location=properties,
+            checkpoint=collector.checkpoint,
+        )
+        result = [
+            (current_purl, packageurls, list(poms))
+            for current_purl, packageurls, poms in resumed.get_packages()
+        ]
+        expected = [
+            (current_purl, packageurls, [(current_purl, b"<project/>")])
+            for current_purl, packageurls, _api_data_url in expected[2:]
+        ]
+        self.assertEqual(expected, result)
@@ -0,0 +1,81 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+import io
+import os
+import struct
+from unittest import mock
+
+from commoncode.testcase import FileBasedTesting
+from jawa.util.utf import decode_modified_utf8
+
+from minecode.pipes import maven
+from minecode.pipes import maven_index
+
+
+class MavenIndexTest(FileBasedTesting):
+    test_data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+    def check_same_entries_as_stream_decoder(self, index, fields):
+        expected = list(maven.get_entries_from_stream(index, fields=fields))
+        result = list(maven.get_entries(index, fields=fields))
+        self.assertTrue(expected)
+        self.assertEqual(expected, result)
+
+    def test_get_entries_same_as_stream_decoder(self):
+        index = self.get_test_loc("maven/index/nexus-maven-repository-index.gz")
+        self.check_same_entries_as_stream_decoder(index, fields=frozenset(maven.ENTRY_FIELDS))
+        self.check_same_entries_as_stream_decoder(index, fields=())
+
+    def test_get_entries_same_as_stream_decoder_buggy(self):
+        index = self.get_test_loc("maven/index/buggy/nexus-maven-repository-index.gz")
+        self.check_same_entries_as_stream_decoder(index, fields=frozenset(maven.ENTRY_FIELDS))
+
+    def test_get_entries_with_entries_across_buffer_reads(self):
+        index = self.get_test_loc("maven/index/nexus-maven-repository-index.gz")
+        expected = list(maven.get_entries_from_stream(index))
+        with mock.patch("minecode.pipes.maven_index.INDEX_READ_SIZE", 7):
+            result = list(maven.get_entries(index))
+        self.assertEqual(expected, result)
+
+    def test_iter_entries_decodes_non_ascii_values_and_skips_fields(self):
+        def encode_field(name, value):
+            return struct.pack(">bH", 0, len(name)) + name + struct.pack(">i", len(value)) + value
+
+        data = (
+            struct.pack(">bq", 1, -1)
+            + struct.pack(">i", 2)
+            + encode_field(b"n", "café".encode())
+            + encode_field(b"x", b"\xc0\x80skipped")
+            # a truncated last entry is ignored
+            + struct.pack(">i", 1)
+            + encode_field(b"n", b"truncated")[:-2]
+        )
+        result = list(maven_index.iter_entries(io.BytesIO(data), fields={"n"}))
+        self.assertEqual([{"n": decode_modified_utf8("café".encode())}], result)
+
+    def test_iter_record_batches_splits_complete_records(self):
+        index = self.get_test_loc("maven/index/nexus-maven-repository-index.gz")
+        expected = list(maven.get_entries(index, fields=()))
+        result = []
+        batch_sizes = []
+        with mock.patch("minecode.pipes.maven_index.INDEX_READ_SIZE", 7):
+            with maven.GzipFileWithTrailing(index, "rb") as nexus_index:
+                _version, _timestamp, buffer = maven_index.read_index_header(nexus_index)
+                batches = maven_index.iter_record_batches(nexus_index, buffer, batch_size=10)
+                for records_count, data in batches:
+                    batch_sizes.append(records_count)
+                    offset = 0
+                    for _ in range(records_count):
+                        entry, offset = maven_index.decode_entry(data, offset)
+                        if entry:
+                            result.append(entry)
+                    self.assertEqual(len(data), offset)
+        self.assertEqual(expected, result)
+        self.assertEqual([10, 10, 10, 2], batch_sizes)
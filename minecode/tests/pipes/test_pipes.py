@@ -6,12 +6,27 @@
 # See https://github.com/aboutcode-org/purldb for support or download.
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
+import gzip
+import json
 import tempfile
 from pathlib import Path
 from unittest import TestCase
+from unittest import mock
+
 from git import Repo
 
+from minecode.pipes import MINECODE_PIPELINES_CONFIG_REPO
+from minecode.pipes import add_packageurls_to_checkout
+from minecode.pipes import clear_mined_packages_in_checkpoint
+from minecode.pipes import commit_and_push_checkout
 from minecode.pipes import get_commit_at_distance_ahead
+from minecode.pipes import get_mined_packages_from_checkpoint
+from minecode.pipes import get_mined_packages_path
+from minecode.pipes import load_data_from_yaml_file
+from minecode.pipes import read_mined_packages
+from minecode.pipes import update_mined_packages_in_checkpoint
+from minecode.pipes import write_checkout_packageurls
+from minecode.pipes import write_data_to_yaml_file
 
 
 class GetCommitAtDistanceAheadIntegrationTests(TestCase):
@@ -63,3 +78,143 @@ class GetCommitAtDistanceAheadIntegrationTests(TestCase):
                 self.repo, self.commits[-1], num_commits_ahead=10, branch_name="master"
             )
         self.assertIn("Not enough commits ahead; only 0 available.", str(cm.exception))
+
+
+class MinedPackagesCheckpointTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cloned_repo = mock.Mock(working_dir=self.tmpdir.name)
+        self.checkpoint_path = "pypi/packages_checkpoint.json"
+        self.mined_packages_path = Path(self.tmpdir.name) / "pypi/packages_checkpoint.txt.gz"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_get_mined_packages_path(self):
+        self.assertEqual(
+            "npm/packages_checkpoint.txt.gz",
+            get_mined_packages_path("npm/packages_checkpoint.json"),
+        )
+
+    @mock.patch("scanpipe.pipes.federatedcode.commit_and_push_changes")
+    def test_update_mined_packages_in_checkpoint_appends_packages(self, mock_commit):
+        update_mined_packages_in_checkpoint(
+            packages=["pkg:pypi/b", "pkg:pypi/a", "pkg:pypi/b"],
+            cloned_repo=self.cloned_repo,
+            checkpoint_path=self.checkpoint_path,
+        )
+        first_batch_size = self.mined_packages_path.stat().st_size
+        update_mined_packages_in_checkpoint(
+            packages=["pkg:pypi/c"],
+            cloned_repo=self.cloned_repo,
+            checkpoint_path=self.checkpoint_path,
+        )
+
+        content = self.mined_packages_path.read_bytes()
+        # the first batch is kept as is
+        self.assertEqual(
+            read_mined_packages(content[:first_batch_size]), {"pkg:pypi/a", "pkg:pypi/b"}
+        )
+        self.assertEqual({"pkg:pypi/a", "pkg:pypi/b", "pkg:pypi/c"}, read_mined_packages(content))
+        self.assertEqual(2, mock_commit.call_count)
+        files_to_commit = mock_commit.call_args.kwargs["files_to_commit"]
+        self.assertEqual([str(self.mined_packages_path)], files_to_commit)
+
+    @mock.patch("scanpipe.pipes.federatedcode.commit_and_push_changes")
+    def test_update_mined_packages_in_checkpoint_without_packages(self, mock_commit):
+        update_mined_packages_in_checkpoint(
+            packages=[],
+            cloned_repo=self.cloned_repo,
+            checkpoint_path=self.checkpoint_path,
+        )
+        self.assertFalse(self.mined_packages_path.exists())
+        mock_commit.assert_not_called()
+
+    @mock.patch("scanpipe.pipes.federatedcode.commit_and_push_changes")
+    def test_clear_mined_packages_in_checkpoint(self, mock_commit):
+        update_mined_packages_in_checkpoint(
+            packages=["pkg:pypi/a"],
+            cloned_repo=self.cloned_repo,
+            checkpoint_path=self.checkpoint_path,
+        )
+        clear_mined_packages_in_checkpoint(
+            cloned_repo=self.cloned_repo,
+            checkpoint_path=self.checkpoint_path,
+        )
+        self.assertEqual(set(), read_mined_packages(self.mined_packages_path.read_bytes()))
+        json_checkpoint = Path(self.tmpdir.name) / self.checkpoint_path
+        self.assertEqual({"packages_mined": []}, json.loads(json_checkpoint.read_text()))
+
+    @mock.patch("requests.get")
+    def test_get_mined_packages_from_checkpoint_merges_legacy_list(self, mock_get):
+        def get(url):
+            if url.endswith(".json"):
+                return mock.Mock(ok=True, text='{"packages_mined": ["pkg:pypi/a"]}')
+            content = gzip.compress(b"pkg:pypi/b\n") + gzip.compress(b"pkg:pypi/c\n")
+            return mock.Mock(ok=True, content=content)
+
+        mock_get.side_effect = get
+        result = get_mined_packages_from_checkpoint(
+            config_repo=MINECODE_PIPELINES_CONFIG_REPO,
+            checkpoint_path=self.checkpoint_path,
+        )
+        self.assertEqual({"pkg:pypi/a", "pkg:pypi/b", "pkg:pypi/c"}, result)
+        mined_packages_url = mock_get.call_args_list[-1].args[0]
+        self.assertTrue(
+            mined_packages_url.endswith("refs/heads/main/pypi/packages_checkpoint.txt.gz")
+        )
+
+
+class CheckoutPackageURLsTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.checkout = {
+            "repo": mock.Mock(working_dir=self.tmpdir.name),
+            "file_to_commit": set(),
+            "file_processed_count": 0,
+            "commit_count": 0,
+            "purls_by_file": {},
+            "purl_files_to_write": set(),
+        }
+        self.purl_file = Path(self.tmpdir.name) / "npm/foo/purls.yml"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_add_packageurls_to_checkout_writes_files_once_on_flush(self):
+        write_data_to_yaml_file(self.purl_file, ["pkg:npm/foo@1.0.0"])
+        add_packageurls_to_checkout(
+            self.checkout, "npm/foo/purls.yml", ["pkg:npm/foo@3.0.0"], append=True
+        )
+        add_packageurls_to_checkout(
+            self.checkout,
+            "npm/foo/purls.yml",
+            ["pkg:npm/foo@2.0.0", "pkg:npm/foo@1.0.0"],
+            append=True,
+        )
+        # nothing is written until the checkout is flushed
+        self.assertEqual(["pkg:npm/foo@1.0.0"], load_data_from_yaml_file(self.purl_file))
+
+        with mock.patch("minecode.pipes.write_data_to_yaml_file") as mock_write:
+            mock_write.side_effect = write_data_to_yaml_file
+            write_checkout_packageurls(self.checkout)
+            write_checkout_packageurls(self.checkout)
+        self.assertEqual(1, mock_write.call_count)
+        expected = ["pkg:npm/foo@1.0.0", "pkg:npm/foo@2.0.0", "pkg:npm/foo@3.0.0"]
+        self.assertEqual(expected, load_data_from_yaml_file(self.purl_file))
+
+    def test_add_packageurls_to_checkout_replaces_purls_without_append(self):
+        write_data_to_yaml_file(self.purl_file, ["pkg:npm/foo@1.0.0"])
+        add_packageurls_to_checkout(self.checkout, "npm/foo/purls.yml", ["pkg:npm/foo@2.0.0"])
+        add_packageurls_to_checkout(self.checkout, "npm/foo/purls.yml", ["pkg:npm/foo@3.0.0"])
+        write_checkout_packageurls(self.checkout)
+        self.assertEqual(["pkg:npm/foo@3.0.0"], load_data_from_yaml_file(self.purl_file))
+
+    @mock.patch("scanpipe.pipes.federatedcode.commit_and_push_changes")
+    def test_commit_and_push_checkout_writes_purl_files_before_commit(self, mock_commit):
+        mock_commit.side_effect = lambda **kwargs: self.purl_file.exists()
+        add_packageurls_to_checkout(self.checkout, "npm/foo/purls.yml", ["pkg:npm/foo@1.0.0"])
+        self.checkout["file_to_commit"].add("npm/foo/purls.yml")
+        commit_and_push_checkout(self.checkout, commit_message="Add purls", logger=None)
+        self.assertEqual(1, self.checkout["commit_count"])
+        self.assertEqual(set(), self.checkout["file_to_commit"])
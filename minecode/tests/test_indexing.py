@@ -73,6 +73,38 @@ class IndexingTest(MiningTestCase, JsonBasedTesting):
         )
         self.check_expected_results(resource_data, expected_resources_loc, regen=FIXTURES_REGEN)
 
+    def test_indexing_bulk_indexer(self):
+        scan_data_loc = self.get_test_loc("indexing/scancodeio_wagon-api-20040705.181715.json")
+        with open(scan_data_loc, "rb") as f:
+            scan_data = json.load(f)
+
+        indexer = indexing.BulkIndexer(self.package1, batch_size=10)
+        for resource in scan_data["files"]:
+            indexer.add(resource)
+        indexer.flush()
+
+        expected_counts = {
+            "ApproximateDirectoryContentIndex": 11,
+            "ApproximateDirectoryStructureIndex": 11,
+            "ApproximateResourceContentIndex": 2,
+            "ExactFileIndex": 45,
+            "Resource": 64,
+        }
+        self.assertEqual(expected_counts, dict(indexer.counts))
+
+        # Indexing the same scan again does not create new rows
+        indexer = indexing.BulkIndexer(self.package1)
+        for resource in scan_data["files"]:
+            indexer.add(resource)
+        indexer.flush()
+
+        self.assertEqual(0, sum(indexer.counts.values()))
+        self.assertFalse(
+            Resource.objects.filter(package=self.package1, snippets_count__isnull=True).exists()
+        )
+        self.assertEqual(64, Resource.objects.filter(package=self.package1).count())
+        self.assertEqual(45, ExactFileIndex.objects.filter(package=self.package1).count())
+
     def test_indexing_index_package(self):
         scan_data_loc = self.get_test_loc("indexing/scancodeio_wagon-api-20040705.181715.json")
         with open(scan_data_loc, "rb") as f:
@@ -7,17 +7,21 @@
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
 
+import copy
 import os
 
 from django.test import TransactionTestCase
 
 from packagedcode.maven import _parse
 
+from minecode.model_utils import add_packages_to_scan_queue
 from minecode.model_utils import merge_or_create_package
+from minecode.model_utils import merge_or_create_packages
 from minecode.model_utils import update_or_create_resource
 from minecode.tests import FIXTURES_REGEN
 from minecode.utils_test import JsonBasedTesting
 from minecode.utils_test import MiningTestCase
+from minecode.models import ScannableURI
 from packagedb.models import Package
 from packagedb.models import Resource
 
@@ -102,6 +106,74 @@ class ModelUtilsTestCase(MiningTestCase, JsonBasedTesting):
             updated_fields, expected_updated_fields_loc, regen=FIXTURES_REGEN
         )
 
+    def test_merge_or_create_packages(self):
+        stored_package = Package.objects.create(
+            type="maven",
+            namespace="org.apache.pulsar",
+            name="pulsar",
+            version="2.5.1",
+            download_url="https://repo1.maven.org/maven2/org/apache/pulsar/pulsar/2.5.1/pulsar-2.5.1.jar",
+        )
+        sources_package = copy.deepcopy(self.scanned_package)
+        sources_package.download_url = sources_package.download_url.replace(".jar", "-sources.jar")
+        sources_package.qualifiers = {"classifier": "sources"}
+        no_download_url_package = copy.deepcopy(self.scanned_package)
+        no_download_url_package.download_url = ""
+
+        results = merge_or_create_packages(
+            [
+                (self.scanned_package, 50),
+                (sources_package, 50),
+                (no_download_url_package, 50),
+                (sources_package, 50),
+            ]
+        )
+
+        self.assertEqual(2, Package.objects.count())
+        sources = Package.objects.get(download_url=sources_package.download_url)
+        created_flags = [(created, merged) for _, created, merged, _ in results]
+        self.assertEqual(
+            [(False, True), (True, False), (False, False), (False, True)], created_flags
+        )
+        self.assertEqual([stored_package, sources, None, sources], [r[0] for r in results])
+        self.assertIn("No download_url for package", results[2][3])
+
+        self.assertTrue(sources.created_date)
+        self.assertEqual(len(sources_package.dependencies), sources.dependencies.count())
+        self.assertEqual(
+            f"New Package created from URI: {sources_package.download_url}",
+            sources.get_history()[0]["message"],
+        )
+        # the new package is in a package set with the existing related package
+        package_set = sources.package_sets.get()
+        self.assertEqual([stored_package, sources], list(package_set.packages.order_by("id")))
+
+    def test_add_packages_to_scan_queue(self):
+        package1 = Package.objects.create(type="npm", name="foo", download_url="https://foo.tgz")
+        package2 = Package.objects.create(type="npm", name="bar", download_url="https://bar.tgz")
+        ScannableURI.objects.create(
+            uri=package1.download_url,
+            package=package1,
+            pipelines=["scan_single_package"],
+            reindex_uri=True,
+            priority=100,
+        )
+        packages_and_pipelines = [
+            (package1, ("scan_single_package",)),
+            (package1, ("scan_single_package", "inspect_elf_binaries")),
+            (package2, ("scan_single_package",)),
+            (package2, ("scan_single_package",)),
+        ]
+        with self.assertNumQueries(2):
+            created = add_packages_to_scan_queue(
+                packages_and_pipelines, priority=100, reindex_uri=True
+            )
+        self.assertEqual(2, created)
+        self.assertEqual(3, ScannableURI.objects.count())
+        scannable_uri = ScannableURI.objects.get(package=package2)
+        self.assertEqual(["scan_single_package"], scannable_uri.pipelines)
+        self.assertTrue(scannable_uri.canonical)
+
 
 class UpdateORCreateResourceTest(TransactionTestCase):
     def setUp(self):
@@ -13,9 +13,13 @@ from datetime import timedelta
 from django.test import TestCase
 from django.utils import timezone
 
+from minecode.models import PriorityResourceURI
 from minecode.models import ResourceURI
 from minecode.models import ScannableURI
 from minecode.models import get_canonical
+from minecode.models import release
+from minecode.models import renew_leases
+from minecode.models import save_and_release
 from packagedb.models import Package
 
 
@@ -285,6 +289,72 @@ class ResourceURIManagerGetNextVisitableUnmappableURITestCase(TestCase):
         self.assertEqual(self.resource1, ResourceURI.objects.get_next_visitable())
         self.assertIsNone(ResourceURI.objects.get_next_visitable())
 
+    def test_lease_visitables(self):
+        self.assertEqual(
+            [self.resource1, self.resource0], ResourceURI.objects.lease_visitables(count=5)
+        )
+        self.assertEqual([], ResourceURI.objects.lease_visitables(count=5))
+
+        self.resource0.refresh_from_db()
+        self.assertTrue(self.resource0.wip_date)
+        release([self.resource0])
+        self.assertEqual([self.resource0], ResourceURI.objects.lease_visitables(count=5))
+
+    def test_lease_visitables_with_expired_lease(self):
+        self.resource0.wip_date = timezone.now() - timedelta(hours=2)
+        self.resource1.wip_date = timezone.now()
+        self.resource0.save()
+        self.resource1.save()
+
+        self.assertEqual([], ResourceURI.objects.lease_visitables(count=5, lease_expiry=0))
+        self.assertEqual(
+            [self.resource0], ResourceURI.objects.lease_visitables(count=5, lease_expiry=3600)
+        )
+
+    def test_release_only_releases_held_leases(self):
+        leased = ResourceURI.objects.lease_visitables(count=5)
+        # resource0 lease expired and was leased again by another worker
+        ResourceURI.objects.filter(pk=self.resource0.pk).update(wip_date=timezone.now())
+
+        release(leased)
+        self.resource0.refresh_from_db()
+        self.resource1.refresh_from_db()
+        self.assertTrue(self.resource0.wip_date)
+        self.assertIsNone(self.resource1.wip_date)
+
+    def test_save_and_release_only_saves_held_leases(self):
+        resource1, resource0 = ResourceURI.objects.lease_visitables(count=5)
+        ResourceURI.objects.filter(pk=resource0.pk).update(wip_date=timezone.now())
+
+        resource0.visit_error = "error"
+        self.assertFalse(save_and_release(resource0))
+        resource1.visit_error = "error"
+        self.assertTrue(save_and_release(resource1))
+
+        self.resource0.refresh_from_db()
+        self.resource1.refresh_from_db()
+        self.assertTrue(self.resource0.wip_date)
+        self.assertIsNone(self.resource0.visit_error)
+        self.assertIsNone(self.resource1.wip_date)
+        self.assertEqual("error", self.resource1.visit_error)
+
+    def test_renew_leases(self):
+        leased = ResourceURI.objects.lease_visitables(count=5)
+        self.assertEqual(leased, renew_leases(leased, lease_expiry=0))
+        self.assertEqual(leased, renew_leases(leased, lease_expiry=3600))
+
+        one_hour_ago = timezone.now() - timedelta(hours=1)
+        ResourceURI.objects.update(wip_date=one_hour_ago)
+        for resource_uri in leased:
+            resource_uri.wip_date = one_hour_ago
+        # resource0 lease expired and was leased again by another worker
+        ResourceURI.objects.filter(pk=self.resource0.pk).update(wip_date=timezone.now())
+
+        self.assertEqual([self.resource1], renew_leases(leased, lease_expiry=3600))
+        self.resource1.refresh_from_db()
+        self.assertGreater(self.resource1.wip_date, one_hour_ago)
+        self.assertEqual([], ResourceURI.objects.lease_visitables(count=5, lease_expiry=3600))
+
 
 class ResourceURIManagerGetNextVisitableMappableURITestCase(TestCase):
     def setUp(self):
@@ -441,6 +511,62 @@ class ScannableURIManagerTestCase(TestCase):
         self.assertEqual(self.test_uri4, result.uri)
         self.assertTrue(result.wip_date)
 
+    def test_ScannableURIManager_timeout_scans(self):
+        now = timezone.now()
+        # timedelta(days=1, minutes=1).seconds is less than the timeout
+        self.scannable_uri2.scan_date = now - timedelta(days=1, minutes=1)
+        self.scannable_uri2.wip_date = now
+        self.scannable_uri2.save()
+        self.scannable_uri3.scan_date = now - timedelta(minutes=1)
+        self.scannable_uri3.save()
+        self.scannable_uri4.scan_date = now - timedelta(days=2)
+        self.scannable_uri4.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(1, ScannableURI.objects.timeout_scans(scan_timeout=7200))
+
+        self.scannable_uri2.refresh_from_db()
+        self.assertEqual(ScannableURI.SCAN_TIMEOUT, self.scannable_uri2.scan_status)
+        self.assertIsNone(self.scannable_uri2.wip_date)
+        self.scannable_uri3.refresh_from_db()
+        self.assertEqual(ScannableURI.SCAN_IN_PROGRESS, self.scannable_uri3.scan_status)
+        self.assertEqual(0, ScannableURI.objects.timeout_scans(scan_timeout=7200))
+
+
+class PriorityResourceURIManagerTestCase(TestCase):
+    def setUp(self):
+        self.request0 = PriorityResourceURI.objects.insert(
+            uri="pkg:npm/foo@1.0.0", request_date=timezone.now() - timedelta(hours=1)
+        )
+        self.request1 = PriorityResourceURI.objects.insert(
+            uri="pkg:npm/bar@1.0.0", request_date=timezone.now()
+        )
+
+    def test_PriorityResourceURIManager_lease_requests(self):
+        self.assertEqual([self.request0], PriorityResourceURI.objects.lease_requests(count=1))
+        self.assertEqual([self.request1], PriorityResourceURI.objects.lease_requests(count=5))
+        self.assertIsNone(PriorityResourceURI.objects.get_next_request())
+
+    def test_PriorityResourceURIManager_insert_many(self):
+        self.request0.processed_date = timezone.now()
+        self.request0.save()
+        uris_and_extra_fields = [
+            ("pkg:npm/foo@1.0.0", {}),
+            ("pkg:npm/bar@1.0.0", {}),
+            ("pkg:npm/bar@1.0.0", {"addon_pipelines": ["inspect_elf_binaries"]}),
+            ("pkg:npm/baz@1.0.0", {"priority": 100}),
+            ("pkg:npm/baz@1.0.0", {"priority": 100}),
+        ]
+        with self.assertNumQueries(2):
+            results = PriorityResourceURI.objects.insert_many(uris_and_extra_fields)
+
+        self.assertEqual([True, False, True, True, False], [bool(result) for result in results])
+        self.assertEqual(5, PriorityResourceURI.objects.count())
+        baz = PriorityResourceURI.objects.get(uri="pkg:npm/baz@1.0.0")
+        self.assertEqual("pkg:npm/baz@1.0.0", baz.package_url)
+        self.assertEqual(100, baz.priority)
+        self.assertIsNone(PriorityResourceURI.objects.insert("pkg:npm/baz@1.0.0", priority=100))
+
 
 class ScannableURIModelTestCase(TestCase):
     def setUp(self):
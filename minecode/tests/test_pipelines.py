@@ -0,0 +1,97 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+from unittest import TestCase
+from unittest import mock
+
+from minecode.pipelines import commit_and_push_packageurls
+from minecode.pipelines.mine_npm import MineNPM
+
+
+class CommitAndPushPackageURLsTest(TestCase):
+    def commit_and_push_packageurls(self, checkpoint_func, last_checkpoint_call):
+        return commit_and_push_packageurls(
+            current_working_repos=[],
+            commit_msg_func=None,
+            checkpoint_func=checkpoint_func,
+            checkpoint_on_commit=False,
+            checkpoint_interval=60,
+            last_checkpoint_call=last_checkpoint_call,
+            logger=None,
+        )
+
+    @mock.patch("time.time")
+    def test_commit_and_push_packageurls_returns_last_checkpoint_call(self, mock_time):
+        checkpoint_func = mock.Mock()
+
+        mock_time.return_value = 1030
+        last_checkpoint_call = self.commit_and_push_packageurls(checkpoint_func, 1000)
+        self.assertEqual(1000, last_checkpoint_call)
+        checkpoint_func.assert_not_called()
+
+        mock_time.return_value = 1060
+        last_checkpoint_call = self.commit_and_push_packageurls(
+            checkpoint_func, last_checkpoint_call
+        )
+        self.assertEqual(1060, last_checkpoint_call)
+        self.assertEqual(1, checkpoint_func.call_count)
+
+        # the checkpoint is not due again right after it was called
+        mock_time.return_value = 1090
+        last_checkpoint_call = self.commit_and_push_packageurls(
+            checkpoint_func, last_checkpoint_call
+        )
+        self.assertEqual(1060, last_checkpoint_call)
+        self.assertEqual(1, checkpoint_func.call_count)
+
+
+class MineNPMCheckpointTest(TestCase):
+    def get_pipeline(self, packages):
+        pipeline = MineNPM.__new__(MineNPM)
+        pipeline.packages = packages
+        pipeline.config_repo = mock.Mock()
+        pipeline.data_clusters = {"purls": None, "api_package_version_response": None}
+        pipeline.checked_out_repos = {}
+        pipeline.working_path = None
+        pipeline.append_purls = False
+        pipeline.package_batch_size = 0
+        pipeline.commit_message = mock.Mock()
+        pipeline.log = mock.Mock()
+        return pipeline
+
+    @mock.patch("minecode.pipelines.pipes.commit_and_push_checkout")
+    @mock.patch("minecode.pipelines.add_packageurls_to_checkout")
+    @mock.patch("minecode.pipelines.get_repo_checkout_from_data_cluster")
+    @mock.patch("minecode.pipes.npm.yield_npm_package_data")
+    @mock.patch("minecode.pipes.npm.get_npm_packageurls")
+    @mock.patch("minecode.pipes.npm.update_mined_packages_in_checkpoint")
+    def test_mine_and_publish_packageurls_saves_every_checkpoint(
+        self,
+        mock_update_checkpoint,
+        mock_get_packageurls,
+        mock_yield_package_data,
+        mock_get_repo_checkout,
+        mock_add_packageurls,
+        mock_commit_and_push,
+    ):
+        checkpoints = []
+        mock_update_checkpoint.side_effect = lambda packages, **kwargs: checkpoints.append(
+            list(packages)
+        )
+        mock_get_packageurls.side_effect = lambda name: [f"pkg:npm/{name}@1.0.0"]
+        mock_yield_package_data.return_value = []
+        repo_checkout = {"file_to_commit": set(), "file_processed_count": 0, "commit_count": 0}
+        mock_get_repo_checkout.return_value = (repo_checkout, "purls.yml")
+
+        pipeline = self.get_pipeline(packages=["a", "b", "c"])
+        pipeline.mine_and_publish_packageurls()
+
+        # each package is committed and checkpointed in its own batch
+        expected = [["pkg:npm/a"], ["pkg:npm/b"], ["pkg:npm/c"]]
+        self.assertEqual(expected, [packages for packages in checkpoints if packages])
@@ -9,6 +9,7 @@
 
 import os
 from io import StringIO
+from unittest import mock
 
 from django.core import management
 from django.utils import timezone
@@ -17,6 +18,7 @@ from packagedcode.models import Package as ScannedPackage
 
 import packagedb
 from minecode.management.commands.run_map import map_uri
+from minecode.management.commands.run_map import map_uris
 from minecode.model_utils import merge_packages
 from minecode.models import ResourceURI
 from minecode.models import ScannableURI
@@ -95,6 +97,103 @@ class RunMapTest(JsonBasedTesting, MiningTestCase):
         scannable = ScannableURI.objects.filter(uri="http://testdomap.com")
         self.assertEqual(1, scannable.count())
 
+    def test_map_uris(self):
+        def mock_mapper(uri, resource_uri):
+            if uri.endswith("error"):
+                raise Exception()
+            return [
+                ScannedPackage(
+                    type="maven",
+                    namespace="org.apache.spark",
+                    name="spark-streaming_2.10",
+                    version="1.2.0",
+                    qualifiers=dict(classifier=uri.rpartition("/")[-1]),
+                    download_url=uri,
+                ),
+                ScannedPackage(type="maven", name="no-download-url"),
+            ]
+
+        router = Router()
+        router.append("http://testdomap.com/.*", mock_mapper)
+
+        uris = [
+            "http://testdomap.com/sources",
+            "http://testdomap.com/javadoc",
+            "http://testdomap.com/error",
+        ]
+        resource_uris = []
+        for uri in uris:
+            resource_uri = ResourceURI.objects.insert(uri=uri, last_visit_date=timezone.now())
+            resource_uri.is_mappable = True
+            resource_uri.save()
+            resource_uris.append(resource_uri)
+
+        map_uris(resource_uris, _map_router=router)
+
+        mapped = packagedb.models.Package.objects.order_by("download_url")
+        self.assertEqual(uris[:2][::-1], [package.download_url for package in mapped])
+        scannable_uris = ScannableURI.objects.order_by("uri")
+        self.assertEqual(uris[:2][::-1], [scannable.uri for scannable in scannable_uris])
+        self.assertEqual(
+            [package.pk for package in mapped],
+            [scannable.package_id for scannable in scannable_uris],
+        )
+        self.assertEqual(1, packagedb.models.PackageSet.objects.count())
+
+        for uri in uris:
+            resource_uri = ResourceURI.objects.get(uri=uri)
+            self.assertEqual(None, resource_uri.wip_date)
+            self.assertFalse(resource_uri.last_map_date is None)
+            self.assertTrue(resource_uri.map_error)
+        self.assertIn("No download_url", ResourceURI.objects.get(uri=uris[0]).map_error)
+        self.assertIn("Failed to map", ResourceURI.objects.get(uri=uris[2]).map_error)
+
+    def test_map_uris_adds_mapped_packages_to_scan_queue_once(self):
+        download_urls = [
+            "http://testdomap.com/queued-1.0.jar",
+            "http://testdomap.com/new-1.0.jar",
+            "http://testdomap.com/new-1.0.jar",
+        ]
+
+        def mock_mapper(uri, resource_uri):
+            return [
+                ScannedPackage(type="maven", name="test", download_url=download_url)
+                for download_url in download_urls
+            ]
+
+        router = Router()
+        router.append("http://testdomap.com/.*", mock_mapper)
+        resource_uri = ResourceURI.objects.insert(
+            uri="http://testdomap.com/index", last_visit_date=timezone.now()
+        )
+
+        queued_package = packagedb.models.Package.objects.create(
+            type="maven", name="queued", version="1.0", download_url=download_urls[0]
+        )
+        ScannableURI.objects.create(uri=download_urls[0], package=queued_package)
+        new_package = packagedb.models.Package.objects.create(
+            type="maven", name="new", version="1.0", download_url=download_urls[1]
+        )
+        results = [
+            (queued_package, True, False, ""),
+            (new_package, True, False, ""),
+            (new_package, True, False, ""),
+        ]
+
+        with mock.patch(
+            "minecode.management.commands.run_map.merge_or_create_packages",
+            return_value=results,
+        ):
+            map_uris([resource_uri], _map_router=router)
+
+        scannable_uris = ScannableURI.objects.order_by("uri")
+        self.assertEqual(
+            [(new_package.pk, download_urls[1]), (queued_package.pk, download_urls[0])],
+            [(scannable_uri.package_id, scannable_uri.uri) for scannable_uri in scannable_uris],
+        )
+        resource_uri.refresh_from_db()
+        self.assertIsNone(resource_uri.map_error)
+
     def test_map_uri_continues_after_raised_exception(self):
         # setup
         # build a mock mapper and register it in a router
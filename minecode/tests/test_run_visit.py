@@ -8,13 +8,18 @@
 #
 
 from collections import Counter
+from datetime import timedelta
 from io import StringIO
+from unittest.mock import patch
 
 from django.core import management
+from django.utils import timezone
 
 from minecode.management.commands.run_visit import visit_uri
 from minecode.miners import URI
 from minecode.models import ResourceURI
+from minecode.models import get_leasable_lookup
+from minecode.models import lease
 from minecode.route import Router
 from minecode.utils_test import MiningTestCase
 
@@ -466,6 +471,28 @@ class RunVisitWithCounterTest(MiningTestCase):
         visited = ResourceURI.objects.filter(uri="http://test-counter-2-max-uris-1.com")
         self.assertEqual(0, visited.count())
 
+    def test_visit_uri_parks_resource_uri_without_route(self):
+        resource_uri = ResourceURI.objects.insert(uri="http://no-route.com")
+        resource_uri.wip_date = timezone.now()
+        resource_uri.save()
+
+        self.assertEqual(0, visit_uri(resource_uri, _visit_router=Router()))
+        resource_uri.refresh_from_db()
+        self.assertTrue(resource_uri.is_parked)
+
+        # a parked ResourceURI is not an expired lease
+        resource_uri.wip_date = timezone.now() - timedelta(hours=2)
+        resource_uri.save()
+        leasables = ResourceURI.objects.filter(get_leasable_lookup(lease_expiry=3600))
+        self.assertEqual([], list(leasables))
+
+        # once its wip_date is cleared it is leased and no longer parked
+        resource_uri.wip_date = None
+        resource_uri.save()
+        self.assertEqual([resource_uri], lease(leasables.order_by("pk")))
+        resource_uri.refresh_from_db()
+        self.assertFalse(resource_uri.is_parked)
+
     def test_visit_uri_with_counter_1_no_max_uri(self):
         # setup
         # build a test visitor and register it in a router
@@ -572,3 +599,67 @@ class RunVisitTest(MiningTestCase):
         expected = [resource_uri2]
 
         self.assertEqual(expected, list(visited))
+
+    def test_visit_uri_inserts_new_uris_in_batches(self):
+        def mock_visitor(uri):
+            uris = [URI(uri=f"http://test.com/{i}") for i in range(5)]
+            # duplicated URIs are only inserted once
+            uris += [URI(uri="http://test.com/0"), URI(uri="http://test.com/4")]
+            return uris, None, None
+
+        router = Router()
+        router.append(self.uri, mock_visitor)
+
+        with patch("minecode.management.commands.run_visit.VISITED_URIS_BATCH_SIZE", 2):
+            inserted_count = visit_uri(self.resource_uri, _visit_router=router)
+
+        self.assertEqual(5, inserted_count)
+        visited = ResourceURI.objects.filter(uri__startswith="http://test.com/")
+        self.assertEqual(
+            [f"http://test.com/{i}" for i in range(5)],
+            sorted(visited.values_list("uri", flat=True)),
+        )
+        self.assertTrue(all(resource_uri.canonical for resource_uri in visited))
+
+    def test_visit_uri_with_max_uris_stops_consuming_visitor_uris(self):
+        consumed = []
+
+        def mock_visitor(uri):
+            def get_uris():
+                for i in range(100):
+                    consumed.append(i)
+                    yield URI(uri=f"http://test.com/{i}")
+
+            return get_uris(), None, None
+
+        router = Router()
+        router.append(self.uri, mock_visitor)
+        counter = Counter()
+
+        inserted_count = visit_uri(
+            self.resource_uri,
+            _visit_router=router,
+            max_uris=2,
+            uri_counter_by_visitor=counter,
+        )
+
+        self.assertEqual(3, inserted_count)
+        self.assertEqual(3, len(consumed))
+
+    def test_visit_uri_does_not_count_uris_that_are_not_inserted(self):
+        now = timezone.now()
+        ResourceURI.objects.insert(uri="http://test.com/0", last_visit_date=now)
+
+        def mock_visitor(uri):
+            uris = [URI(uri=f"http://test.com/{i}", visited=True) for i in range(2)]
+            return uris, None, None
+
+        router = Router()
+        router.append(self.uri, mock_visitor)
+
+        with patch("minecode.management.commands.run_visit.timezone.now", return_value=now):
+            inserted_count = visit_uri(self.resource_uri, _visit_router=router)
+
+        self.assertEqual(1, inserted_count)
+        visited = ResourceURI.objects.filter(uri__startswith="http://test.com/")
+        self.assertEqual(2, visited.count())
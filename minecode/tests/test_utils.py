@@ -8,6 +8,8 @@
 #
 
 
+import io
+import json
 import os
 
 from django.test import TestCase as DjangoTestCase
@@ -75,3 +77,55 @@ class UtilsTest(JsonBasedTesting, DjangoTestCase):
             [valid_uuid, True],
         ]:
             self.assertEqual(expected_result, utils.validate_uuid(uuid))
+
+    def test_JSONStream_with_small_chunks(self):
+        data = {
+            "project": {"extra_data": {"uuid": "é-1", "size": 12345}},
+            "results": {
+                "headers": [{"notice": 'a "quoted" [text] {with} \\ escapes'}],
+                "files": [{"path": "a", "size": 1.5e3}, {"path": "b/ü", "size": None}],
+            },
+            "summary": {"declared_license_expression": "mit", "other": []},
+        }
+        for text in [json.dumps(data), json.dumps(data, indent=2)]:
+            for chunk_size in [1, 3, 7, 1024]:
+                stream = utils.JSONStream(io.BytesIO(text.encode("utf-8")), chunk_size=chunk_size)
+                results = {}
+                for key in stream.iter_object_keys():
+                    if key == "project":
+                        results[key] = stream.decode_value()
+                    elif key == "results":
+                        for results_key in stream.iter_object_keys():
+                            if results_key == "files":
+                                results[key] = list(stream.iter_array())
+                            else:
+                                stream.skip_value()
+                    else:
+                        output = io.StringIO()
+                        stream.skip_value(output=output)
+                        results[key] = json.loads(output.getvalue())
+                expected = {
+                    "project": data["project"],
+                    "results": data["results"]["files"],
+                    "summary": data["summary"],
+                }
+                self.assertEqual(expected, results)
+
+    def test_JSONStream_with_numbers_split_across_chunks(self):
+        for text in ["[2.5]", '{"size": 1.5}', "[12.75, 3]", '{"a": [1e3, -0.25], "b": true}']:
+            expected = json.loads(text)
+            for chunk_size in [1, 2, 3, 4, 5]:
+                stream = utils.JSONStream(io.BytesIO(text.encode("utf-8")), chunk_size=chunk_size)
+                if text.startswith("["):
+                    results = list(stream.iter_array())
+                else:
+                    results = {key: stream.decode_value() for key in stream.iter_object_keys()}
+                self.assertEqual(expected, results, f"chunk_size={chunk_size}")
+
+    def test_iter_json_array(self):
+        scan_location = self.get_test_loc("scancodeio/get_scan_data.json")
+        with open(scan_location) as f:
+            expected = json.load(f)["files"]
+        results = utils.iter_json_array(scan_location, path=["files"])
+        self.assertEqual(expected, list(results))
+        self.assertEqual([], list(utils.iter_json_array(scan_location, path=["missing"])))
@@ -7,10 +7,13 @@
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
 
+import codecs
 import copy
 import hashlib
+import json
 import logging
 import os
+import re
 import tempfile
 import uuid
 from itertools import zip_longest
@@ -421,3 +424,223 @@ def cycle_from_index(lst, x):
     """Return list rotated so it starts from index x."""
     x = x % len(lst)  # handle cases where x is out of bounds
     return lst[x:] + lst[:x]
+
+
+# Number of bytes or characters read at once by a JSONStream
+JSON_STREAM_CHUNK_SIZE = 1024 * 1024
+
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# The characters of number, true, false and null tokens
+JSON_SCALAR_TOKEN = re.compile(r"[0-9a-zA-Z.+\-]*")
+
+# The first characters of values that are decoded until they are complete
+JSON_CONTAINER_STARTS = ('"', "{", "[")
+
+
+class JSONStream:
+    """
+    Read a JSON document incrementally from a `fileobj` file-like object of
+    text or UTF-8 bytes, such as an open file or an HTTP request, without
+    loading the whole document in memory.
+
+    Only the values that are decoded are loaded in memory: the items of large
+    arrays are decoded one at a time with `iter_array()` and other large values
+    can be skipped or copied to another file with `skip_value()`.
+    """
+
+    def __init__(self, fileobj, chunk_size=JSON_STREAM_CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        # Number of reads, used to check if the buffer start was dropped
+        self.read_count = 0
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def read(self, size=None):
+        """
+        Read up to `size` more bytes or characters in the buffer, dropping the
+        text before the current position. Return False at the end of file.
+        """
+        if self.eof:
+            return False
+        chunk = self.fileobj.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.read_count += 1
+        if isinstance(chunk, bytes):
+            chunk = self.text_decoder.decode(chunk, final=self.eof)
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        return not self.eof
+
+    def read_more(self):
+        """
+        Read more text in the buffer, growing the buffer size to read a value
+        that spans many chunks in linear time. Return False at the end of file.
+        """
+        return self.read(max(self.chunk_size, len(self.buffer)))
+
+    def peek(self):
+        """
+        Return the next non-whitespace character or an empty string at the end
+        of file.
+        """
+        while True:
+            self.position = JSON_WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read():
+                return ""
+
+    def expect(self, char):
+        """Consume the next non-whitespace `char` or raise a JSONDecodeError."""
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting {char!r}", self.buffer, self.position)
+        self.position += 1
+
+    def decode_value(self):
+        """Return the next decoded JSON value."""
+        char = self.peek()
+        if char and char not in JSON_CONTAINER_STARTS:
+            self.read_scalar()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.read_more():
+                    continue
+                raise
+            self.position = end
+            return value
+
+    def read_scalar(self):
+        """
+        Read until the number, true, false or null token at the current
+        position is followed by a delimiter in the buffer or the end of file
+        is reached. A number split across reads, such as "2." then "5", would
+        otherwise be decoded from its first part only.
+        """
+        while True:
+            end = JSON_SCALAR_TOKEN.match(self.buffer, self.position).end()
+            if end < len(self.buffer) or not self.read_more():
+                return
+
+    def copy_value(self, output=None):
+        """
+        Skip the next JSON value and write its text to the `output` file-like
+        object if provided.
+        """
+        self.peek()
+        start = self.position
+        read_count = self.read_count
+        value = self.decode_value()
+        if output is None:
+            return
+        if read_count == self.read_count:
+            output.write(self.buffer[start : self.position])
+        else:
+            # The buffer start was dropped while reading the value
+            json.dump(value, output)
+
+    def skip_value(self, output=None):
+        """
+        Skip the next JSON value, writing its text to the `output` file-like
+        object if provided. Objects and arrays are skipped one item at a time,
+        such that only one of their items is loaded in memory at once.
+        """
+        char = self.peek()
+        if char not in ("{", "["):
+            self.copy_value(output)
+            return
+
+        is_object = char == "{"
+        self.position += 1
+        if output is not None:
+            output.write(char)
+        index = 0
+        while True:
+            char = self.peek()
+            if char in ("}", "]"):
+                break
+            if index:
+                self.expect(",")
+                if output is not None:
+                    output.write(",")
+            if is_object:
+                self.copy_value(output)
+                self.expect(":")
+                if output is not None:
+                    output.write(":")
+                self.skip_value(output)
+            else:
+                self.copy_value(output)
+            index += 1
+
+        self.expect("}" if is_object else "]")
+        if output is not None:
+            output.write("}" if is_object else "]")
+
+    def iter_object_keys(self):
+        """
+        Yield the keys of the JSON object at the current position. The value of
+        each key must be consumed with `decode_value()`, `skip_value()` or
+        another method before the next key is yielded.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.position += 1
+                continue
+            self.expect("}")
+            return
+
+    def iter_array(self):
+        """Yield the decoded items of the JSON array at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield self.decode_value()
+            if self.peek() == ",":
+                self.position += 1
+                continue
+            self.expect("]")
+            return
+
+    def seek(self, path):
+        """
+        Move to the value found following the `path` sequence of object keys
+        from the current position. Return True if this value is found.
+        """
+        for key in path:
+            if self.peek() != "{":
+                return False
+            for object_key in self.iter_object_keys():
+                if object_key == key:
+                    break
+                self.skip_value()
+            else:
+                return False
+        return True
+
+
+def iter_json_array(location, path=()):
+    """
+    Yield the decoded items of the JSON array found following the `path`
+    sequence of object keys in the JSON file at `location`, one at a time.
+    """
+    with open(location) as f:
+        stream = JSONStream(f)
+        if stream.seek(path) and stream.peek() == "[":
+            yield from stream.iter_array()
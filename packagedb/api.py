@@ -8,8 +8,13 @@
 #
 
 import logging
+import threading
+from collections import defaultdict
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from django.core.exceptions import ValidationError
+from django.db import connections
 from django.db.models import OuterRef
 from django.db.models import Q
 from django.db.models import Subquery
@@ -46,6 +51,8 @@ from minecode import collectors  # NOQA
 # UnusedImport here!
 # But importing the collectors module triggers routes registration
 from minecode import priority_router
+from minecode.model_utils import DEFAULT_PIPELINES
+from minecode.model_utils import add_packages_to_scan_queue
 from minecode.models import PriorityResourceURI
 from minecode.route import NoRouteAvailable
 from packagedb.filters import PackageSearchFilter
@@ -57,6 +64,7 @@ from packagedb.models import PackageWatch
 from packagedb.models import Resource
 from packagedb.package_managers import VERSION_API_CLASSES_BY_PACKAGE_TYPE
 from packagedb.package_managers import get_api_package_name
+from packagedb.package_managers import get_cached_versions
 from packagedb.package_managers import get_version_fetcher
 from packagedb.sbom import to_cyclonedx
 from packagedb.serializers import CollectPackageSerializer
@@ -76,8 +84,8 @@ from packagedb.serializers import PurlValidateSerializer
 from packagedb.serializers import ResourceAPISerializer
 from packagedb.serializers import UpdatePackagesSerializer
 from packagedb.serializers import is_supported_addon_pipeline
+from packagedb.tasks import enqueue_find_source_packages
 from packagedb.throttling import StaffUserRateThrottle
-from purl2vcs.find_source_repo import get_source_package_and_add_to_package_set
 
 logger = logging.getLogger(__name__)
 
@@ -848,8 +856,7 @@ class CollectViewSet(viewsets.ViewSet):
                     }
                 return Response(message, status=status.HTTP_400_BAD_REQUEST)
 
-        for package in packages:
-            get_source_package_and_add_to_package_set(package)
+        enqueue_find_source_packages(packages)
 
         serializer = PackageAPISerializer(packages, many=True, context={"request": request})
         return Response(serializer.data)
@@ -949,14 +956,10 @@ class CollectViewSet(viewsets.ViewSet):
           or package_manager.
         - `unsupported_vers`: A list of vers range that are not supported by the univers or
           package_manager.
+        - `resolution_duration`: The number of seconds spent resolving the versions of the
+          version-less package urls.
         """
 
-        def _reindex_package(package, reindexed_packages, **kwargs):
-            if package in reindexed_packages:
-                return
-            package.reindex(**kwargs)
-            reindexed_packages.append(package)
-
         serializer = self.serializer_class(data=request.data)
 
         if not serializer.is_valid():
@@ -971,7 +974,6 @@ class CollectViewSet(viewsets.ViewSet):
         unqueued_packages = []
 
         nonexistent_packages = []
-        reindexed_packages = []
         requeued_packages = []
 
         supported_ecosystems = [
@@ -990,34 +992,55 @@ class CollectViewSet(viewsets.ViewSet):
             "nuget",
         ]
 
+        resolution_start = time.perf_counter()
         unique_packages, unsupported_packages, unsupported_vers = get_resolved_packages(
             packages, supported_ecosystems
         )
+        resolution_duration = time.perf_counter() - resolution_start
 
         if reindex:
+            packages_by_purl = get_packages_by_purl(
+                [package["purl"] for package in unique_packages]
+            )
+            # List of (Package, addon_pipelines) to reindex
+            packages_to_reindex = []
             for package in unique_packages:
-                purl = package["purl"]
-                kwargs = dict()
-                if addon_pipelines := package.get("addon_pipelines"):
-                    kwargs["addon_pipelines"] = [
-                        pipe for pipe in addon_pipelines if is_supported_addon_pipeline(pipe)
-                    ]
-                lookups = purl_to_lookups(purl)
-                packages = Package.objects.filter(**lookups)
-                if packages.count() > 0:
-                    for package in packages:
-                        get_source_package_and_add_to_package_set(package)
-                        _reindex_package(package, reindexed_packages, **kwargs)
-                        if reindex_set:
-                            for package_set in package.package_sets.all():
-                                for p in package_set.packages.all():
-                                    _reindex_package(p, reindexed_packages, **kwargs)
-                else:
+                addon_pipelines = [
+                    pipe
+                    for pipe in package.get("addon_pipelines") or []
+                    if is_supported_addon_pipeline(pipe)
+                ]
+                existing_packages = packages_by_purl[package["purl"]]
+                if not existing_packages:
                     nonexistent_packages.append(package)
-            requeued_packages.extend([p.package_url for p in reindexed_packages])
+                for existing_package in existing_packages:
+                    packages_to_reindex.append((existing_package, addon_pipelines))
+
+            enqueue_find_source_packages([package for package, _ in packages_to_reindex])
+
+            package_set_members_by_package_id = {}
+            if reindex_set:
+                package_set_members_by_package_id = get_package_set_members_by_package_id(
+                    [package.id for package, _ in packages_to_reindex]
+                )
+
+            # Mapping of {Package id: (Package, pipelines)} of the Packages to
+            # reindex, using the addon pipelines of the first request.
+            reindexed_packages_by_id = {}
+            for package, addon_pipelines in packages_to_reindex:
+                pipelines = DEFAULT_PIPELINES + tuple(addon_pipelines)
+                reindexed_packages_by_id.setdefault(package.id, (package, pipelines))
+                for member in package_set_members_by_package_id.get(package.id, []):
+                    reindexed_packages_by_id.setdefault(member.id, (member, pipelines))
+
+            reindexed_packages = list(reindexed_packages_by_id.values())
+            add_packages_to_scan_queue(reindexed_packages, priority=100, reindex_uri=True)
+            requeued_packages.extend([p.package_url for p, _ in reindexed_packages])
 
         if not reindex or nonexistent_packages:
             interesting_packages = nonexistent_packages if nonexistent_packages else unique_packages
+            # List of (purl, extra fields) to add to the queue
+            purls_and_extra_fields = []
             for package in interesting_packages:
                 purl = package["purl"]
                 is_routable_purl = priority_router.is_routable(purl)
@@ -1034,11 +1057,16 @@ class CollectViewSet(viewsets.ViewSet):
                         ]
                     if priority := package.get("priority"):
                         extra_fields["priority"] = priority
-                    priority_resource_uri = PriorityResourceURI.objects.insert(purl, **extra_fields)
-                    if priority_resource_uri:
-                        queued_packages.append(purl)
-                    else:
-                        unqueued_packages.append(purl)
+                    purls_and_extra_fields.append((purl, extra_fields))
+
+            priority_resource_uris = PriorityResourceURI.objects.insert_many(purls_and_extra_fields)
+            for (purl, _), priority_resource_uri in zip(
+                purls_and_extra_fields, priority_resource_uris
+            ):
+                if priority_resource_uri:
+                    queued_packages.append(purl)
+                else:
+                    unqueued_packages.append(purl)
 
         response_data = {
             "queued_packages_count": len(queued_packages),
@@ -1051,6 +1079,7 @@ class CollectViewSet(viewsets.ViewSet):
             "unsupported_packages": unsupported_packages,
             "unsupported_vers_count": len(unsupported_vers),
             "unsupported_vers": unsupported_vers,
+            "resolution_duration": round(resolution_duration, 3),
         }
 
         serializer = IndexPackagesResponseSerializer(response_data, context={"request": request})
@@ -1234,16 +1263,97 @@ class PurlValidateViewSet(viewsets.ViewSet):
         return Response(serializer.data)
 
 
+def get_packages_by_purl(purls, batch_size=1000):
+    """
+    Return a mapping of {purl: [Package, ...]} of the Packages matching each
+    purl string of a `purls` list, fetched with one query for each
+    `batch_size` purls.
+    """
+    packages_by_purl = {purl: [] for purl in purls}
+    lookups_by_purl = {purl: purl_to_lookups(purl) for purl in packages_by_purl}
+    purls = [purl for purl, lookups in lookups_by_purl.items() if lookups]
+
+    for start in range(0, len(purls), batch_size):
+        purls_by_name = defaultdict(list)
+        query = Q()
+        for purl in purls[start : start + batch_size]:
+            lookups = lookups_by_purl[purl]
+            purls_by_name[lookups["name"]].append(purl)
+            query |= Q(**lookups)
+
+        for package in Package.objects.filter(query):
+            for purl in purls_by_name[package.name]:
+                lookups = lookups_by_purl[purl]
+                if all(getattr(package, field) == value for field, value in lookups.items()):
+                    packages_by_purl[purl].append(package)
+
+    return packages_by_purl
+
+
+def get_package_set_members_by_package_id(package_ids):
+    """
+    Return a mapping of {Package id: [Package, ...]} of the Packages of all
+    the PackageSets of each Package of a `package_ids` list.
+    """
+    through_model = Package.package_sets.through
+    package_set_ids_by_package_id = defaultdict(list)
+    for package_id, package_set_id in through_model.objects.filter(
+        package_id__in=package_ids
+    ).values_list("package_id", "packageset_id"):
+        package_set_ids_by_package_id[package_id].append(package_set_id)
+
+    package_set_ids = {
+        package_set_id
+        for package_set_ids in package_set_ids_by_package_id.values()
+        for package_set_id in package_set_ids
+    }
+    member_ids_by_package_set_id = defaultdict(list)
+    for package_set_id, member_id in (
+        through_model.objects.filter(packageset_id__in=package_set_ids)
+        .order_by("packageset_id", "package_id")
+        .values_list("packageset_id", "package_id")
+    ):
+        member_ids_by_package_set_id[package_set_id].append(member_id)
+
+    member_ids = {
+        member_id
+        for member_ids in member_ids_by_package_set_id.values()
+        for member_id in member_ids
+    }
+    members_by_id = Package.objects.in_bulk(member_ids)
+
+    return {
+        package_id: [
+            members_by_id[member_id]
+            for package_set_id in sorted(package_set_ids)
+            for member_id in member_ids_by_package_set_id[package_set_id]
+        ]
+        for package_id, package_set_ids in package_set_ids_by_package_id.items()
+    }
+
+
+# Maximum number of versionless purls resolved concurrently for a request
+VERSIONS_RESOLUTION_MAX_WORKERS = 16
+
+# Maximum number of versionless purls of the same type, that are fetched from
+# the same package registry, resolved concurrently for a request
+VERSIONS_RESOLUTION_MAX_WORKERS_BY_TYPE = 4
+
+
 def get_resolved_packages(packages, supported_ecosystems):
     """
     Take a list of dict containing purl or version-less purl along with vers
     and return a list of package dicts containing resolved purls, a list of
     unsupported purls, and a list of unsupported vers.
+
+    The versions of the version-less purls are resolved concurrently.
     """
     resolved_packages_by_purl = {}
     unsupported_purls = set()
     unsupported_vers = set()
 
+    # List of (package, parsed_purl, vers) to process in order
+    packages_to_resolve = []
     for package in packages or []:
         purl = package.get("purl")
         vers = package.get("vers")
@@ -1261,23 +1371,28 @@ def get_resolved_packages(packages, supported_ecosystems):
             unsupported_purls.add(purl)
             continue
 
+        packages_to_resolve.append((package, parsed_purl, vers))
+
+    versionless_purls_and_vers = [
+        (parsed_purl, vers)
+        for _, parsed_purl, vers in packages_to_resolve
+        if not parsed_purl.version
+    ]
+    resolved_purls_by_purl_and_vers = resolve_many_versions(versionless_purls_and_vers)
+
+    for package, parsed_purl, vers in packages_to_resolve:
         if parsed_purl.version:
             # We prioritize Package requests that have explicit versions
             package["priority"] = 100
-            resolved_packages_by_purl[purl] = package
+            resolved_packages_by_purl[package["purl"]] = package
             continue
 
+        resolved_purls = resolved_purls_by_purl_and_vers.get((str(parsed_purl), vers))
         # Versionless PURL without any vers-range should give all versions.
-        if not vers and not parsed_purl.version:
-            if resolved_purls := resolve_all_versions(parsed_purl):
-                for res_purl in resolved_purls:
-                    resolved_packages_by_purl[res_purl] = {"purl": res_purl}
-            continue
-
-        if resolved_purls := resolve_versions(parsed_purl, vers):
+        if resolved_purls:
             for res_purl in resolved_purls:
                 resolved_packages_by_purl[res_purl] = {"purl": res_purl}
-        else:
+        elif vers:
             unsupported_vers.add(vers)
 
     unique_resolved_packages = resolved_packages_by_purl.values()
@@ -1289,6 +1404,47 @@ def get_resolved_packages(packages, supported_ecosystems):
     )
 
 
+def resolve_many_versions(versionless_purls_and_vers):
+    """
+    Return a mapping of the resolved purls of each (versionless purl string,
+    vers) from a list of (versionless PackageURL, vers) tuples.
+
+    The purls are resolved concurrently with up to
+    VERSIONS_RESOLUTION_MAX_WORKERS threads and up to
+    VERSIONS_RESOLUTION_MAX_WORKERS_BY_TYPE threads for the purls of a type.
+    A purl that fails to be resolved is resolved to None.
+    """
+    parsed_purl_by_purl_and_vers = {
+        (str(parsed_purl), vers): parsed_purl for parsed_purl, vers in versionless_purls_and_vers
+    }
+    if not parsed_purl_by_purl_and_vers:
+        return {}
+
+    semaphore_by_type = {
+        parsed_purl.type: threading.BoundedSemaphore(VERSIONS_RESOLUTION_MAX_WORKERS_BY_TYPE)
+        for parsed_purl in parsed_purl_by_purl_and_vers.values()
+    }
+
+    def resolve(purl_and_vers):
+        _, vers = purl_and_vers
+        parsed_purl = parsed_purl_by_purl_and_vers[purl_and_vers]
+        try:
+            with semaphore_by_type[parsed_purl.type]:
+                if vers:
+                    return resolve_versions(parsed_purl, vers)
+                return resolve_all_versions(parsed_purl)
+        except Exception:
+            logger.error(f"Failed to resolve versions of {parsed_purl} {vers or ''}", exc_info=True)
+        finally:
+            # Close the database connections opened in this thread
+            connections.close_all()
+
+    max_workers = min(VERSIONS_RESOLUTION_MAX_WORKERS, len(parsed_purl_by_purl_and_vers))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resolved_purls = executor.map(resolve, parsed_purl_by_purl_and_vers)
+        return dict(zip(parsed_purl_by_purl_and_vers, resolved_purls))
+
+
 def resolve_all_versions(parsed_purl):
     """Take versionless and return a list of PURLs for all the released versions."""
     all_versions = get_all_versions(parsed_purl) or []
@@ -1356,8 +1512,11 @@ def get_all_versions_plain(purl: PackageURL):
     if not package_name or not versionAPI:
         return
 
-    all_versions = versionAPI().fetch(package_name) or []
-    return [version.value for version in all_versions]
+    def fetch_versions():
+        all_versions = versionAPI().fetch(package_name) or []
+        return [version.value for version in all_versions]
+
+    return get_cached_versions(purl, fetch_versions)
 
 
 def get_all_versions(purl):
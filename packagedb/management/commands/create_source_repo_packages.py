@@ -7,10 +7,16 @@
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
 
+import json
 import logging
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import batched
 
 import openpyxl
+from django.db import connections
+from packageurl import PackageURL
 
 from minecode.management.commands import VerboseCommand
 from minecode.model_utils import add_package_to_scan_queue
@@ -21,6 +27,9 @@ from purl2vcs.find_source_repo import get_package_object_from_purl
 
 TRACE = False
 
+# Number of packages processed between two saves of the progress checkpoint
+CHECKPOINT_BATCH_SIZE = 1000
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(stream=sys.stdout)
 logger.setLevel(logging.INFO)
@@ -56,50 +65,160 @@ def get_rows(workbook, sheet_name):
     return rows
 
 
+def get_row_groups(rows):
+    """
+    Return a list of lists of rows, grouping the rows of the versions of the
+    same package in the order of ``rows``.
+    """
+    rows_by_package_name = {}
+    for row in rows:
+        try:
+            purl = PackageURL.from_string(row["purl"])
+            package_name = (purl.type, purl.namespace, purl.name)
+        except ValueError:
+            package_name = row["purl"]
+        rows_by_package_name.setdefault(package_name, []).append(row)
+    return list(rows_by_package_name.values())
+
+
+def create_source_repo_packages(rows):
+    """
+    Create the source repo package of each row of a ``rows`` list and add it
+    to the package set of the package of this row. Return True if processed
+    or False on errors, which are logged.
+    """
+    try:
+        for row in rows:
+            create_source_repo_package(row)
+        return True
+    except Exception:
+        logger.error(f"Error creating source repo packages for {rows[0]['purl']}", exc_info=True)
+        return False
+    finally:
+        # Close the database connections opened in this thread
+        connections.close_all()
+
+
+def create_source_repo_package(row):
+    """
+    Create the source repo package of a ``row`` and add it to the package set
+    of the package of this row.
+    """
+    # Look up the package the row is for by using the purl to query the db.
+    purl = row["purl"]
+    print(f"Processing packages for: {purl}")
+    package = get_package_object_from_purl(package_url=purl)
+    if not package:
+        print(f"\t{purl} does not exist in this database. Continuing.")
+        return
+
+    source_package, _created = Package.objects.get_or_create(
+        type=row["source_type"],
+        namespace=row["source_namespace"],
+        name=row["source_name"],
+        version=row["source_version"],
+        download_url=row["source_download_url"],
+        package_content=PackageContentType.SOURCE_REPO,
+    )
+
+    if _created:
+        add_package_to_scan_queue(source_package)
+
+    package_set_ids = set(package.package_sets.all().values_list("uuid", flat=True))
+    source_package_set_ids = set(source_package.package_sets.all().values_list("uuid", flat=True))
+
+    # If the package exists and already in the set then there is nothing left to do
+    if package_set_ids.intersection(source_package_set_ids):
+        return
+
+    add_source_package_to_package_set(
+        source_package=source_package,
+        package=package,
+    )
+
+
+def load_processed_groups_count(checkpoint_location):
+    """
+    Return a tuple of (number of row groups already processed, list of the
+    indexes of the row groups that failed) saved in the ``checkpoint_location``
+    JSON file.
+    """
+    if not checkpoint_location or not os.path.exists(checkpoint_location):
+        return 0, []
+    with open(checkpoint_location) as f:
+        checkpoint = json.load(f)
+    return checkpoint["processed_groups"], checkpoint.get("failed_groups", [])
+
+
+def save_processed_groups_count(checkpoint_location, processed_groups, failed_groups=()):
+    """
+    Save the ``processed_groups`` number of row groups already processed and
+    the ``failed_groups`` list of the indexes of the row groups that failed in
+    the ``checkpoint_location`` JSON file.
+    """
+    if not checkpoint_location:
+        return
+    checkpoint = {"processed_groups": processed_groups, "failed_groups": list(failed_groups)}
+    temp_location = f"{checkpoint_location}.tmp"
+    with open(temp_location, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_location, checkpoint_location)
+
+
+def process_row_groups(executor, row_groups, group_indexes):
+    """
+    Create the source repo packages of the ``row_groups`` at ``group_indexes``
+    with ``executor``. Return a list of the indexes of the row groups that
+    failed.
+    """
+    groups = [row_groups[index] for index in group_indexes]
+    processed = executor.map(create_source_repo_packages, groups)
+    return [index for index, is_processed in zip(group_indexes, processed) if not is_processed]
+
+
 class Command(VerboseCommand):
     help = "Create source archive packages for related"
 
     def add_arguments(self, parser):
         parser.add_argument("--input", type=str)
+        parser.add_argument(
+            "--max-workers",
+            type=int,
+            default=1,
+            help=(
+                "Number of packages processed concurrently. The rows of the "
+                "versions of a package are processed together."
+            ),
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            help="Location of a JSON file to save the progress to and to resume from.",
+        )
 
     def handle(self, *args, **options):
         input = options.get("input")
         if not input:
             return
+        checkpoint_location = options.get("checkpoint")
 
         # Collect resource info
         wb = openpyxl.load_workbook(input, read_only=True)
         rows = get_rows(wb, "PACKAGES WITH SOURCES")
 
-        for row in rows:
-            # Look up the package the row is for by using the purl to query the db.
-            purl = row["purl"]
-            print(f"Processing packages for: {purl}")
-            package = get_package_object_from_purl(package_url=purl)
-            if not package:
-                print(f"\t{purl} does not exist in this database. Continuing.")
-                continue
-
-            source_package, _created = Package.objects.get_or_create(
-                type=row["source_type"],
-                namespace=row["source_namespace"],
-                name=row["source_name"],
-                version=row["source_version"],
-                download_url=row["source_download_url"],
-                package_content=PackageContentType.SOURCE_REPO,
-            )
-
-            if _created:
-                add_package_to_scan_queue(source_package)
-
-            package_set_ids = set(package.package_sets.all().values("uuid"))
-            source_package_set_ids = set(source_package.package_sets.all().values("uuid"))
-
-            # If the package exists and already in the set then there is nothing left to do
-            if package_set_ids.intersection(source_package_set_ids):
-                continue
-
-            add_source_package_to_package_set(
-                source_package=source_package,
-                package=package,
-            )
+        row_groups = get_row_groups(rows)
+        processed_groups, failed_groups = load_processed_groups_count(checkpoint_location)
+
+        with ThreadPoolExecutor(max_workers=options["max_workers"]) as executor:
+            if failed_groups:
+                logger.info(f"Retrying {len(failed_groups)} failed packages")
+                failed_groups = process_row_groups(executor, row_groups, failed_groups)
+                save_processed_groups_count(checkpoint_location, processed_groups, failed_groups)
+
+            if processed_groups:
+                logger.info(f"Resuming after {processed_groups} packages")
+            group_indexes = range(processed_groups, len(row_groups))
+            for batch in batched(group_indexes, CHECKPOINT_BATCH_SIZE):
+                failed_groups.extend(process_row_groups(executor, row_groups, batch))
+                processed_groups += len(batch)
+                save_processed_groups_count(checkpoint_location, processed_groups, failed_groups)
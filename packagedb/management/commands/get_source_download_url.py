@@ -11,6 +11,7 @@ import logging
 import sys
 
 from minecode.management.commands import VerboseCommand
+from purl2vcs.find_source_repo import SOURCE_REPO_MAX_WORKERS
 from purl2vcs.find_source_repo import get_source_package_for_all_packages
 
 TRACE = False
@@ -23,6 +24,26 @@ logger.setLevel(logging.INFO)
 class Command(VerboseCommand):
     help = "Create source repo packages for Package object and add it to package sets"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-workers",
+            type=int,
+            default=1,
+            help=(
+                "Number of packages processed concurrently, such as "
+                f"{SOURCE_REPO_MAX_WORKERS}. All the versions of a package are "
+                "processed together."
+            ),
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            help="Location of a JSON file to save the progress to and to resume from.",
+        )
+
     def handle(self, *args, **options):
         logger.info("Finding source repo for packages")
-        get_source_package_for_all_packages()
+        get_source_package_for_all_packages(
+            max_workers=options["max_workers"],
+            checkpoint_location=options.get("checkpoint"),
+        )
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.6 on 2026-10-17 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("packagedb", "0094_package_packagedb_p_package_d39839_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="resource",
+            name="snippets_count",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Number of distinct snippet fingerprints indexed for this Resource. Empty when it has not been computed.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="resource",
+            name="stemmed_snippets_count",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Number of distinct stemmed snippet fingerprints indexed for this Resource. Empty when it has not been computed.",
+                null=True,
+            ),
+        ),
+    ]
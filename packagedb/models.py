@@ -1203,6 +1203,24 @@ class Resource(ExtraDataFieldMixin, HashFieldsMixin, ScanFieldsModelMixin, Abstr
         help_text=_("git SHA1 checksum hex-encoded"),
     )
 
+    snippets_count = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text=_(
+            "Number of distinct snippet fingerprints indexed for this Resource. "
+            "Empty when it has not been computed."
+        ),
+    )
+
+    stemmed_snippets_count = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text=_(
+            "Number of distinct stemmed snippet fingerprints indexed for this "
+            "Resource. Empty when it has not been computed."
+        ),
+    )
+
     class Meta:
         unique_together = (("package", "path"),)
         ordering = ("id",)
@@ -8,13 +8,19 @@
 #
 
 import dataclasses
+import hashlib
 import logging
+import threading
 import traceback
 import xml.etree.ElementTree as ET
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 from urllib.parse import urlparse
 
+from django.conf import settings
+from django.core.cache import caches
 from django.utils.dateparse import parse_datetime
 
 import requests
@@ -423,6 +429,10 @@ class HexVersionAPI(VersionAPI):
                 )
 
 
+# Maximum number of concurrent requests to fetch Go module versions info
+GOPROXY_MAX_WORKERS = 8
+
+
 class GoproxyVersionAPI(VersionAPI):
     """Fetch versions of Go "golang" packages from the Go proxy API"""
 
@@ -533,8 +543,11 @@ class GoproxyVersionAPI(VersionAPI):
             logger.error(f"Error while fetching versions for {pkg!r} from goproxy")
             return
         self.module_name_by_package_name[pkg] = trimmed_pkg
-        for version_info in response.split("\n"):
-            version = self.fetch_version_info(version_info, escaped_pkg)
+        # Fetch the release dates of the versions concurrently
+        fetch_version_info = partial(self.fetch_version_info, escaped_pkg=escaped_pkg)
+        with ThreadPoolExecutor(max_workers=GOPROXY_MAX_WORKERS) as executor:
+            versions = list(executor.map(fetch_version_info, response.split("\n")))
+        for version in versions:
             if version:
                 yield version
 
@@ -591,3 +604,53 @@ def get_version_fetcher(package_url):
     else:
         versions_fetcher: VersionAPI = VERSION_API_CLASSES_BY_PACKAGE_TYPE[package_url.type]
     return versions_fetcher
+
+
+# Locks of the package versions being fetched in this process, by cache key
+versions_fetch_lock_by_cache_key = {}
+versions_fetch_locks_lock = threading.Lock()
+
+
+def get_versions_cache_key(purl):
+    """Return the cache key of the versions of the `purl` package."""
+    versionless_purl = PackageURL(type=purl.type, namespace=purl.namespace, name=purl.name)
+    purl_hash = hashlib.sha1(str(versionless_purl).encode("utf-8")).hexdigest()
+    return f"packagedb:versions:{purl_hash}"
+
+
+def get_cached_versions(purl, fetch_versions):
+    """
+    Return a list of the version strings of the `purl` package from the cache
+    or from the `fetch_versions` callable otherwise. Fetched versions are
+    cached for PACKAGEDB_VERSIONS_CACHE_TIMEOUT seconds in the cache named by
+    the PACKAGEDB_VERSIONS_CACHE setting.
+
+    Concurrent calls for the same package in this process wait for a single
+    call to `fetch_versions`.
+    """
+    cache_timeout = settings.PACKAGEDB_VERSIONS_CACHE_TIMEOUT
+    if not cache_timeout:
+        return fetch_versions()
+
+    cache = caches[settings.PACKAGEDB_VERSIONS_CACHE]
+    cache_key = get_versions_cache_key(purl)
+    versions = cache.get(cache_key)
+    if versions is not None:
+        return versions
+
+    with versions_fetch_locks_lock:
+        fetch_lock = versions_fetch_lock_by_cache_key.setdefault(cache_key, threading.Lock())
+
+    with fetch_lock:
+        versions = cache.get(cache_key)
+        if versions is None:
+            versions = fetch_versions()
+            # Do not cache an empty list that may come from a failed request
+            if versions:
+                cache.set(cache_key, versions, cache_timeout)
+
+    with versions_fetch_locks_lock:
+        if versions_fetch_lock_by_cache_key.get(cache_key) is fetch_lock:
+            del versions_fetch_lock_by_cache_key[cache_key]
+
+    return versions
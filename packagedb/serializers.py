@@ -13,6 +13,7 @@ from packageurl import PackageURL
 from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import BooleanField
 from rest_framework.serializers import CharField
+from rest_framework.serializers import FloatField
 from rest_framework.serializers import HyperlinkedIdentityField
 from rest_framework.serializers import HyperlinkedModelSerializer
 from rest_framework.serializers import HyperlinkedRelatedField
@@ -502,6 +503,10 @@ class IndexPackagesResponseSerializer(Serializer):
         child=CharField(),
         help_text="List of vers range that are not supported by the univers or package_manager.",
     )
+    resolution_duration = FloatField(
+        required=False,
+        help_text="Number of seconds spent resolving the versions of the version-less package urls.",
+    )
 
 
 class PurlValidateResponseSerializer(Serializer):
@@ -10,6 +10,7 @@
 import datetime
 
 import django_rq
+from django.conf import settings
 from fetchcode.package_versions import SUPPORTED_ECOSYSTEMS
 from univers.version_range import RANGE_CLASS_BY_SCHEMES
 from univers.versions import InvalidVersion
@@ -84,6 +85,53 @@ def get_and_index_new_purls(package_url):
         PriorityResourceURI.objects.insert(new_purl)
 
 
+def get_source_package_job_id(package_uuid):
+    """Return the RQ job id of the source repo discovery of a Package."""
+    return f"find-source-package-{package_uuid}"
+
+
+@django_rq.job("default")
+def find_source_package(package_uuid):
+    """
+    Find the source repository of the Package with `package_uuid` and add
+    its source repo package to the Package set of this Package.
+    """
+    from packagedb.models import Package
+    from purl2vcs.find_source_repo import get_source_package_and_add_to_package_set
+
+    package = Package.objects.get_or_none(uuid=package_uuid)
+    if not package:
+        return
+    get_source_package_and_add_to_package_set(package)
+
+
+def enqueue_find_source_packages(packages):
+    """
+    Enqueue a job finding the source repository of each Package of a
+    `packages` iterable, unless such a job is already queued or running.
+    Run the jobs synchronously if PURLDB_ASYNC is not enabled.
+    """
+    package_uuids = list(dict.fromkeys(str(package.uuid) for package in packages))
+
+    if not settings.PURLDB_ASYNC:
+        for package_uuid in package_uuids:
+            find_source_package(package_uuid=package_uuid)
+        return
+
+    queue = django_rq.get_queue("default")
+    for package_uuid in package_uuids:
+        job_id = get_source_package_job_id(package_uuid)
+        job = queue.fetch_job(job_id)
+        if job and not (job.is_finished or job.is_failed or job.is_canceled):
+            continue
+        queue.enqueue(
+            find_source_package,
+            package_uuid=package_uuid,
+            job_id=job_id,
+            job_timeout=1200,
+        )
+
+
 def is_supported_watch_ecosystem(watch):
     """
     Check if PackageWatch.type ecosystem is supported in
@@ -24,6 +24,7 @@ from minecode.models import PriorityResourceURI
 from minecode.models import ScannableURI
 from minecode.tests import FIXTURES_REGEN
 from minecode.utils_test import JsonBasedTesting
+from packagedb.api import get_resolved_packages
 from packagedb.models import Package
 from packagedb.models import DependentPackage
 from packagedb.models import PackageActivity
@@ -1151,6 +1152,35 @@ class CollectApiTestCase(JsonBasedTesting, TestCase):
         priority_resource_uris_count = PriorityResourceURI.objects.all().count()
         self.assertEqual(13, priority_resource_uris_count)
 
+    @mock.patch("packagedb.api.get_all_versions")
+    def test_get_resolved_packages(self, mock_get_all_versions):
+        def get_all_versions(purl):
+            if purl.name == "failing":
+                raise Exception("registry error")
+            return [MavenVersion("1.0"), MavenVersion("2.0")]
+
+        mock_get_all_versions.side_effect = get_all_versions
+        packages = [
+            {"purl": "pkg:maven/org.foo/bar", "vers": "vers:maven/>=2.0"},
+            {"purl": "pkg:maven/org.foo/failing", "vers": "vers:maven/>=2.0"},
+            {"purl": "pkg:maven/org.foo/failing"},
+            {"purl": "pkg:maven/org.foo/bar@1.0"},
+            {"purl": "pkg:npm/baz"},
+            {"purl": "pkg:unknown/baz"},
+        ]
+        resolved, unsupported_purls, unsupported_vers = get_resolved_packages(
+            packages, supported_ecosystems=["maven", "npm"]
+        )
+        expected = [
+            {"purl": "pkg:maven/org.foo/bar@2.0"},
+            {"purl": "pkg:maven/org.foo/bar@1.0", "priority": 100},
+            {"purl": "pkg:npm/baz@1.0"},
+            {"purl": "pkg:npm/baz@2.0"},
+        ]
+        self.assertEqual(expected, resolved)
+        self.assertEqual(["pkg:unknown/baz"], unsupported_purls)
+        self.assertEqual(["vers:maven/>=2.0"], unsupported_vers)
+
     def test_reindex_packages_bulk(self):
         self.assertEqual(2, ScannableURI.objects.all().count())
 
@@ -13,7 +13,9 @@ from datetime import datetime
 from functools import partial
 from unittest import mock
 
+from django.core.cache import caches
 from django.test import TestCase
+from django.test import override_settings
 
 from dateutil.tz import tzlocal
 from packageurl import PackageURL
@@ -27,6 +29,8 @@ from packagedb.package_managers import PackageVersion
 from packagedb.package_managers import PypiVersionAPI
 from packagedb.package_managers import RubyVersionAPI
 from packagedb.package_managers import VersionResponse
+from packagedb.package_managers import get_cached_versions
+from packagedb.package_managers import get_versions_cache_key
 from packagedb.package_managers import get_version_fetcher
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -297,25 +301,25 @@ class TestGoproxyVersionAPI(TestCase):
 
     @mock.patch("packagedb.package_managers.get_response")
     def test_fetch(self, mock_fetcher):
-        # we have many calls made to get_response
-        versions_list = "v0.0.1\nv0.0.5\nv0.0.3\nv0.0.4\nv0.0.2\n"
-        responses = [
-            versions_list,
-            {"Version": "v0.0.1", "Time": "2021-11-02T06:56:38Z"},
-            {"Version": "v0.0.2", "Time": "2021-11-13T21:36:37Z"},
-            {"Version": "v0.0.3", "Time": "2021-11-19T20:31:22Z"},
-            {"Version": "v0.0.4", "Time": "2021-12-01T19:02:44Z"},
-            {"Version": "v0.0.5", "Time": "2022-01-04T13:54:01Z"},
-        ]
-        mock_fetcher.side_effect = responses
+        # we have many calls made to get_response, made concurrently for .info
+        base_url = "https://proxy.golang.org/github.com/!ferret!d!b/!ferret!d!b/@v/"
+        responses = {
+            "list": "v0.0.1\nv0.0.5\nv0.0.3\nv0.0.4\nv0.0.2\n",
+            "v0.0.1.info": {"Version": "v0.0.1", "Time": "2021-11-02T06:56:38Z"},
+            "v0.0.2.info": {"Version": "v0.0.2", "Time": "2021-11-13T21:36:37Z"},
+            "v0.0.3.info": {"Version": "v0.0.3", "Time": "2021-11-19T20:31:22Z"},
+            "v0.0.4.info": {"Version": "v0.0.4", "Time": "2021-12-01T19:02:44Z"},
+            "v0.0.5.info": {"Version": "v0.0.5", "Time": "2022-01-04T13:54:01Z"},
+        }
+        mock_fetcher.side_effect = lambda url, content_type: responses[url[len(base_url) :]]
 
         results = list(GoproxyVersionAPI().fetch("github.com/FerretDB/FerretDB"))
         expected = [
             PackageVersion(value="v0.0.1", release_date=dt_local(2021, 11, 2, 6, 56, 38)),
-            PackageVersion(value="v0.0.5", release_date=dt_local(2021, 11, 13, 21, 36, 37)),
+            PackageVersion(value="v0.0.5", release_date=dt_local(2022, 1, 4, 13, 54, 1)),
             PackageVersion(value="v0.0.3", release_date=dt_local(2021, 11, 19, 20, 31, 22)),
             PackageVersion(value="v0.0.4", release_date=dt_local(2021, 12, 1, 19, 2, 44)),
-            PackageVersion(value="v0.0.2", release_date=dt_local(2022, 1, 4, 13, 54, 1)),
+            PackageVersion(value="v0.0.2", release_date=dt_local(2021, 11, 13, 21, 36, 37)),
         ]
         assert results == expected
 
@@ -362,3 +366,50 @@ class TestNugetVersionAPI(TestCase):
             mock_response.return_value = json.load(f)
         results = list(NugetVersionAPI().fetch("Exfat.Ntfs"))
         assert results == self.expected_versions
+
+
+class TestGetCachedVersions(TestCase):
+    def setUp(self):
+        caches["shared"].clear()
+
+    def test_get_cached_versions(self):
+        fetch_versions = mock.Mock(return_value=["1.0", "2.0"])
+        purl = PackageURL.from_string("pkg:npm/foo@1.0")
+        assert get_cached_versions(purl, fetch_versions) == ["1.0", "2.0"]
+        versionless_purl = PackageURL.from_string("pkg:npm/foo")
+        assert get_cached_versions(versionless_purl, fetch_versions) == ["1.0", "2.0"]
+        assert fetch_versions.call_count == 1
+
+        other_purl = PackageURL.from_string("pkg:npm/bar")
+        assert get_cached_versions(other_purl, fetch_versions) == ["1.0", "2.0"]
+        assert fetch_versions.call_count == 2
+
+    def test_get_cached_versions_does_not_cache_empty_versions(self):
+        fetch_versions = mock.Mock(return_value=[])
+        purl = PackageURL.from_string("pkg:npm/foo")
+        assert get_cached_versions(purl, fetch_versions) == []
+        assert get_cached_versions(purl, fetch_versions) == []
+        assert fetch_versions.call_count == 2
+
+    @override_settings(PACKAGEDB_VERSIONS_CACHE="database")
+    def test_get_cached_versions_uses_configured_cache(self):
+        database_cache = caches["database"]
+        database_cache.clear()
+        fetch_versions = mock.Mock(return_value=["1.0", "2.0"])
+        purl = PackageURL.from_string("pkg:npm/foo")
+        assert get_cached_versions(purl, fetch_versions) == ["1.0", "2.0"]
+
+        cache_key = get_versions_cache_key(purl)
+        assert database_cache.get(cache_key) == ["1.0", "2.0"]
+        assert caches["shared"].get(cache_key) is None
+
+        assert get_cached_versions(purl, fetch_versions) == ["1.0", "2.0"]
+        assert fetch_versions.call_count == 1
+
+    @override_settings(PACKAGEDB_VERSIONS_CACHE_TIMEOUT=0)
+    def test_get_cached_versions_without_cache(self):
+        fetch_versions = mock.Mock(return_value=["1.0"])
+        purl = PackageURL.from_string("pkg:npm/foo")
+        get_cached_versions(purl, fetch_versions)
+        get_cached_versions(purl, fetch_versions)
+        assert fetch_versions.call_count == 2
@@ -7,15 +7,19 @@
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
 
+from unittest.mock import MagicMock
 from unittest.mock import patch
 
 from django.test import TestCase
+from django.test import override_settings
 
 from fetchcode.package_versions import PackageVersion
 
 from minecode.models import PriorityResourceURI
 from packagedb.models import Package
 from packagedb.models import PackageWatch
+from packagedb.tasks import enqueue_find_source_packages
+from packagedb.tasks import get_source_package_job_id
 from packagedb.tasks import is_supported_watch_ecosystem
 from packagedb.tasks import watch_new_packages
 
@@ -98,3 +102,47 @@ class PackageWatchTasksTestCase(TestCase):
             "`unknown` ecosystem is not supported by fetchcode",
             self.package_watch3.watch_error,
         )
+
+
+class FindSourcePackageTasksTestCase(TestCase):
+    def setUp(self):
+        self.package1 = Package.objects.create(
+            type="maven",
+            namespace="org.test",
+            name="test-package",
+            version="1.0.0",
+            download_url="https://example.com/test-package-1.0.0.jar",
+        )
+        self.package2 = Package.objects.create(
+            type="maven",
+            namespace="org.test",
+            name="test-package",
+            version="2.0.0",
+            download_url="https://example.com/test-package-2.0.0.jar",
+        )
+
+    @patch("purl2vcs.find_source_repo.get_source_package_and_add_to_package_set")
+    def test_enqueue_find_source_packages_sync(self, mock_get_source_package):
+        enqueue_find_source_packages([self.package1, self.package2, self.package1])
+        self.assertEqual(
+            [self.package1, self.package2],
+            [call.args[0] for call in mock_get_source_package.call_args_list],
+        )
+
+    @override_settings(PURLDB_ASYNC=True)
+    @patch("packagedb.tasks.django_rq.get_queue")
+    def test_enqueue_find_source_packages_skips_pending_jobs(self, mock_get_queue):
+        pending_job = MagicMock(is_finished=False, is_failed=False, is_canceled=False)
+        pending_job_id = get_source_package_job_id(self.package1.uuid)
+        queue = mock_get_queue.return_value
+        queue.fetch_job.side_effect = lambda job_id: (
+            pending_job if job_id == pending_job_id else None
+        )
+
+        enqueue_find_source_packages([self.package1, self.package2])
+
+        self.assertEqual(1, queue.enqueue.call_count)
+        self.assertEqual(
+            get_source_package_job_id(self.package2.uuid),
+            queue.enqueue.call_args.kwargs["job_id"],
+        )
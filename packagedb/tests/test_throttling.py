@@ -10,6 +10,7 @@
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
@@ -20,6 +21,9 @@ from scanpipe.models import APIToken
 @patch("rest_framework.throttling.AnonRateThrottle.get_rate", lambda x: "10/day")
 class ThrottleApiTests(APITestCase):
     def setUp(self):
+        # the throttling history is kept in the default cache
+        cache.clear()
+
         # create a basic user
         self.user = User.objects.create_user(
             username="username",
@@ -0,0 +1,118 @@
+#
+# Copyright (c) nexB Inc. and others. All rights reserved.
+# purldb is a trademark of nexB Inc.
+# SPDX-License-Identifier: Apache-2.0
+# See http://www.apache.org/licenses/LICENSE-2.0 for the license text.
+# See https://github.com/aboutcode-org/purldb for support or download.
+# See https://aboutcode.org for more information about nexB OSS projects.
+#
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Returned by the caches for a key that is not cached
+MISSING = object()
+
+
+class LRUCache:
+    """
+    A thread-safe in-memory cache of at most `max_size` entries that evicts
+    the least recently used entry first. Each entry expires after the timeout
+    it was set with.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=MISSING):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SourceRepoCache:
+    """
+    Cache the values computed during source repo discovery in a bounded
+    in-memory LRUCache in front of the Django cache named by the
+    PACKAGEDB_SOURCE_REPO_CACHE setting. The Django cache is shared across
+    processes and kept across restarts when it uses the Redis or the database
+    backend.
+
+    Values are cached for PACKAGEDB_SOURCE_REPO_CACHE_TIMEOUT seconds. Empty
+    values, such as for an unreachable URL, are negative entries cached for
+    PACKAGEDB_SOURCE_REPO_NEGATIVE_CACHE_TIMEOUT seconds. A timeout of 0
+    disables caching these values.
+    """
+
+    def __init__(self, key_prefix, max_size):
+        self.key_prefix = key_prefix
+        self.memory_cache = LRUCache(max_size=max_size)
+
+    @property
+    def backend(self):
+        return caches[settings.PACKAGEDB_SOURCE_REPO_CACHE]
+
+    def make_key(self, key):
+        key_hash = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}:{key_hash}"
+
+    def get(self, key):
+        """Return the cached value of `key` or MISSING."""
+        cache_key = self.make_key(key)
+        value = self.memory_cache.get(cache_key)
+        if value is not MISSING:
+            return value
+
+        entry = self.backend.get(cache_key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return MISSING
+        self.memory_cache.set(cache_key, value, timeout=remaining)
+        return value
+
+    def set(self, key, value):
+        """Cache `value` for `key`, as a negative entry if `value` is empty."""
+        if value:
+            timeout = settings.PACKAGEDB_SOURCE_REPO_CACHE_TIMEOUT
+        else:
+            timeout = settings.PACKAGEDB_SOURCE_REPO_NEGATIVE_CACHE_TIMEOUT
+        if not timeout:
+            return
+
+        cache_key = self.make_key(key)
+        self.memory_cache.set(cache_key, value, timeout=timeout)
+        self.backend.set(cache_key, (time.time() + timeout, value), timeout)
+
+    def clear_memory(self):
+        self.memory_cache.clear()
@@ -7,12 +7,22 @@
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
 
+import json
 import logging
+import os
 import subprocess
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from collections.abc import Generator
 from urllib.parse import urlparse
 
 import requests
+from django.db import connections
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 from packageurl import PackageURL
 from packageurl.contrib.django.utils import purl_to_lookups
 from packageurl.contrib.purl2url import get_download_url, purl2url
@@ -21,10 +31,22 @@ from scancode.api import get_urls as get_urls_from_location
 from minecode.model_utils import add_package_to_scan_queue
 from minecode.collectors.maven import get_merged_ancestor_package_from_maven_package
 from packagedb.models import Package, PackageContentType, PackageSet
+from purl2vcs.cache import MISSING
+from purl2vcs.cache import SourceRepoCache
 
 logger = logging.getLogger(__name__)
 
 
+def batched(iterable, size):
+    """
+    Yield tuples of up to `size` items of `iterable`, like `itertools.batched`
+    available only on Python 3.12 and up.
+    """
+    iterator = iter(iterable)
+    while batch := tuple(islice(iterator, size)):
+        yield batch
+
+
 def get_urls_from_text(text):
     """
     Return the URLs found in a text
@@ -37,11 +59,55 @@ def get_urls_from_text(text):
         yield url["url"]
 
 
-# We keep track of unreachable URLs during a session
-UNREACHABLE_URLS = set()
+# Maximum number of URL probes and of repository tag listings kept in memory
+URL_PROBE_CACHE_MAX_SIZE = 10_000
+TAGS_AND_COMMITS_CACHE_MAX_SIZE = 10_000
+
+# Maximum number of packages processed concurrently when finding the source
+# repo of all the packages
+SOURCE_REPO_MAX_WORKERS = 16
+
+# Maximum number of concurrent HTTP requests and git ls-remote calls to a host
+SOURCE_REPO_MAX_WORKERS_BY_HOST = 4
+
+# Number of packages processed between two saves of the progress checkpoint
+SOURCE_REPO_CHECKPOINT_BATCH_SIZE = 1000
+
+# The final URL after redirects of a probed URL and the URLs found in its text
+UrlProbe = namedtuple("UrlProbe", ["url", "urls"])
+
+# UrlProbe or None for unreachable URLs, by URL
+url_probe_cache = SourceRepoCache(key_prefix="purl2vcs:url", max_size=URL_PROBE_CACHE_MAX_SIZE)
+
+# List of (tag, commit) tuples, by repository URL
+tags_and_commits_cache = SourceRepoCache(
+    key_prefix="purl2vcs:tags", max_size=TAGS_AND_COMMITS_CACHE_MAX_SIZE
+)
+
 
-# We keep cache of the requests.Response of each URL during a session
-RESPONSE_BY_URL_CACHE = {}
+# BoundedSemaphore limiting the concurrent network calls, by host
+semaphore_by_host = {}
+semaphore_by_host_lock = threading.Lock()
+
+
+def get_host_semaphore(url):
+    """
+    Return the BoundedSemaphore limiting the concurrent network calls to the
+    host of ``url``.
+    """
+    host = urlparse(url).netloc
+    with semaphore_by_host_lock:
+        return semaphore_by_host.setdefault(
+            host, threading.BoundedSemaphore(SOURCE_REPO_MAX_WORKERS_BY_HOST)
+        )
+
+
+def is_usable_url(url):
+    """
+    Return True if ``url`` is worth fetching.
+    """
+    # Some URLs take a lot of time to download and do not contain any data of use
+    return bool(url) and is_good_repo_url(url) and is_url_with_usable_content(url)
 
 
 def fetch_response(
@@ -49,41 +115,45 @@ def fetch_response(
     timeout=10,
 ):
     """
-    Return the request response for url or None, use a session cache
-    and ignore unreachable URLs
+    Return the request response for url or None if the URL is not usable or
+    not reachable.
     """
     try:
-        if not url:
-            return
-        # This URL takes a lot of time to download
-        # and it does not contain any data of use
-        if not is_good_repo_url(url):
+        if not is_usable_url(url):
             return
 
-        if not is_url_with_usable_content(url):
-            return
-
-        if url in UNREACHABLE_URLS:
-            return
-
-        response = RESPONSE_BY_URL_CACHE.get(url)
-        if response:
-            return response
-
-        response = requests.get(url=url, timeout=timeout)
+        with get_host_semaphore(url):
+            response = requests.get(url=url, timeout=timeout)
         if response.status_code != 200:
-            UNREACHABLE_URLS.add(url)
             return
-
-        RESPONSE_BY_URL_CACHE[url] = response
         return response
 
     except Exception as e:
         logger.error(f"Error getting {url}: {e}")
-        UNREACHABLE_URLS.add(url)
         return
 
 
+def probe_url(url):
+    """
+    Return a UrlProbe for ``url`` or None if the URL is not usable or not
+    reachable. Probes are cached, including for unreachable URLs.
+    """
+    if not is_usable_url(url):
+        return
+
+    probe = url_probe_cache.get(url)
+    if probe is not MISSING:
+        return probe
+
+    response = fetch_response(url=url)
+    if response:
+        probe = UrlProbe(url=response.url, urls=list(get_urls_from_text(response.text)))
+    else:
+        probe = None
+    url_probe_cache.set(url, probe)
+    return probe
+
+
 def convert_apache_svn_to_github_url(url):
     """
     Convert an SVN URL to a GitHub URL
@@ -143,6 +213,14 @@ def get_source_package_and_add_to_package_set(package):
     if not source_purl:
         return
 
+    create_source_package_and_add_to_package_set(source_purl=source_purl, package=package)
+
+
+def create_source_package_and_add_to_package_set(source_purl, package):
+    """
+    Add the source repo package of ``source_purl`` to the ``package`` package
+    set. Create and queue for scan the source repo package if it doesn't exist.
+    """
     try:
         download_url = get_download_url(str(source_purl))
         if not download_url:
@@ -166,7 +244,7 @@ def get_source_package_and_add_to_package_set(package):
         logger.info(f"Created source repo package {source_purl} for {package.purl}")
     package_set_uuids = [item["uuid"] for item in package.package_sets.all().values("uuid")]
     package_set_ids = set(package_set_uuids)
-    source_package_set_ids = set(source_package.package_sets.all().values_list("uuid"))
+    source_package_set_ids = set(source_package.package_sets.all().values_list("uuid", flat=True))
 
     # If the package exists and already in the set then there is nothing left to do
     if package_set_ids.intersection(source_package_set_ids):
@@ -178,13 +256,169 @@ def get_source_package_and_add_to_package_set(package):
     )
 
 
-def get_source_package_for_all_packages():
+def get_source_package_for_all_packages(max_workers=1, checkpoint_location=None):
     """
     Add the PackageURL of the source repository of a Package
     if found
+
+    All the versions of a package are processed together, and up to
+    ``max_workers`` packages are processed concurrently. The progress and the
+    packages that failed are saved in the ``checkpoint_location`` JSON file if
+    provided. The processing resumes from this file if it exists, retrying the
+    packages that failed first.
+    """
+    start_after, failed_package_names = load_source_repo_checkpoint(checkpoint_location)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if failed_package_names:
+            logger.info(f"Retrying {len(failed_package_names)} failed packages")
+            failed_package_names = process_package_names(executor, failed_package_names)
+            save_source_repo_checkpoint(checkpoint_location, start_after, failed_package_names)
+
+        if start_after:
+            logger.info(f"Resuming after package {'/'.join(start_after)}")
+        package_names = get_package_names(start_after=start_after)
+        for batch in batched(package_names, SOURCE_REPO_CHECKPOINT_BATCH_SIZE):
+            # Wait for the whole batch to be processed before saving the
+            # checkpoint, as the packages are not processed in order
+            failed_package_names.extend(process_package_names(executor, batch))
+            save_source_repo_checkpoint(checkpoint_location, batch[-1], failed_package_names)
+
+
+def process_package_names(executor, package_names):
+    """
+    Find the source repository of the packages of a ``package_names`` list of
+    (type, namespace, name) tuples with ``executor``. Return a list of the
+    tuples of the packages that failed.
+    """
+    processed = executor.map(get_source_packages_for_package_name, package_names)
+    return [
+        package_name
+        for package_name, is_processed in zip(package_names, processed)
+        if not is_processed
+    ]
+
+
+def get_packages_by_name_key():
+    """
+    Return a Package QuerySet annotated with a ``namespace_key`` that is the
+    Package namespace, or an empty string if the namespace is NULL, such that
+    the packages can be sorted and looked up by (type, namespace_key, name).
     """
-    for package in Package.objects.all().iterator():
-        get_source_package_and_add_to_package_set(package)
+    return Package.objects.annotate(namespace_key=Coalesce("namespace", Value("")))
+
+
+def get_package_names(start_after=None):
+    """
+    Yield the sorted and unique (type, namespace, name) tuples of all the
+    Packages, after the ``start_after`` tuple if provided. The namespace is
+    an empty string for the Packages with a NULL namespace.
+    """
+    packages = get_packages_by_name_key()
+    if start_after:
+        package_type, namespace, name = start_after
+        packages = packages.filter(
+            Q(type__gt=package_type)
+            | Q(type=package_type, namespace_key__gt=namespace)
+            | Q(type=package_type, namespace_key=namespace, name__gt=name)
+        )
+    package_names = (
+        packages.order_by("type", "namespace_key", "name")
+        .values_list("type", "namespace_key", "name")
+        .distinct()
+    )
+    yield from package_names.iterator()
+
+
+def get_source_packages_for_package_name(package_name):
+    """
+    Find the source repository of all the versions of the package with a
+    ``package_name`` (type, namespace, name) tuple as returned by
+    ``get_package_names``. Return True if processed or False on errors, which
+    are logged.
+    """
+    package_type, namespace, name = package_name
+    try:
+        packages = list(
+            get_packages_by_name_key().filter(type=package_type, namespace_key=namespace, name=name)
+        )
+        get_source_packages_for_package_versions(packages)
+        return True
+    except Exception:
+        logger.error(
+            f"Error finding the source repo of {package_type}/{namespace}/{name}", exc_info=True
+        )
+        return False
+    finally:
+        # Close the database connections opened in this thread
+        connections.close_all()
+
+
+def get_source_packages_for_package_versions(packages):
+    """
+    Add the source repo package of each Package of a ``packages`` list of
+    versions of the same package to its package set. The source repositories
+    are found once for all the versions.
+    """
+    if not packages:
+        return
+    source_purls = get_source_repo_purls(package=packages[0])
+    if not source_purls:
+        return
+    for package in packages:
+        source_purl = find_package_version_tag_and_commit(
+            version=package.version, source_purls=source_purls
+        )
+        if source_purl:
+            create_source_package_and_add_to_package_set(source_purl=source_purl, package=package)
+
+
+def load_source_repo_checkpoint(checkpoint_location):
+    """
+    Return a tuple of (the (type, namespace, name) tuple of the last processed
+    package or None, list of (type, namespace, name) tuples of the packages
+    that failed) saved in the ``checkpoint_location`` JSON file.
+    """
+    if not checkpoint_location or not os.path.exists(checkpoint_location):
+        return None, []
+    with open(checkpoint_location) as f:
+        checkpoint = json.load(f)
+    start_after = None
+    if "type" in checkpoint:
+        # A NULL namespace is sorted and looked up as an empty string
+        start_after = checkpoint["type"], checkpoint["namespace"] or "", checkpoint["name"]
+    failed_package_names = [tuple(package_name) for package_name in checkpoint.get("failed", [])]
+    return start_after, failed_package_names
+
+
+def save_source_repo_checkpoint(checkpoint_location, package_name, failed_package_names=()):
+    """
+    Save the (type, namespace, name) ``package_name`` of the last processed
+    package and the ``failed_package_names`` list of (type, namespace, name)
+    tuples of the packages that failed in the ``checkpoint_location`` JSON file.
+    """
+    if not checkpoint_location:
+        return
+    checkpoint = {"failed": [list(failed) for failed in failed_package_names]}
+    if package_name:
+        package_type, namespace, name = package_name
+        checkpoint.update({"type": package_type, "namespace": namespace, "name": name})
+    # Write to a temporary file first to not leave a truncated checkpoint
+    temp_location = f"{checkpoint_location}.tmp"
+    with open(temp_location, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_location, checkpoint_location)
+
+
+def get_source_repo_purls(package: Package) -> list[PackageURL]:
+    """
+    Return a list of the versionless PackageURLs of the source repositories of
+    a Package, possibly empty. These are found from the data of all the
+    versions of this Package.
+    """
+    # dedupe repo urls
+    repo_urls = set(get_repo_urls(package))
+    return list(set(convert_repo_urls_to_purls(repo_urls)))
 
 
 def get_source_repo(package: Package) -> PackageURL:
@@ -193,15 +427,9 @@ def get_source_repo(package: Package) -> PackageURL:
     or None if not found. Package is either a PackageCode Package object or
     Package instance object.
     """
-    repo_urls = list(get_repo_urls(package))
-    if not repo_urls:
-        return
-    # dedupe repo urls
-    repo_urls = list(set(repo_urls))
-    source_purls = list(convert_repo_urls_to_purls(repo_urls))
+    source_purls = get_source_repo_purls(package)
     if not source_purls:
         return
-    source_purls = list(set(source_purls))
     source_purl_with_tag = find_package_version_tag_and_commit(
         version=package.version, source_purls=source_purls
     )
@@ -336,13 +564,13 @@ def get_urls_from_package_data(package) -> Generator[str, None, None]:
         package.repository_download_url,
     ]
 
-    homepage_response = fetch_response(url=package.homepage_url)
-    homepage_text = homepage_response and homepage_response.text
-    found_urls.extend(get_urls_from_text(text=homepage_text))
+    homepage_probe = probe_url(url=package.homepage_url)
+    if homepage_probe:
+        found_urls.extend(homepage_probe.urls)
 
-    repository_homepage_response = fetch_response(url=package.repository_homepage_url)
-    repository_homepage_text = repository_homepage_response and repository_homepage_response.text
-    found_urls.extend(get_urls_from_text(text=repository_homepage_text))
+    repository_homepage_probe = probe_url(url=package.repository_homepage_url)
+    if repository_homepage_probe:
+        found_urls.extend(repository_homepage_probe.urls)
 
     found_urls.extend(get_urls_from_text(text=package.description))
 
@@ -369,13 +597,9 @@ def get_git_repo_urls(urls):
         else:
             if url and url.startswith("git+"):
                 _, _, url = url.partition("git+")
-            try:
-                resp = fetch_response(url=url)
-                url = resp and resp.url
-                if not url:
-                    continue
-            except Exception as e:
-                logger.error(f"Error getting {url}: {e}")
+            probe = probe_url(url=url)
+            url = probe and probe.url
+            if not url:
                 continue
             if any(url_hint in url for url_hint in url_hints):
                 yield url
@@ -384,17 +608,25 @@ def get_git_repo_urls(urls):
 def get_tags_and_commits(source_purl):
     """
     Yield tuples of (tag, commit), given a source_purl PackageURL
+
+    The tags and commits of a repository are cached by repository URL,
+    including when the repository is not reachable.
     """
     try:
         repo_url = purl2url(str(source_purl))
-        resp = fetch_response(url=repo_url)
-        url = resp and resp.url
-        if not url:
-            return
-        if not is_good_repo_url(repo_url):
+        if not repo_url:
             return
-        output = subprocess.getoutput(f"git ls-remote {repo_url}")
-        yield from get_tags_and_commits_from_git_output(output)
+
+        tags_and_commits = tags_and_commits_cache.get(repo_url)
+        if tags_and_commits is MISSING:
+            tags_and_commits = []
+            if probe_url(url=repo_url):
+                with get_host_semaphore(repo_url):
+                    output = subprocess.getoutput(f"git ls-remote {repo_url}")
+                tags_and_commits = list(get_tags_and_commits_from_git_output(output))
+            tags_and_commits_cache.set(repo_url, tags_and_commits)
+
+        yield from tags_and_commits
     except Exception as e:
         logger.error(f"Error getting tags and commits for {source_purl}: {e}")
 
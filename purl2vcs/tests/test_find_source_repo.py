@@ -9,23 +9,35 @@
 
 import json
 import os
+import shutil
+import tempfile
 from unittest import mock
 from unittest.mock import patch
 
+from django.core.cache import caches
 from django.test import TestCase
+from django.test import TransactionTestCase
 from packageurl import PackageURL
 
 from packagedb.models import Package, PackageContentType, Resource
+from purl2vcs.cache import LRUCache
+from purl2vcs.cache import MISSING
 from purl2vcs.find_source_repo import (
+    UrlProbe,
+    batched,
     convert_repo_urls_to_purls,
     fetch_response,
     get_repo_urls,
+    get_source_package_for_all_packages,
     get_source_repo,
     get_source_urls_from_package_data_and_resources,
     get_tag_and_commit,
     get_tags_and_commits,
     get_urls_from_package_data,
     get_urls_from_package_resources,
+    probe_url,
+    tags_and_commits_cache,
+    url_probe_cache,
 )
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -35,6 +47,9 @@ TAGS_COMMITS_FILE = os.path.join(BASE_DIR, "testfiles", "find_source_repo", "tag
 
 class TestFindSourceRepo(TestCase):
     def setUp(self):
+        caches["shared"].clear()
+        url_probe_cache.clear_memory()
+        tags_and_commits_cache.clear_memory()
         self.package_with_resources_and_package_data = Package.objects.create(
             type="maven",
             namespace="com.nimbusds",
@@ -259,7 +274,7 @@ class TestFindSourceRepo(TestCase):
         ]
 
     def test_get_tags_commits(self):
-        with patch("purl2vcs.find_source_repo.fetch_response"):
+        with patch("purl2vcs.find_source_repo.probe_url"):
             with patch("subprocess.getoutput") as mock_popen:
                 mock_popen.return_value = open(TEST_DATA).read()
                 with open(TAGS_COMMITS_FILE) as f:
@@ -281,8 +296,23 @@ class TestFindSourceRepo(TestCase):
                         tags_and_commits=tags_and_commits,
                     ) == ("9.35", "fdc8117af75b192e3f8afcc0119c904b02686af8")
 
+    def test_get_tags_commits_is_cached_by_repo_url(self):
+        source_purl = PackageURL(
+            type="bitbucket",
+            namespace="connect2id",
+            name="oauth-2.0-sdk-with-openid-connect-extensions",
+        )
+        with patch("purl2vcs.find_source_repo.probe_url"):
+            with patch("subprocess.getoutput") as mock_popen:
+                mock_popen.return_value = open(TEST_DATA).read()
+                first = list(get_tags_and_commits(source_purl=source_purl))
+                second = list(get_tags_and_commits(source_purl=source_purl))
+        assert first
+        assert first == second
+        assert mock_popen.call_count == 1
+
     def test_get_source_repo(self):
-        with patch("purl2vcs.find_source_repo.fetch_response"):
+        with patch("purl2vcs.find_source_repo.probe_url"):
             with patch("subprocess.getoutput") as mock_popen:
                 mock_popen.return_value = open(TEST_DATA).read()
                 assert get_source_repo(
@@ -303,6 +333,45 @@ class TestFindSourceRepo(TestCase):
         assert fetch_response("https://github.com/assets") is None
         assert fetch_response("https://github.com/abc.js") is None
 
+    @mock.patch("purl2vcs.find_source_repo.requests.get")
+    def test_probe_url_is_cached(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.url = "https://github.com/foo/bar"
+        mock_get.return_value.text = "see https://gitlab.com/foo/bar"
+        expected = UrlProbe(url="https://github.com/foo/bar", urls=["https://gitlab.com/foo/bar"])
+        assert probe_url("https://example.com/bar") == expected
+        url_probe_cache.clear_memory()
+        assert probe_url("https://example.com/bar") == expected
+        assert mock_get.call_count == 1
+
+    @mock.patch("purl2vcs.find_source_repo.requests.get")
+    def test_probe_url_caches_unreachable_urls(self, mock_get):
+        mock_get.return_value.status_code = 404
+        assert probe_url("https://example.com/missing") is None
+        assert probe_url("https://example.com/missing") is None
+        assert mock_get.call_count == 1
+
+    def test_lru_cache_evicts_least_recently_used_entries(self):
+        lru_cache = LRUCache(max_size=2)
+        lru_cache.set("a", 1, timeout=60)
+        lru_cache.set("b", 2, timeout=60)
+        assert lru_cache.get("a") == 1
+        lru_cache.set("c", 3, timeout=60)
+        assert lru_cache.get("b") is MISSING
+        assert lru_cache.get("a") == 1
+        assert lru_cache.get("c") == 3
+        assert len(lru_cache) == 2
+
+    def test_lru_cache_expires_entries(self):
+        lru_cache = LRUCache(max_size=2)
+        lru_cache.set("a", 1, timeout=0)
+        assert lru_cache.get("a") is MISSING
+        assert len(lru_cache) == 0
+
+    def test_batched(self):
+        assert list(batched(iter(range(5)), 2)) == [(0, 1), (2, 3), (4,)]
+        assert list(batched([], 2)) == []
+
     def test_from_purl_to_git(self):
         response = self.client.get(
             "/api/from_purl/purl2git",
@@ -311,3 +380,120 @@ class TestFindSourceRepo(TestCase):
         )
         expected = "pkg:bitbucket/connect2id/oauth-2.0-sdk-with-openid-connect-extensions@9.36?commit=e86fb3431972d302fcb615aca0baed4d8ab89791"
         self.assertEqual(expected, response.data["git_repo"])
+
+
+class TestGetSourcePackageForAllPackages(TransactionTestCase):
+    def setUp(self):
+        for name in ("bar", "baz"):
+            for version in ("1.0", "2.0"):
+                Package.objects.create(
+                    type="maven",
+                    namespace="foo",
+                    name=name,
+                    version=version,
+                    download_url=f"https://repo1.maven.org/maven2/foo/{name}/{version}/{name}-{version}.jar",
+                )
+
+    @mock.patch("purl2vcs.find_source_repo.create_source_package_and_add_to_package_set")
+    @mock.patch("purl2vcs.find_source_repo.get_tags_and_commits")
+    @mock.patch("purl2vcs.find_source_repo.get_source_repo_purls")
+    def test_get_source_package_for_all_packages(
+        self, mock_source_repo_purls, mock_tags_and_commits, mock_create_source_package
+    ):
+        mock_source_repo_purls.side_effect = lambda package: [
+            PackageURL(type="github", namespace="foo", name=package.name)
+        ]
+        mock_tags_and_commits.return_value = [("v1.0", "abc"), ("v2.0", "def")]
+        checkpoint_location = self.get_temp_file()
+
+        get_source_package_for_all_packages(max_workers=4, checkpoint_location=checkpoint_location)
+
+        # The source repos are found once for all the versions of a package
+        assert mock_source_repo_purls.call_count == 2
+        source_purls = sorted(
+            str(call.kwargs["source_purl"]) for call in mock_create_source_package.call_args_list
+        )
+        assert source_purls == [
+            "pkg:github/foo/bar@v1.0?commit=abc",
+            "pkg:github/foo/bar@v2.0?commit=def",
+            "pkg:github/foo/baz@v1.0?commit=abc",
+            "pkg:github/foo/baz@v2.0?commit=def",
+        ]
+        with open(checkpoint_location) as f:
+            assert json.load(f) == {
+                "type": "maven",
+                "namespace": "foo",
+                "name": "baz",
+                "failed": [],
+            }
+
+    @mock.patch("purl2vcs.find_source_repo.get_source_packages_for_package_versions")
+    def test_get_source_package_for_all_packages_resumes_from_checkpoint(
+        self, mock_source_packages
+    ):
+        checkpoint_location = self.get_temp_file()
+        with open(checkpoint_location, "w") as f:
+            json.dump({"type": "maven", "namespace": "foo", "name": "bar"}, f)
+
+        get_source_package_for_all_packages(checkpoint_location=checkpoint_location)
+
+        processed = [
+            {package.name for package in call.args[0]}
+            for call in mock_source_packages.call_args_list
+        ]
+        assert processed == [{"baz"}]
+
+    @mock.patch("purl2vcs.find_source_repo.get_source_packages_for_package_versions")
+    def test_get_source_package_for_all_packages_resumes_after_null_namespace(
+        self, mock_source_packages
+    ):
+        for name in ("qux", "quux"):
+            Package.objects.create(
+                type="maven",
+                name=name,
+                version="1.0",
+                download_url=f"https://example.com/{name}-1.0.jar",
+            )
+        checkpoint_location = self.get_temp_file()
+        with open(checkpoint_location, "w") as f:
+            json.dump({"type": "maven", "namespace": None, "name": "quux"}, f)
+
+        get_source_package_for_all_packages(checkpoint_location=checkpoint_location)
+
+        processed = [
+            {package.name for package in call.args[0]}
+            for call in mock_source_packages.call_args_list
+        ]
+        assert processed == [{"qux"}, {"bar"}, {"baz"}]
+
+    @mock.patch("purl2vcs.find_source_repo.get_source_packages_for_package_versions")
+    def test_get_source_package_for_all_packages_retries_failed_packages(
+        self, mock_source_packages
+    ):
+        def fail_on_bar(packages):
+            if packages[0].name == "bar":
+                raise Exception("error")
+
+        mock_source_packages.side_effect = fail_on_bar
+        checkpoint_location = self.get_temp_file()
+
+        get_source_package_for_all_packages(checkpoint_location=checkpoint_location)
+        with open(checkpoint_location) as f:
+            assert json.load(f)["failed"] == [["maven", "foo", "bar"]]
+
+        mock_source_packages.reset_mock()
+        mock_source_packages.side_effect = None
+        get_source_package_for_all_packages(checkpoint_location=checkpoint_location)
+
+        processed = [
+            {package.name for package in call.args[0]}
+            for call in mock_source_packages.call_args_list
+        ]
+        assert processed == [{"bar"}]
+        with open(checkpoint_location) as f:
+            assert json.load(f)["failed"] == []
+
+    def get_temp_file(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        return os.path.join(temp_dir, "checkpoint.json")
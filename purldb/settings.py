@@ -9,6 +9,7 @@
 
 import sys
 from pathlib import Path
+from urllib.parse import quote
 
 import environ
 
@@ -176,9 +177,78 @@ CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
         "LOCATION": "default",
-    }
+    },
+    # Cache shared between the web and the RQ worker processes, using the Redis
+    # server of the queues when PURLDB_ASYNC is enabled, local otherwise
+    "shared": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "shared",
+    },
+    # Database cache, its table is created with `./manage.py createcachetable`
+    "database": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "purldb_cache",
+    },
 }
 
+# PackageDB
+
+# Number of seconds the versions of a package fetched from its registry are
+# cached. 0 disables this cache.
+PACKAGEDB_VERSIONS_CACHE_TIMEOUT = env.int("PACKAGEDB_VERSIONS_CACHE_TIMEOUT", default=3600)
+
+# Name of the cache of the versions of packages. The "shared" cache is local to
+# each process unless PURLDB_ASYNC is enabled: use "database" to share this
+# cache between the web workers otherwise.
+PACKAGEDB_VERSIONS_CACHE = env.str("PACKAGEDB_VERSIONS_CACHE", default="shared")
+
+# Name of the cache of the URL probes and of the tags and commits of source
+# repositories used to find the source repo of packages. Use "database" to
+# persist this cache in the database.
+PACKAGEDB_SOURCE_REPO_CACHE = env.str("PACKAGEDB_SOURCE_REPO_CACHE", default="shared")
+
+# Number of seconds the URL probes and the tags and commits of a source
+# repository are cached. 0 disables this cache.
+PACKAGEDB_SOURCE_REPO_CACHE_TIMEOUT = env.int("PACKAGEDB_SOURCE_REPO_CACHE_TIMEOUT", default=86400)
+
+# Number of seconds unreachable URLs and source repositories without tags are
+# cached. 0 disables this negative cache.
+PACKAGEDB_SOURCE_REPO_NEGATIVE_CACHE_TIMEOUT = env.int(
+    "PACKAGEDB_SOURCE_REPO_NEGATIVE_CACHE_TIMEOUT", default=3600
+)
+
+# MatchCode
+
+# Load the approximate matching fingerprints in an in-memory index for matching.
+# This requires NumPy, installed with the "resident_index" extra. The index is
+# loaded when a web worker starts and each process refreshes its own index.
+MATCHCODE_RESIDENT_INDEX = env.bool("MATCHCODE_RESIDENT_INDEX", default=False)
+
+# Number of seconds between reloads of new fingerprints in the in-memory index
+MATCHCODE_RESIDENT_INDEX_REFRESH_INTERVAL = env.int(
+    "MATCHCODE_RESIDENT_INDEX_REFRESH_INTERVAL", default=60
+)
+
+# Number of seconds between full reloads of the in-memory index, which also drop
+# the fingerprints deleted from the database
+MATCHCODE_RESIDENT_INDEX_RELOAD_INTERVAL = env.int(
+    "MATCHCODE_RESIDENT_INDEX_RELOAD_INTERVAL", default=3600
+)
+
+# MineCode
+
+# Number of seconds after which a queue row leased by a worker that was not
+# released, such as after a worker crash, can be leased again. 0 means never.
+# Workers renew the leases of their rows waiting to be processed, and parked
+# rows, such as rows without a route or with a running scan, never expire.
+MINECODE_LEASE_EXPIRY = env.int("MINECODE_LEASE_EXPIRY", default=0)
+
+# Number of seconds after which a submitted or in progress scan is timed out
+MINECODE_SCAN_TIMEOUT = env.int("MINECODE_SCAN_TIMEOUT", default=7200)
+
+# Number of seconds to wait between two sweeps of the timed out scans
+MINECODE_SCAN_SWEEP_INTERVAL = env.int("MINECODE_SCAN_SWEEP_INTERVAL", default=60)
+
 # Logging
 
 LOGGING = {
@@ -323,6 +393,17 @@ PURLDB_ASYNC = env.bool("PURLDB_ASYNC", default=False)
 if not PURLDB_ASYNC:
     for queue_config in RQ_QUEUES.values():
         queue_config["ASYNC"] = False
+else:
+    # Share the "shared" cache between the web and the RQ worker processes, and
+    # across restarts, using the Redis server of the queues.
+    redis_queue_config = RQ_QUEUES["default"]
+    CACHES["shared"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": (
+            f"redis://:{quote(redis_queue_config['PASSWORD'], safe='')}@"
+            f"{redis_queue_config['HOST']}:{redis_queue_config['PORT']}"
+        ),
+    }
 
 # FederatedCode integration
 
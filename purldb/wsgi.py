@@ -11,6 +11,8 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from matchcode.bah128_index import load_resident_indexes
+
 """
 WSGI config for purldb.
 
@@ -21,3 +23,6 @@ It exposes the WSGI callable as a module-level variable named ``application``.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "purldb.settings")
 
 application = get_wsgi_application()
+
+# Load the resident matching indexes when a worker process starts, if enabled
+load_resident_indexes()